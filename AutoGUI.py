@@ -10,16 +10,20 @@ from smart_position import find_position
 class PyAutoGUIActionExecutor:
     """精简版GUI动作执行器（使用您现有的坐标换算方法）"""
     
-    def __init__(self, safety_check=True, pause_between_actions=0.5):
+    def __init__(self, safety_check=True, pause_between_actions=0.1, move_duration=0.1, settle_detector=None):
         """
         初始化动作执行器
         
         Args:
             safety_check: 是否启用安全检测
             pause_between_actions: 动作间暂停时间（秒）
+            move_duration: 鼠标移动到目标位置的时长（秒）
+            settle_detector: 界面稳定检测器，wait() 时等待界面稳定而不是固定休眠
         """
         self.safety_check = safety_check
         self.pause_between_actions = pause_between_actions
+        self.move_duration = move_duration
+        self.settle_detector = settle_detector
         
         # 设置pyautogui参数
         pyautogui.FAILSAFE = safety_check
@@ -68,7 +72,7 @@ class PyAutoGUIActionExecutor:
     def execute_left_double(self, x: int, y: int) -> Dict[str, Any]:
         """执行左键双击操作"""
         try:
-            pyautogui.moveTo(x, y, duration=0.3)
+            pyautogui.moveTo(x, y, duration=self.move_duration)
             pyautogui.doubleClick()
             self.logger.info(f"✅ 左键双击完成: ({x}, {y})")
             return {"status": "success", "action": "left_double", "coordinates": (x, y)}
@@ -79,7 +83,7 @@ class PyAutoGUIActionExecutor:
     def execute_right_single(self, x: int, y: int) -> Dict[str, Any]:
         """执行右键单击操作"""
         try:
-            pyautogui.moveTo(x, y, duration=0.3)
+            pyautogui.moveTo(x, y, duration=self.move_duration)
             pyautogui.rightClick()
             self.logger.info(f"✅ 右键单击完成: ({x}, {y})")
             return {"status": "success", "action": "right_single", "coordinates": (x, y)}
@@ -90,7 +94,7 @@ class PyAutoGUIActionExecutor:
     def execute_drag(self, start_x: int, start_y: int, end_x: int, end_y: int) -> Dict[str, Any]:
         """执行拖拽操作"""
         try:
-            pyautogui.moveTo(start_x, start_y, duration=0.3)
+            pyautogui.moveTo(start_x, start_y, duration=self.move_duration)
             pyautogui.mouseDown()
             time.sleep(0.1)
             pyautogui.moveTo(end_x, end_y, duration=0.5)
@@ -140,7 +144,7 @@ class PyAutoGUIActionExecutor:
     def execute_scroll(self, x: int, y: int, direction: str) -> Dict[str, Any]:
         """执行滚动操作"""
         try:
-            pyautogui.moveTo(x, y, duration=0.3)
+            pyautogui.moveTo(x, y, duration=self.move_duration)
             direction = direction.lower()
             scroll_amount = 100
             
@@ -162,11 +166,13 @@ class PyAutoGUIActionExecutor:
             return {"status": "error", "action": "scroll", "error": str(e)}
     
     def execute_wait(self, duration: float = 5.0) -> Dict[str, Any]:
-        """执行等待操作"""
+        """执行等待操作，至少等待duration秒；配置了界面稳定检测器时之后继续等待界面稳定"""
         try:
             self.logger.info(f"⏳ 等待 {duration} 秒...")
             time.sleep(duration)
-            self.logger.info("✅ 等待完成")
+            if self.settle_detector is not None:
+                duration += self.settle_detector.wait(floor=0.0, capture_final=False)
+            self.logger.info(f"✅ 等待完成 ({duration:.2f} 秒)")
             return {"status": "success", "action": "wait", "duration": duration}
         except Exception as e:
             self.logger.error(f"❌ 等待失败: {e}")
@@ -1,10 +1,11 @@
 import os
+import asyncio
 import base64
 import re
 import time
 from PIL import Image, ImageDraw
 import pyautogui
-from volcenginesdkarkruntime import Ark
+from volcenginesdkarkruntime import Ark, AsyncArk
 from prompt import COMPUTER_USE_DOUBAO1
 import matplotlib.pyplot as plt
 from AutoGUI import PyAutoGUIActionExecutor
@@ -12,47 +13,123 @@ from ParseActionString import parse_action_string
 import json
 import io
 from smart_position import find_position
+from screen_capture import ScreenCapturePipeline
+from image_encoding import get_image_encoder
+from screen_change import FrameChangeDetector, SettleDetector
+from stream_parser import StreamingInference, StreamingActionScanner
+from inference_cache import InferenceResponseCache
+from conversation_history import ConversationHistoryManager
 
 class DoubaoUITarsGUI:
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, resample_filter="lanczos", image_format="png", image_quality=None,
+                 change_policy="reuse", streaming=False, cache_mode="bypass",
+                 cache_path="cache/inference_cache.db", history_token_budget=8000):
         """
         初始化Doubao UI-TARS GUI操作工具 
         
         Args:
             api_key: 火山引擎API Key，如果为None则从环境变量ARK_API_KEY读取
+            resample_filter: 截图缩放滤波器（nearest/box/bilinear/hamming/bicubic/lanczos）
+            image_format: 发送给模型的截图编码（png/jpeg/webp/palette_png）
+            image_quality: 截图编码质量，为None时使用编码器默认值
+            change_policy: 屏幕未变化时的策略（repoll/backoff/reuse），为None时不做变化检测
+            streaming: 是否使用流式推理，action字段一结束就开始执行
+            cache_mode: 推理响应缓存模式（read_write/read_only/bypass）
+            cache_path: 推理响应缓存文件路径
+            history_token_budget: 对话历史的提示token预算
         """
         self.api_key = api_key or os.getenv('ARK_API_KEY')
         if not self.api_key:
             raise ValueError("请提供API Key或设置ARK_API_KEY环境变量")
             
         self.client = Ark(api_key=self.api_key)
+        self._async_client = None
+        self._async_client_loop = None
+        self._async_runs = 0
         self.model_name = "doubao-1-5-ui-tars-250428"
-        self.action_executor = PyAutoGUIActionExecutor()
+        self.settle_detector = SettleDetector()
+        self.action_executor = PyAutoGUIActionExecutor(settle_detector=self.settle_detector)
         self.max_steps = 25
+        self.capture_pipeline = ScreenCapturePipeline(
+            resample=resample_filter,
+            encoder=get_image_encoder(image_format, image_quality)
+        )
+        self.last_frame = None
+        self.change_detector = FrameChangeDetector(policy=change_policy) if change_policy else None
+        self.streaming = streaming
+        self.response_cache = InferenceResponseCache(cache_path, mode=cache_mode) if cache_mode != "bypass" else None
+        self.history_manager = ConversationHistoryManager(token_budget=history_token_budget)
     
-    def capture_screenshot(self, save_path=None):
+    def capture_screenshot(self, save_path=None, image=None):
         """
         捕获屏幕截图
         
         Args:
             save_path: 截图保存路径，如果为None则使用临时文件
+            image: 预先截取的屏幕图像，为None时重新截屏
             
         Returns:
-            str: 截图文件路径
+            str: 截图的base64编码，实际保存路径见 self.last_frame.path
         """
         if save_path is None:
             save_path = f"screenshot/screenshot_{int(time.time())}.png"
         
-        screenshot = pyautogui.screenshot()
-        new_size = (960,540)
-        screenshot = screenshot.resize(new_size,Image.Resampling.LANCZOS)
-        screenshot.save(save_path)
-        self.screenshot_size = screenshot.size
-        buffered = io.BytesIO()
-        screenshot.save(buffered, format="PNG")
-        img_base64 = base64.b64encode(buffered.getvalue()).decode()
-        return img_base64
+        # 只编码一次，写盘在后台线程完成
+        frame = self.capture_pipeline.capture(save_path, image)
+        self.last_frame = frame
+        self.screenshot_size = frame.size
+        print(f"📸 截图耗时: {frame.format_timings()}")
+        return frame.base64
+
+    def poll_for_screen_change(self, image_base64, save_path=None, last_action_type=None):
+        """
+        屏幕自上一步以来未变化时按策略处理，避免把相同的截图再次发给模型
+        
+        Args:
+            image_base64: 刚采集的截图base64
+            save_path: 重新截图时使用的保存路径
+            last_action_type: 上一步执行的操作类型
+            
+        Returns:
+            Tuple[str, bool]: (最新截图base64, 是否复用上一步决策)
+        """
+        detector = self.change_detector
+        if detector is None or last_action_type is None:
+            if detector is not None:
+                detector.record(self.last_frame.image)
+            return image_base64, False
+        if not detector.is_unchanged(self.last_frame.image):
+            detector.record(self.last_frame.image)
+            return image_base64, False
+        
+        if detector.should_reuse(last_action_type):
+            print("🔁 屏幕未变化，复用上一步决策，跳过模型调用")
+            return image_base64, True
+        
+        for attempt in range(detector.max_repolls if detector.repolls else 0):
+            delay = detector.poll_delay(attempt)
+            print(f"⏸️ 屏幕未变化，{delay:.1f} 秒后重新截图")
+            time.sleep(delay)
+            image_base64 = self.capture_screenshot(save_path)
+            if not detector.is_unchanged(self.last_frame.image):
+                break
+        detector.record(self.last_frame.image)
+        return image_base64, False
     
+    def image_message(self, image_base64):
+        """构建包含截图的用户消息，data URL类型与当前编码器一致"""
+        return {
+            "role": "user",
+            "content": [
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": self.capture_pipeline.encoder.data_url(image_base64)
+                    }
+                }
+            ]
+        }
+
     def construct_messages(self, instruction, image_base64, language="Chinese"):
         system_prompt = COMPUTER_USE_DOUBAO1.format(instruction=instruction, language=language)
 
@@ -61,21 +138,30 @@ class DoubaoUITarsGUI:
                         "role": "user",
                         "content": system_prompt
                     },
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/png;base64,{image_base64}"
-                                }
-                            }
-                        ]
-                    }
+                    self.image_message(image_base64)
                 ]
         return message
     
+    def _cache_lookup(self, messages):
+        """查询推理响应缓存，返回 (缓存键, 缓存的响应)"""
+        if self.response_cache is None:
+            return None, None
+        cache_key = self.response_cache.make_key(self.model_name, messages)
+        cached = self.response_cache.get(cache_key)
+        if cached is not None:
+            print("💾 命中推理缓存，跳过模型调用")
+            return cache_key, cached[0]
+        return cache_key, None
+
+    def _cache_store(self, cache_key, response, token):
+        """只缓存成功解析的响应"""
+        if self.response_cache is not None and isinstance(response, dict):
+            self.response_cache.put(cache_key, self.model_name, response, token)
+
     def inference(self, messages):
+        cache_key, cached = self._cache_lookup(messages)
+        if cached is not None:
+            return cached, 0
         response = self.client.chat.completions.create(
             # 按需替换 model id
             model=self.model_name,
@@ -86,6 +172,163 @@ class DoubaoUITarsGUI:
         token = response.usage.total_tokens
         response = response.choices[0].message.content
         # print(response)
+        response = self.parse_model_output(response)
+        self._cache_store(cache_key, response, token)
+        return response,token
+
+    def start_streaming_inference(self, messages):
+        """
+        发起流式推理，在后台线程接收响应
+        
+        Returns:
+            StreamingInference: 可通过 wait_action() 提前获取action，result() 获取完整响应
+        """
+        chunks = self.client.chat.completions.create(
+            model=self.model_name,
+            messages=messages,
+            temperature=0.0,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        return StreamingInference(chunks, self.parse_model_output)
+
+    def inference_with_early_action(self, messages, on_action):
+        """
+        流式推理，action字段一结束就调用on_action，同时后台继续接收其余内容
+        
+        Args:
+            messages: 消息列表
+            on_action: 接收action字符串的回调，返回值作为提前执行的结果
+            
+        Returns:
+            Tuple[AI响应, token数, 提前执行的结果]
+        """
+        cache_key, cached = self._cache_lookup(messages)
+        if cached is not None:
+            return cached, 0, None
+        stream = self.start_streaming_inference(messages)
+        action = stream.wait_action()
+        early_result = None
+        if action:
+            print(f"⚡ 提前获取到操作: {action}")
+            early_result = on_action(action)
+        try:
+            response, token = stream.result()
+        except Exception as e:
+            if not early_result:
+                raise
+            print(f"⚠️ 流式响应中断，记录已提前执行的操作: {e}")
+            return self._early_action_response(action), stream.total_tokens, early_result
+        if early_result and not isinstance(response, dict):
+            return self._early_action_response(action), token, early_result
+        self._cache_store(cache_key, response, token)
+        return response, token, early_result
+
+    @staticmethod
+    def _early_action_response(action):
+        """完整响应中断或解析失败时，为已提前执行的操作构造响应，使其照常写入历史（不缓存）"""
+        return {"thought": "", "action": action, "action_usefulness": {}}
+
+    def execute_action_early(self, action):
+        """在完整响应到达前执行操作，返回 (action_info, 执行结果)"""
+        action_info = parse_action_string(action)
+        if not action_info:
+            return None
+        message = self.action_executor.execute_parsed_action(action_info)
+        return action_info, message
+
+    @property
+    def async_client(self):
+        """当前事件循环使用的异步客户端，每个事件循环各自创建"""
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_client_loop is not loop:
+            self._async_client = AsyncArk(api_key=self.api_key)
+            self._async_client_loop = loop
+        return self._async_client
+
+    async def inference_async(self, messages):
+        """异步推理，返回 (AI响应, token数)"""
+        cache_key, cached = self._cache_lookup(messages)
+        if cached is not None:
+            return cached, 0
+        response = await self.async_client.chat.completions.create(
+            model=self.model_name,
+            messages=messages,
+            temperature=0.0,
+            stream=False
+        )
+        token = response.usage.total_tokens
+        response = self.parse_model_output(response.choices[0].message.content)
+        self._cache_store(cache_key, response, token)
+        return response, token
+
+    async def inference_with_early_action_async(self, messages, on_action):
+        """
+        异步流式推理，action字段一结束就在线程池中执行on_action，同时继续接收其余内容
+        
+        Returns:
+            Tuple[AI响应, token数, 提前执行的结果]
+        """
+        cache_key, cached = self._cache_lookup(messages)
+        if cached is not None:
+            return cached, 0, None
+        loop = asyncio.get_running_loop()
+        stream = await self.async_client.chat.completions.create(
+            model=self.model_name,
+            messages=messages,
+            temperature=0.0,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        scanner = StreamingActionScanner()
+        parts = []
+        token = 0
+        action_future = None
+        stream_error = None
+        try:
+            async for chunk in stream:
+                if getattr(chunk, "usage", None) is not None:
+                    token = chunk.usage.total_tokens
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content or ""
+                parts.append(delta)
+                action = scanner.feed(delta)
+                if action is not None:
+                    print(f"⚡ 提前获取到操作: {action}")
+                    action_future = loop.run_in_executor(None, on_action, action)
+        except Exception as e:
+            stream_error = e
+        finally:
+            # 操作一旦开始执行，无论流是否中断都要等它完成
+            early_result = await action_future if action_future is not None else None
+        if stream_error is not None:
+            if not early_result:
+                raise stream_error
+            print(f"⚠️ 流式响应中断，记录已提前执行的操作: {stream_error}")
+            return self._early_action_response(scanner.value), token, early_result
+        response = self.parse_model_output("".join(parts))
+        if early_result and not isinstance(response, dict):
+            return self._early_action_response(scanner.value), token, early_result
+        self._cache_store(cache_key, response, token)
+        return response, token, early_result
+
+    async def settle_and_prefetch(self, ceiling):
+        """
+        等待界面稳定，同时确保上一步的截图已写盘
+        
+        Returns:
+            界面稳定时的最后一帧，作为下一步的截图使用
+        """
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
+            loop.run_in_executor(None, self.settle_detector.wait, None, ceiling),
+            loop.run_in_executor(None, self.capture_pipeline.flush)
+        )
+        return self.settle_detector.last_image
+
+    def parse_model_output(self, response):
+        """从模型输出中提取并解析JSON，解析失败时返回原始文本"""
         if "```json" in response:
             response = response.split("```json")[1].split("```")[0]
         elif "```" in response:
@@ -99,83 +342,153 @@ class DoubaoUITarsGUI:
         except Exception as e:
             print("json解析失败",e)
             print(response)
-        return response,token
+        return response
     def clean_json_response(self,response_text):
-        """移除JSON中的注释，使其可解析"""
+        """移除JSON中的注释（// 和提示词输出格式中使用的 #），使其可解析"""
         # 移除单行注释
         lines = response_text.split('\n')
         cleaned_lines = []
         for line in lines:
-            # 查找注释开始位置
-            comment_pos = line.find('//')
+            # 查找字符串外的注释开始位置
+            comment_pos = self._comment_start(line)
             if comment_pos != -1:
-                # 检查注释是否在字符串内
-                before_comment = line[:comment_pos]
-                quote_count = before_comment.count('"')
-                if quote_count % 2 == 0:  # 偶数个引号，说明注释不在字符串内
-                    line = before_comment.rstrip(',').rstrip()
+                line = line[:comment_pos].rstrip(',').rstrip()
             cleaned_lines.append(line)
         
         return '\n'.join(cleaned_lines)
 
+    @staticmethod
+    def _comment_start(line):
+        """返回行内字符串外第一个 // 或 # 的位置，没有时返回-1"""
+        in_string = escape = False
+        for i, ch in enumerate(line):
+            if in_string:
+                if escape:
+                    escape = False
+                elif ch == '\\':
+                    escape = True
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"':
+                in_string = True
+            elif ch == '#' or line.startswith('//', i):
+                return i
+        return -1
+
+    @staticmethod
+    def _run_sync(async_entry, *args):
+        """
+        在新的事件循环中运行异步入口，供同步调用方使用
+
+        Raises:
+            RuntimeError: 当前线程已有运行中的事件循环（此时应直接 await 异步入口）
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(async_entry(*args))
+        raise RuntimeError(
+            f"当前线程已有运行中的事件循环，无法使用同步接口，请改为 await {async_entry.__name__}(...)"
+        )
+
+    async def _release_async_client(self):
+        """最外层的异步执行结束时关闭异步客户端，避免每次 asyncio.run 遗留HTTP连接"""
+        self._async_runs -= 1
+        if self._async_runs == 0 and self._async_client is not None:
+            client = self._async_client
+            self._async_client = None
+            self._async_client_loop = None
+            await client.close()
+
     def run_autonomous_goal(self, goal):
-        """自主执行总目标"""
+        """
+        自主执行总目标（同步接口，内部运行异步步骤循环）
+
+        已在事件循环中运行的调用方请使用 await run_autonomous_goal_async(goal)
+        """
+        return self._run_sync(self.run_autonomous_goal_async, goal)
+
+    async def run_autonomous_goal_async(self, goal):
+        """自主执行总目标（异步入口），结束时关闭本次使用的异步客户端"""
+        self._async_runs += 1
+        try:
+            return await self._run_autonomous_goal_steps(goal)
+        finally:
+            await self._release_async_client()
+
+    async def _run_autonomous_goal_steps(self, goal):
+        """自主执行总目标的步骤循环"""
         print(f"🎯 开始执行总目标: {goal}")
         print(f"📊 最大尝试步骤: {self.max_steps}")
+        loop = asyncio.get_running_loop()
         self.current_step = 0
         action_message = None
+        ai_response = None
+        last_action_type = None
+        prefetched_image = None
         self.total_token = 0
+        if self.change_detector:
+            self.change_detector.reset()
         while self.current_step < self.max_steps:
             self.current_step += 1
             print(f"🔄 执行步骤 {self.current_step}/{self.max_steps}")
             try:
-                # 截图
-                image = self.capture_screenshot()
+                # 截图（优先使用等待界面稳定时已截取的帧）
+                image = await loop.run_in_executor(None, self.capture_screenshot, None, prefetched_image)
+                prefetched_image = None
+                image, reuse_previous = await loop.run_in_executor(
+                    None, self.poll_for_screen_change, image, None, last_action_type
+                )
             except Exception as e:
                 print("截图失败",e)
                 continue
             # AI分析并规划下一步
+            early_result = None
             try:
-                if not action_message:
-                    action_message = self.construct_messages(instruction=goal, image_base64=image)
-                else:
-                    if len(action_message)>5:
-                        action_message = [action_message[0]] + action_message[-4:]
+                if not reuse_previous:
+                    if not action_message:
+                        action_message = self.construct_messages(instruction=goal, image_base64=image)
+                    else:
+                        action_message.append(self.image_message(image))
+                    # 按token预算裁剪历史：只保留最近的截图
+                    action_message = self.history_manager.fit(action_message)
+                    if self.streaming:
+                        ai_response, token, early_result = await self.inference_with_early_action_async(
+                            action_message, self.execute_action_early
+                        )
+                    else:
+                        ai_response,token = await self.inference_async(action_message)
+                    self.total_token += token
+                    print(f"AI思考: {ai_response.get('thought', '无')}")
+                    print(f"AI建议: {ai_response.get('action', '无')}")
+                    print(f"AI使用token数: {token}")
                     action_message.append({
-                        "role": "user",
-                            "content": [
-                                {
-                                    "type": "image_url",
-                                    "image_url": {
-                                        "url": f"data:image/png;base64,{image}"
-                                    }
-                                }
-                            ]
+                        "role": "assistant",
+                        "content": ai_response.get("thought")
                     })
-                ai_response,token = self.inference(messages=action_message)
-                action_message = action_message[:-1]
-                self.total_token += token
-                print(f"AI思考: {ai_response.get('thought', '无')}")
-                print(f"AI建议: {ai_response.get('action', '无')}")
-                print(f"AI使用token数: {token}")
-                action_message.append({
-                    "role": "assistant",
-                    "content": ai_response.get("thought")
-                })
-                if not ai_response:
-                    print("AI分析失败")
-                    continue
+                    if not ai_response:
+                        print("AI分析失败")
+                        continue
             except Exception as e:
                 print("AI分析失败",e)
                 continue
 
             # 执行AI建议
             try:
-                action_info = parse_action_string(ai_response.get("action"))
+                if early_result:
+                    action_info, message = early_result
+                else:
+                    action_info = parse_action_string(ai_response.get("action"))
+                    message = None
+                    if action_info:
+                        message = await loop.run_in_executor(
+                            None, self.action_executor.execute_parsed_action, action_info
+                        )
                 if action_info:
-                    message = self.action_executor.execute_parsed_action(action_info)
+                    last_action_type = action_info.get("action_type")
                     print("执行成功", message)
-                    time.sleep(1)
+                    # 等待界面稳定，最长1秒
+                    prefetched_image = await self.settle_and_prefetch(ceiling=1.0)
                     if action_info.get("action_type") == "finished":
                         # print("AI判断目标已完成！")
                         return ai_response, True, self.total_token
@@ -3,10 +3,13 @@ from tkinter import ttk, filedialog, messagebox
 import pandas as pd
 import os
 import json
+import shlex
 import time
 from rag_enhanced_agent import RAGEnhancedGUIAgent
 import threading
 from markdown_rag import MarkdownKnowledgeRetriever, OpenAIMarkdownVectorDB
+from parallel_runner import ParallelTestRunner
+from ingest_pipeline import IngestPipeline
 
 class TestCaseManager:
     def __init__(self, root):
@@ -43,7 +46,9 @@ class TestCaseManager:
         # API Key 配置文件
         self.config_file = "app_config.json"
         self.config = {
-            "api_key": ""
+            "api_key": "",
+            "parallel_workers": 1,  # 大于1时在多个虚拟显示上并行执行全部用例
+            "parallel_startup_command": ""  # 并行执行时在每个虚拟显示中启动被测应用的命令
         }
         
         # 测试执行记录
@@ -737,6 +742,10 @@ class TestCaseManager:
                 self._execute_single_case(case_data, item)
     
     def _execute_all_cases_thread(self):
+        workers = int(self.config.get('parallel_workers', 1))
+        if workers > 1:
+            self._execute_all_cases_parallel(workers)
+            return
         for item in self.tree.get_children():
             case_values = self.tree.item(item)['values']
             case_id = case_values[0]
@@ -750,6 +759,53 @@ class TestCaseManager:
             if case_data:
                 self._execute_single_case(case_data, item)
 
+    def _execute_all_cases_parallel(self, workers):
+        """在多个虚拟显示上并行执行全部测试用例"""
+        case_items = {}
+        cases = []
+        for item in self.tree.get_children():
+            case_id = self.tree.item(item)['values'][0]
+            for case in self.test_cases:
+                if int(case['编号']) == case_id:
+                    case_items[case_id] = (item, case)
+                    cases.append((case_id, self.convert_test_case(case)))
+                    break
+        
+        def on_result(result):
+            tree_item, case_data = case_items[result['case_id']]
+            self.root.after(0, self._update_case_result, tree_item, result['success'], result['total_token'])
+            self.record_execution(result['success'])
+            status = "执行成功！" if result['success'] else "执行失败"
+            self.log_info(f"[显示 {result['display']}] 测试用例 {case_data['编号']} {status}")
+            if result.get('error'):
+                self.log_info(f"错误: {result['error']}")
+            self.log_info(f"Token使用数: {result['total_token']}, 耗时: {result['duration']:.1f} 秒")
+            self.log_info("-" * 50)
+        
+        # 虚拟显示启动时是空的，必须配置被测应用的启动命令
+        startup_command = self.config.get('parallel_startup_command')
+        if isinstance(startup_command, str):
+            startup_command = shlex.split(startup_command)
+        if not startup_command:
+            self.log_info("❌ 未配置 parallel_startup_command（被测应用的启动命令），无法并行执行；"
+                          "请在 app_config.json 中配置，或将 parallel_workers 设为1")
+            return
+        
+        self.log_info(f"🚀 使用 {workers} 个虚拟显示并行执行 {len(cases)} 个测试用例")
+        knowledge_dir = self.agent.knowledge_base.knowledge_dir if self.agent else "knowledge_base"
+        runner = ParallelTestRunner(api_key=self.api_key, workers=workers, knowledge_dir=knowledge_dir,
+                                    startup_command=startup_command)
+        # 工作进程以磁盘上的知识库为初始内容，合并时也读写磁盘，先写入延迟保存的修改
+        if self.agent:
+            self.agent.knowledge_base.save_knowledge()
+        try:
+            runner.run(cases, on_result=on_result)
+        except Exception as e:
+            self.log_info(f"❌ 并行执行失败: {e}")
+        # 工作进程的新经验已合并到共享知识库，重新加载（尚未写盘的修改会先写盘）
+        if self.agent:
+            self.agent.knowledge_base.load_knowledge()
+    
     def convert_test_case(self,original):
         # 键名映射关系
         key_mapping = {
@@ -960,7 +1016,7 @@ class TestCaseManager:
         # 创建进度对话框
         progress_dialog = tk.Toplevel(self.root)
         progress_dialog.title("上传进度")
-        progress_dialog.geometry("400x150")
+        progress_dialog.geometry("400x190")
         progress_dialog.resizable(False, False)
         
         # 设置为模态对话框
@@ -978,44 +1034,41 @@ class TestCaseManager:
         status_label = ttk.Label(progress_dialog, textvariable=status_var)
         status_label.pack(pady=10)
         
+        # 取消按钮：正在处理的文件处理完毕，其余文件不再上传
+        cancel_requested = threading.Event()
+        ttk.Button(progress_dialog, text="取消", command=cancel_requested.set).pack(pady=5)
+        
         # 在新线程中执行上传
         def upload_thread():
             try:
                 total_files = len(md_files)
-                successful_files = 0
                 
-                for i, md_file in enumerate(md_files):
-                    # 更新状态
-                    status_var.set(f"正在上传: {os.path.basename(md_file)} ({i+1}/{total_files})")
-                    progress_var.set((i / total_files) * 100)
-                    progress_dialog.update()
-                    
-                    try:
-                        # 使用代理的Markdown知识库处理
-                        if hasattr(self.agent, 'md_knowledge_base') and self.agent.md_knowledge_base:
-                            # 直接使用add_markdown_file方法
-                            result = self.agent.md_knowledge_base.add_markdown_file(md_file)
-                            if result['success']:
-                                successful_files += 1
-                                self.log_info(f"上传文件 {os.path.basename(md_file)} 成功: 处理了 {result['chunks_processed']} 个内容块")
-                            else:
-                                self.log_info(f"上传文件 {os.path.basename(md_file)} 失败: {result.get('error', '未知错误')}")
-                        else:
-                            # 如果没有现有知识库，创建一个新的
-                            temp_db = OpenAIMarkdownVectorDB()
-                            result = temp_db.add_markdown_file(md_file)
-                            if result['success']:
-                                successful_files += 1
-                                self.log_info(f"上传文件 {os.path.basename(md_file)} 成功: 处理了 {result['chunks_processed']} 个内容块")
-                            else:
-                                self.log_info(f"上传文件 {os.path.basename(md_file)} 失败: {result.get('error', '未知错误')}")
-                        
-                    except Exception as e:
-                        self.log_info(f"上传文件 {os.path.basename(md_file)} 失败: {e}")
+                # 使用代理的Markdown知识库处理，没有现有知识库时创建一个新的
+                if hasattr(self.agent, 'md_knowledge_base') and self.agent.md_knowledge_base:
+                    vector_db = self.agent.md_knowledge_base
+                else:
+                    vector_db = OpenAIMarkdownVectorDB()
+                status_var.set(f"正在上传 {total_files} 个文件...")
+                
+                def on_progress(done, total, md_file, result):
+                    if result['success']:
+                        self.log_info(f"上传文件 {os.path.basename(md_file)} 成功: 处理了 {result['chunks_processed']} 个内容块")
+                    elif not result.get('cancelled'):
+                        self.log_info(f"上传文件 {os.path.basename(md_file)} 失败: {result.get('error', '未知错误')}")
+                    status_var.set(f"已完成: {os.path.basename(md_file)} ({done}/{total})")
+                    progress_var.set(done / total * 100)
+                    return not cancel_requested.is_set()
+                
+                # 多个文件并发读取和嵌入，按批写入向量数据库
+                results = IngestPipeline(vector_db, workers=4).run(list(md_files), on_progress)
+                successful_files = sum(1 for result in results if result['success'])
                 
                 # 完成上传
                 progress_var.set(100)
-                status_var.set(f"上传完成! 成功: {successful_files}/{total_files}")
+                if cancel_requested.is_set():
+                    status_var.set(f"上传已取消! 成功: {successful_files}/{total_files}")
+                else:
+                    status_var.set(f"上传完成! 成功: {successful_files}/{total_files}")
                 
                 # 更新日志
                 self.log_info(f"📚 MD文件上传完成: 成功上传 {successful_files} 个文件，共 {total_files} 个文件")
@@ -1240,6 +1293,8 @@ def main():
     def on_closing():
         app.save_execution_history()
         app.save_config()
+        if app.agent:
+            app.agent.knowledge_base.save_knowledge()
         root.destroy()
     
     root.protocol("WM_DELETE_WINDOW", on_closing)
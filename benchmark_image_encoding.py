@@ -0,0 +1,132 @@
+"""
+截图编码离线基准测试
+在已录制的截图上比较各编码方式的载荷大小、编码耗时，以及（可选）模型输出的解析成功率
+
+用法:
+    python benchmark_image_encoding.py screenshot/
+    python benchmark_image_encoding.py screenshot/ --formats png jpeg:70 webp:80 palette_png:128 --api-key <key>
+"""
+
+import os
+import json
+import time
+import base64
+import argparse
+from typing import Dict, List, Any
+from PIL import Image
+
+from image_encoding import get_image_encoder, ImageEncoder
+
+DEFAULT_FORMATS = ["png", "jpeg:85", "jpeg:70", "webp:80", "webp:60", "palette_png:256", "palette_png:64"]
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".bmp")
+
+
+def parse_format(spec: str) -> ImageEncoder:
+    """解析 name[:quality] 形式的编码配置"""
+    name, _, quality = spec.partition(":")
+    return get_image_encoder(name, int(quality) if quality else None)
+
+
+def load_screenshots(directory: str, limit: int = 0) -> List[str]:
+    """列出目录下的截图文件"""
+    files = sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    return files[:limit] if limit else files
+
+
+def check_parse_success(agent, encoder: ImageEncoder, image_base64: str, instruction: str) -> bool:
+    """调用模型并检查返回的action是否可以被解析"""
+    from ParseActionString import parse_action_string
+
+    messages = agent.construct_messages(instruction=instruction, image_base64="")
+    messages[1]["content"][0]["image_url"]["url"] = encoder.data_url(image_base64)
+    try:
+        response, _ = agent.inference(messages)
+        return bool(parse_action_string(response.get("action")))
+    except Exception:
+        return False
+
+
+def run_benchmark(files: List[str],
+                  encoders: List[ImageEncoder],
+                  agent=None,
+                  instruction: str = "") -> List[Dict[str, Any]]:
+    """对每种编码运行基准测试并汇总结果"""
+    results = []
+    for encoder in encoders:
+        total_bytes = 0
+        total_base64 = 0
+        total_ms = 0.0
+        parse_ok = 0
+        for path in files:
+            with Image.open(path) as img:
+                image = img.convert("RGB")
+            start = time.perf_counter()
+            data = encoder.encode(image)
+            total_ms += (time.perf_counter() - start) * 1000
+            image_base64 = base64.b64encode(data).decode()
+            total_bytes += len(data)
+            total_base64 += len(image_base64)
+            if agent is not None:
+                parse_ok += check_parse_success(agent, encoder, image_base64, instruction)
+
+        count = len(files) or 1
+        result = {
+            "encoder": encoder.describe(),
+            "images": len(files),
+            "avg_bytes": total_bytes / count,
+            "avg_payload_bytes": total_base64 / count,
+            "avg_encode_ms": total_ms / count,
+        }
+        if agent is not None:
+            result["parse_success_rate"] = parse_ok / count
+        results.append(result)
+    return results
+
+
+def print_results(results: List[Dict[str, Any]]):
+    """打印结果表格"""
+    baseline = results[0]["avg_payload_bytes"] if results else 0
+    print(f"{'编码':<20}{'平均字节':>12}{'base64载荷':>14}{'相对大小':>10}{'编码耗时ms':>12}{'解析成功率':>12}")
+    for r in results:
+        ratio = r["avg_payload_bytes"] / baseline if baseline else 0
+        parse_rate = f"{r['parse_success_rate']:.1%}" if "parse_success_rate" in r else "-"
+        print(f"{r['encoder']:<20}{r['avg_bytes']:>12.0f}{r['avg_payload_bytes']:>14.0f}"
+              f"{ratio:>10.2f}{r['avg_encode_ms']:>12.1f}{parse_rate:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="截图编码离线基准测试")
+    parser.add_argument("directory", help="已录制截图所在目录")
+    parser.add_argument("--formats", nargs="+", default=DEFAULT_FORMATS, help="编码配置，格式为 name[:quality]")
+    parser.add_argument("--limit", type=int, default=0, help="最多使用的截图数量，0表示全部")
+    parser.add_argument("--api-key", default=None, help="提供API Key时调用模型检查解析成功率")
+    parser.add_argument("--instruction", default="描述当前界面并给出下一步操作", help="解析测试使用的任务指令")
+    parser.add_argument("--output", default=None, help="结果保存为JSON文件")
+    args = parser.parse_args()
+
+    files = load_screenshots(args.directory, args.limit)
+    if not files:
+        print(f"❌ 目录下未找到截图: {args.directory}")
+        return
+
+    agent = None
+    if args.api_key:
+        from GUIAgent import DoubaoUITarsGUI
+        agent = DoubaoUITarsGUI(api_key=args.api_key)
+
+    encoders = [parse_format(spec) for spec in args.formats]
+    print(f"📊 使用 {len(files)} 张截图测试 {len(encoders)} 种编码")
+    results = run_benchmark(files, encoders, agent, args.instruction)
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"💾 结果已保存到: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
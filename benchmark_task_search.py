@@ -0,0 +1,133 @@
+"""
+相似任务检索基准测试
+在合成的任务经验上测量增量索引的插入耗时、首次查询（构建文档矩阵）耗时和缓存后的查询耗时，
+可选与旧的逐次TF-IDF变换方式对比耗时和排序（top-k重合率）
+
+用法:
+    python benchmark_task_search.py
+    python benchmark_task_search.py --sizes 1000 10000 100000 --queries 50 --legacy
+"""
+
+import json
+import time
+import random
+import argparse
+from typing import Dict, List, Any
+import numpy as np
+
+from task_index import IncrementalTaskIndex
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+VOCABULARY = [
+    "发送", "消息", "飞书", "群组", "创建", "云文档", "分享", "搜索", "会议", "日程",
+    "联系人", "通讯录", "文件", "上传", "下载", "设置", "通知", "审批", "表格", "评论",
+    "send", "message", "open", "document", "share", "search", "meeting", "calendar",
+    "group", "create", "contact", "upload", "download", "settings", "comment", "approve"
+]
+
+
+def make_texts(count: int, seed: int = 0) -> List[str]:
+    """生成合成任务经验文本"""
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(VOCABULARY, k=rng.randint(6, 16))) for _ in range(count)]
+
+
+def legacy_search(vectorizer, texts: List[str], query: str, k: int, matrix=None) -> np.ndarray:
+    """旧实现：每次查询都对全部经验做TF-IDF变换（传入 matrix 时复用已变换的经验矩阵）"""
+    from sklearn.metrics.pairwise import cosine_similarity
+
+    if matrix is None:
+        matrix = vectorizer.transform(texts)
+    similarities = cosine_similarity(vectorizer.transform([query]), matrix)[0]
+    return np.argsort(similarities)[::-1][:k]
+
+
+def top_k_overlap(index: IncrementalTaskIndex, vectorizer, texts: List[str],
+                  query_texts: List[str], k: int) -> float:
+    """新旧实现top-k结果的平均重合率"""
+    matrix = vectorizer.transform(texts)
+    overlaps = []
+    for query in query_texts:
+        current, _ = index.top_k(query, k)
+        legacy = legacy_search(vectorizer, texts, query, k, matrix)
+        overlaps.append(len(set(current.tolist()) & set(legacy.tolist())) / max(1, min(k, len(texts))))
+    return float(np.mean(overlaps))
+
+
+def run_benchmark(size: int, queries: int, top_k: int, legacy: bool) -> Dict[str, Any]:
+    """测试单个规模"""
+    texts = make_texts(size)
+    query_texts = make_texts(queries, seed=1)
+    index = IncrementalTaskIndex()
+
+    start = time.perf_counter()
+    for text in texts:
+        index.append(text)
+    insert_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    index.top_k(query_texts[0], top_k)
+    cold_ms = (time.perf_counter() - start) * 1000
+
+    latencies = []
+    for query in query_texts:
+        start = time.perf_counter()
+        index.top_k(query, top_k)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    result = {
+        "experiences": size,
+        "avg_insert_ms": insert_ms / size,
+        "cold_query_ms": cold_ms,
+        "query_p50_ms": float(np.percentile(latencies, 50)),
+        "query_p95_ms": float(np.percentile(latencies, 95)),
+    }
+    if legacy:
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        # 旧实现在 描述+目标+思考过程 上拟合，只保留1000个特征，查询时与 描述+目标 比较
+        thoughts = make_texts(size, seed=2)
+        vectorizer = TfidfVectorizer(max_features=1000, ngram_range=(1, 2)).fit(
+            [f"{text} {thought}" for text, thought in zip(texts, thoughts)]
+        )
+        start = time.perf_counter()
+        legacy_search(vectorizer, texts, query_texts[0], top_k)
+        result["legacy_query_ms"] = (time.perf_counter() - start) * 1000
+        result["top_k_overlap"] = top_k_overlap(index, vectorizer, texts, query_texts, top_k)
+    return result
+
+
+def print_results(results: List[Dict[str, Any]]):
+    """打印结果表格"""
+    print(f"{'经验数':>10}{'插入ms/条':>12}{'首次查询ms':>14}{'查询p50ms':>12}{'查询p95ms':>12}"
+          f"{'旧实现ms':>12}{'top-k重合率':>14}")
+    for r in results:
+        legacy = f"{r['legacy_query_ms']:.1f}" if "legacy_query_ms" in r else "-"
+        overlap = f"{r['top_k_overlap']:.1%}" if "top_k_overlap" in r else "-"
+        print(f"{r['experiences']:>10}{r['avg_insert_ms']:>12.3f}{r['cold_query_ms']:>14.1f}"
+              f"{r['query_p50_ms']:>12.2f}{r['query_p95_ms']:>12.2f}{legacy:>12}{overlap:>14}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="相似任务检索基准测试")
+    parser.add_argument("--sizes", nargs="+", type=int, default=DEFAULT_SIZES, help="测试的经验数量")
+    parser.add_argument("--queries", type=int, default=50, help="每个规模的查询次数")
+    parser.add_argument("--top-k", type=int, default=10, help="每次查询返回的条数")
+    parser.add_argument("--legacy", action="store_true", help="同时测量旧的逐次TF-IDF变换实现")
+    parser.add_argument("--output", default=None, help="结果保存为JSON文件")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        print(f"📊 测试 {size} 条经验...")
+        results.append(run_benchmark(size, args.queries, args.top_k, args.legacy))
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"💾 结果已保存到: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+内容寻址的二进制存储
+按内容的SHA-256摘要保存截图等二进制数据，相同内容只保存一份，读取时按需内存映射
+"""
+
+import os
+import mmap
+import base64
+import hashlib
+import tempfile
+from typing import Iterable, Optional
+
+
+class BlobStore:
+    """内容寻址的文件存储，摘要前两位作为子目录"""
+
+    def __init__(self, root: str):
+        """
+        Args:
+            root: 存储根目录
+        """
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def digest(data: bytes) -> str:
+        """计算内容摘要"""
+        return hashlib.sha256(data).hexdigest()
+
+    def path(self, digest: str) -> str:
+        """摘要对应的文件路径"""
+        return os.path.join(self.root, digest[:2], digest[2:])
+
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self.path(digest))
+
+    def put(self, data: bytes) -> str:
+        """
+        保存内容，已存在时直接返回摘要
+
+        Returns:
+            str: 内容摘要
+        """
+        digest = self.digest(data)
+        target = self.path(digest)
+        if os.path.exists(target):
+            return digest
+        directory = os.path.dirname(target)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, target)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return digest
+
+    def open(self, digest: str) -> Optional[mmap.mmap]:
+        """以只读内存映射打开内容，不存在时返回None"""
+        target = self.path(digest)
+        if not os.path.exists(target) or os.path.getsize(target) == 0:
+            return None
+        with open(target, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def get(self, digest: str) -> Optional[bytes]:
+        """读取内容，不存在时返回None"""
+        mapped = self.open(digest)
+        if mapped is None:
+            return None
+        with mapped:
+            return mapped[:]
+
+    def get_base64(self, digest: str) -> Optional[str]:
+        """读取内容并编码为base64"""
+        data = self.get(digest)
+        return base64.b64encode(data).decode() if data is not None else None
+
+    def delete(self, digest: str):
+        """删除内容"""
+        target = self.path(digest)
+        if os.path.exists(target):
+            os.remove(target)
+
+    def delete_unreferenced(self, candidates: Iterable[str], live: Iterable[str]) -> int:
+        """删除候选摘要中不再被引用的内容，返回删除数量"""
+        live = set(live)
+        removed = 0
+        for digest in set(candidates) - live:
+            if digest and self.exists(digest):
+                self.delete(digest)
+                removed += 1
+        return removed
+
+    def size_bytes(self) -> int:
+        """存储占用的总字节数"""
+        total = 0
+        for directory, _, files in os.walk(self.root):
+            total += sum(os.path.getsize(os.path.join(directory, name)) for name in files)
+        return total
@@ -0,0 +1,176 @@
+"""
+对话历史管理
+按token预算维护消息列表：默认只保留最近的截图（与原来每次只发送当前截图一致），
+可选择先缩小较早的截图再丢弃；保留系统提示和最近的助手思考
+"""
+
+import io
+import re
+import math
+import base64
+from typing import Any, Dict, List, Optional, Tuple
+from PIL import Image
+
+_CJK_PATTERN = re.compile(r'[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]')
+
+
+def estimate_text_tokens(text: Optional[str]) -> int:
+    """粗略估算文本token数：中日韩字符按1个token计，其余字符按4个字符1个token计"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+class ConversationHistoryManager:
+    """按token预算裁剪对话历史"""
+
+    def __init__(self,
+                 token_budget: int = 8000,
+                 patch_size: int = 28,
+                 keep_recent_images: int = 1,
+                 keep_recent_messages: int = 6,
+                 downscale_factor: float = 0.5,
+                 min_image_width: int = 320,
+                 downscale_older_images: bool = False):
+        """
+        初始化对话历史管理器
+
+        Args:
+            token_budget: 提示token预算
+            patch_size: 估算图像token时每个token对应的像素块边长
+            keep_recent_images: 保留原分辨率的最近截图数量
+            keep_recent_messages: 尽量保留的最近消息数量（不含系统提示）
+            downscale_factor: 较早截图每次缩小的比例
+            min_image_width: 截图缩小的最小宽度，低于此值时直接丢弃
+            downscale_older_images: 为True时较早的截图在预算内缩小保留，
+                为False（默认）时直接丢弃，每次请求最多只包含 keep_recent_images 张截图
+        """
+        self.token_budget = token_budget
+        self.patch_size = patch_size
+        self.keep_recent_images = keep_recent_images
+        self.keep_recent_messages = keep_recent_messages
+        self.downscale_factor = downscale_factor
+        self.min_image_width = min_image_width
+        self.downscale_older_images = downscale_older_images
+        self._size_memo: Dict[int, Tuple[int, int]] = {}
+
+    def _image_size(self, url: str) -> Tuple[int, int]:
+        """读取data URL中截图的尺寸，只解析图像头"""
+        key = hash(url)
+        size = self._size_memo.get(key)
+        if size is None:
+            encoded = url.split(",", 1)[-1]
+            with Image.open(io.BytesIO(base64.b64decode(encoded))) as img:
+                size = img.size
+            if len(self._size_memo) > 512:
+                self._size_memo.clear()
+            self._size_memo[key] = size
+        return size
+
+    def estimate_image_tokens(self, url: str) -> int:
+        """按像素块估算截图的token数"""
+        width, height = self._image_size(url)
+        return math.ceil(width / self.patch_size) * math.ceil(height / self.patch_size)
+
+    def estimate_message_tokens(self, message: Dict[str, Any]) -> int:
+        """估算单条消息的token数"""
+        content = message.get("content")
+        if isinstance(content, list):
+            total = 0
+            for part in content:
+                if part.get("type") == "image_url":
+                    total += self.estimate_image_tokens(part["image_url"]["url"])
+                else:
+                    total += estimate_text_tokens(part.get("text"))
+            return total
+        return estimate_text_tokens(content)
+
+    def estimate_tokens(self, messages: List[Dict[str, Any]]) -> int:
+        """估算消息列表的总token数"""
+        return sum(self.estimate_message_tokens(m) for m in messages)
+
+    @staticmethod
+    def _is_image_message(message: Dict[str, Any]) -> bool:
+        content = message.get("content")
+        return isinstance(content, list) and any(p.get("type") == "image_url" for p in content)
+
+    def _downscale(self, message: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """缩小消息中的截图，缩小到最小宽度以下时返回None"""
+        parts = []
+        for part in message["content"]:
+            if part.get("type") != "image_url":
+                parts.append(part)
+                continue
+            url = part["image_url"]["url"]
+            header, encoded = url.split(",", 1)
+            with Image.open(io.BytesIO(base64.b64decode(encoded))) as img:
+                width, height = img.size
+                new_width = int(width * self.downscale_factor)
+                if new_width < self.min_image_width:
+                    return None
+                new_size = (new_width, max(1, int(height * self.downscale_factor)))
+                fmt = img.format or "PNG"
+                small = img.resize(new_size, Image.Resampling.BILINEAR)
+            buffered = io.BytesIO()
+            if fmt == "JPEG" and small.mode != "RGB":
+                small = small.convert("RGB")
+            small.save(buffered, format=fmt)
+            new_url = f"{header},{base64.b64encode(buffered.getvalue()).decode()}"
+            self._size_memo[hash(new_url)] = new_size
+            parts.append({"type": "image_url", "image_url": {"url": new_url}})
+        return {**message, "content": parts}
+
+    def fit(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        裁剪消息列表使其不超过token预算
+
+        裁剪顺序：
+            1. 丢弃最近 keep_recent_images 张以外的截图；downscale_older_images 为True时改为
+               从最早的截图开始逐步缩小，超出预算且低于最小宽度后才丢弃
+            2. 丢弃较早的非截图消息（系统提示和最近的消息保留）
+
+        Args:
+            messages: 消息列表，第一条为系统提示
+
+        Returns:
+            裁剪后的新消息列表
+        """
+        if not messages:
+            return messages
+        system, history = messages[0], list(messages[1:])
+        tokens = self.estimate_message_tokens(system) + sum(self.estimate_message_tokens(m) for m in history)
+
+        image_positions = [i for i, m in enumerate(history) if self._is_image_message(m)]
+        protected_images = set(image_positions[-self.keep_recent_images:]) if self.keep_recent_images else set()
+
+        if not self.downscale_older_images:
+            # 较早的截图不论预算直接丢弃，避免每次请求重复发送多张截图
+            for i in image_positions:
+                if i not in protected_images:
+                    tokens -= self.estimate_message_tokens(history[i])
+                    history[i] = None
+            image_positions = []
+
+        # 从最早的截图开始缩小或丢弃
+        for i in image_positions:
+            if tokens <= self.token_budget:
+                break
+            if i in protected_images:
+                continue
+            while history[i] is not None and tokens > self.token_budget:
+                before = self.estimate_message_tokens(history[i])
+                history[i] = self._downscale(history[i])
+                after = self.estimate_message_tokens(history[i]) if history[i] is not None else 0
+                tokens -= before - after
+        history = [m for m in history if m is not None]
+
+        # 仍然超出预算时，丢弃较早的非截图消息
+        protected_start = max(0, len(history) - self.keep_recent_messages)
+        trimmed = []
+        for i, message in enumerate(history):
+            if tokens > self.token_budget and i < protected_start and not self._is_image_message(message):
+                tokens -= self.estimate_message_tokens(message)
+                continue
+            trimmed.append(message)
+        return [system] + trimmed
@@ -0,0 +1,171 @@
+"""
+嵌入后端
+dashscope: 通过DashScope兼容OpenAI的接口请求远程嵌入模型；
+hashing: 本地字符n-gram哈希向量，维度固定，不需要网络，可在离线环境中导入和查询
+
+嵌入失败时直接抛出异常，不返回零向量等占位结果，以免写入无效向量
+"""
+
+import re
+import time
+import zlib
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+class EmbeddingBackend:
+    """
+    嵌入后端接口
+
+    子类需提供:
+        name: 后端名称
+        model_name: 模型标识，用作嵌入缓存键和向量集合名称的一部分，向量不兼容时必须不同
+        dimension: 向量维度，未知时为None
+        remote: 是否请求远程接口（远程后端按批次请求并使用嵌入缓存）
+        rate_limiter: 请求限流器（ingest_pipeline.TokenBucket），远程后端每次请求前调用 acquire()
+        embed(texts): 返回与输入顺序一致的向量，失败时抛出异常
+    """
+
+    name = ""
+    remote = False
+    model_name = ""
+    dimension: Optional[int] = None
+    rate_limiter = None
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+    def collection_suffix(self) -> str:
+        """向量集合名称后缀（Chroma集合名只允许字母、数字、._-）"""
+        return re.sub(r"[^A-Za-z0-9._-]", "-", f"{self.name}_{self.model_name}")[:40].strip("._-")
+
+
+class DashScopeEmbeddingBackend(EmbeddingBackend):
+    """DashScope远程嵌入模型，请求失败时按指数退避重试"""
+
+    name = "dashscope"
+    remote = True
+
+    def __init__(self,
+                 model: str = "text-embedding-v4",
+                 api_key: Optional[str] = None,
+                 dimension: Optional[int] = None,
+                 max_retries: int = 3,
+                 rate_limiter=None,
+                 base_url: str = "https://dashscope.aliyuncs.com/compatible-mode/v1"):
+        """
+        Args:
+            model: 嵌入模型名称
+            api_key: API Key
+            dimension: 请求的向量维度，为None时使用模型默认维度
+            max_retries: 每个批次请求失败后的最大重试次数
+            rate_limiter: 请求限流器（ingest_pipeline.TokenBucket），为None时不限流
+            base_url: 接口地址
+        """
+        import openai
+
+        api_key = api_key or "sk-1b79273a7a7347349e7ce57275ab0c8c"
+        if not api_key:
+            raise ValueError("OpenAI API密钥未提供，请设置OPENAI_API_KEY环境变量或传入api_key参数")
+        self._openai = openai
+        self.client = openai.OpenAI(api_key=api_key, base_url=base_url)
+        self.model = model
+        self.dimension = dimension
+        self.model_name = f"{model}-d{dimension}" if dimension else model
+        self.max_retries = max_retries
+        self.rate_limiter = rate_limiter
+
+    def _request(self, texts: List[str]) -> List[List[float]]:
+        options = {"dimensions": self.dimension} if self.dimension else {}
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        response = self.client.embeddings.create(model=self.model, input=texts, **options)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        请求一个批次的嵌入向量，失败时按指数退避重试；
+        接口因批次过大拒绝请求时拆成两半分别请求
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self._request(texts)
+            except self._openai.BadRequestError:
+                if len(texts) == 1:
+                    raise
+                middle = len(texts) // 2
+                return self.embed(texts[:middle]) + self.embed(texts[middle:])
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = 2 ** attempt
+                print(f"⚠️ 嵌入请求失败，{delay} 秒后重试 ({attempt + 1}/{self.max_retries}): {e}")
+                time.sleep(delay)
+
+
+class HashingEmbeddingBackend(EmbeddingBackend):
+    """
+    本地字符n-gram哈希向量
+
+    文本统一小写并合并空白后取字符n-gram，用CRC32哈希到固定维度（带符号以减少冲突偏差），
+    计数取 sign(x)*log(1+|x|) 后做L2归一化；结果在不同进程和机器上一致
+    """
+
+    name = "hashing"
+    remote = False
+
+    def __init__(self, dimension: int = 512, ngram_range: Tuple[int, int] = (1, 3)):
+        """
+        Args:
+            dimension: 向量维度
+            ngram_range: 字符n-gram的最小和最大长度
+        """
+        if dimension <= 0:
+            raise ValueError("dimension 必须大于0")
+        low, high = ngram_range
+        if not 1 <= low <= high:
+            raise ValueError("ngram_range 必须满足 1 <= 最小长度 <= 最大长度")
+        self.dimension = dimension
+        self.ngram_range = (low, high)
+        self.model_name = f"char{low}-{high}-d{dimension}"
+
+    def embed_one(self, text: str) -> List[float]:
+        text = " ".join(text.lower().split())
+        low, high = self.ngram_range
+        grams = [text[i:i + n] for n in range(low, high + 1) for i in range(len(text) - n + 1)]
+        vector = np.zeros(self.dimension)
+        if grams:
+            hashes = np.fromiter((zlib.crc32(gram.encode("utf-8")) for gram in grams),
+                                 dtype=np.uint64, count=len(grams))
+            signs = np.where(hashes >> np.uint64(31), -1.0, 1.0)
+            vector = np.bincount((hashes % np.uint64(self.dimension)).astype(np.int64),
+                                 weights=signs, minlength=self.dimension)
+            vector = np.sign(vector) * np.log1p(np.abs(vector))
+            norm = np.linalg.norm(vector)
+            if norm > 0:
+                vector /= norm
+        return vector.tolist()
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_one(text) for text in texts]
+
+
+EMBEDDING_BACKENDS = {
+    "dashscope": DashScopeEmbeddingBackend,
+    "hashing": HashingEmbeddingBackend,
+}
+
+
+def create_embedding_backend(backend: str,
+                             model: str = "text-embedding-v4",
+                             api_key: Optional[str] = None,
+                             dimension: Optional[int] = None,
+                             max_retries: int = 3,
+                             rate_limiter=None) -> EmbeddingBackend:
+    """按名称创建嵌入后端，hashing 后端忽略模型、API Key、重试和限流参数"""
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"不支持的嵌入后端: {backend}，可选: {', '.join(EMBEDDING_BACKENDS)}")
+    if backend == "hashing":
+        return HashingEmbeddingBackend(dimension or 512)
+    return DashScopeEmbeddingBackend(model, api_key, dimension, max_retries, rate_limiter)
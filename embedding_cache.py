@@ -0,0 +1,137 @@
+"""
+嵌入向量缓存
+按模型名和文本摘要缓存嵌入向量，SQLite持久化，内存中保留最近使用的条目；
+重新导入未修改的文档块或重复查询相同问题时不再请求嵌入接口
+"""
+
+import os
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """持久化的嵌入向量缓存，向量以float32保存"""
+
+    def __init__(self,
+                 cache_path: str = "cache/embedding_cache.db",
+                 memory_entries: int = 2048):
+        """
+        初始化嵌入向量缓存
+
+        Args:
+            cache_path: SQLite缓存文件路径
+            memory_entries: 内存LRU中保留的向量数量
+        """
+        self.cache_path = cache_path
+        self.memory_entries = memory_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+
+        directory = os.path.dirname(cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, model TEXT, dim INTEGER, vector BLOB)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model_name: str, text: str) -> str:
+        """根据模型名和文本摘要生成缓存键"""
+        text_digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return hashlib.sha256(f"{model_name}|{text_digest}".encode()).hexdigest()
+
+    def _remember(self, key: str, vector: List[float]):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get_many(self, model_name: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        批量读取缓存
+
+        Returns:
+            与输入顺序一致的向量列表，未命中的位置为None
+        """
+        keys = [self.make_key(model_name, text) for text in texts]
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        with self._lock:
+            missing = {}
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    results[i] = vector
+                else:
+                    missing.setdefault(key, []).append(i)
+
+            # SQLite单条语句的参数数量有限，分批查询
+            pending = list(missing)
+            for start in range(0, len(pending), 500):
+                chunk = pending[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float32).tolist()
+                    self._remember(key, vector)
+                    for i in missing[key]:
+                        results[i] = vector
+
+            found = sum(1 for vector in results if vector is not None)
+            self.hits += found
+            self.misses += len(texts) - found
+        return results
+
+    def get(self, model_name: str, text: str) -> Optional[List[float]]:
+        """读取单个文本的缓存向量"""
+        return self.get_many(model_name, [text])[0]
+
+    def put_many(self, model_name: str, texts: List[str], vectors: List[List[float]]):
+        """批量写入缓存"""
+        rows = []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = self.make_key(model_name, text)
+                array = np.asarray(vector, dtype=np.float32)
+                self._remember(key, array.tolist())
+                rows.append((key, model_name, len(array), array.tobytes()))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, dim, vector) VALUES (?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+
+    def put(self, model_name: str, text: str, vector: List[float]):
+        """写入单个文本的向量"""
+        self.put_many(model_name, [text], [vector])
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._memory.clear()
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            memory_entries = len(self._memory)
+        total = self.hits + self.misses
+        return {
+            "entries": entries,
+            "memory_entries": memory_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total > 0 else 0
+        }
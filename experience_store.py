@@ -0,0 +1,231 @@
+"""
+经验数据的列式内存存储
+数值字段（成功标记、步骤数、token数、使用次数、失败次数、创建时间等）按列保存在NumPy数组中，
+文本和结构化字段保存在使用 __slots__ 的记录对象中；统计、清理过滤和Top-N查询可直接在数组上向量化计算
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+class ColumnStore:
+    """按列保存数值字段的可增长数组，行号与记录在列表中的位置一致"""
+
+    def __init__(self, columns: Dict[str, Any], capacity: int = 64):
+        """
+        Args:
+            columns: 字段名 -> NumPy数据类型
+            capacity: 初始容量，不足时按倍数扩容
+        """
+        self.dtypes = dict(columns)
+        self.size = 0
+        self._arrays = {name: np.zeros(capacity, dtype=dtype) for name, dtype in self.dtypes.items()}
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _reserve(self, capacity: int):
+        current = len(next(iter(self._arrays.values()))) if self._arrays else capacity
+        if capacity <= current:
+            return
+        new_capacity = max(capacity, current * 2, 64)
+        for name, array in self._arrays.items():
+            grown = np.zeros(new_capacity, dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            self._arrays[name] = grown
+
+    def append(self, values: Dict[str, Any]) -> int:
+        """追加一行，返回行号"""
+        self._reserve(self.size + 1)
+        row = self.size
+        for name, array in self._arrays.items():
+            array[row] = values[name]
+        self.size += 1
+        return row
+
+    def get(self, name: str, row: int):
+        return self._arrays[name][row].item()
+
+    def set(self, name: str, row: int, value):
+        self._arrays[name][row] = value
+
+    def column(self, name: str) -> np.ndarray:
+        """字段的有效数据视图（不复制）"""
+        return self._arrays[name][:self.size]
+
+    def compact(self, keep: np.ndarray):
+        """只保留 keep 为True的行，保持原有顺序"""
+        for name, array in self._arrays.items():
+            self._arrays[name] = array[:self.size][keep]
+        self.size = int(np.count_nonzero(keep))
+
+    def trim(self):
+        """释放扩容留下的多余容量（批量加载后使用）"""
+        for name, array in self._arrays.items():
+            self._arrays[name] = array[:self.size].copy()
+
+    def clear(self):
+        for name, dtype in self.dtypes.items():
+            self._arrays[name] = np.zeros(64, dtype=dtype)
+        self.size = 0
+
+    def top_n(self, name: str, n: int) -> np.ndarray:
+        """
+        字段值最大的n行，同值时按行号先后排列（与 sorted(..., reverse=True) 的顺序一致）
+
+        Returns:
+            np.ndarray: 行号
+        """
+        values = self.column(name)
+        if n <= 0 or not len(values):
+            return np.empty(0, dtype=np.int64)
+        if n < len(values):
+            # 先用第n大的值筛出候选，再对候选做稳定排序
+            threshold = np.partition(values, len(values) - n)[len(values) - n]
+            candidates = np.flatnonzero(values >= threshold)
+        else:
+            candidates = np.arange(len(values))
+        order = np.argsort(-values[candidates], kind="stable")
+        return candidates[order][:n]
+
+
+class NumericField:
+    """记录的数值字段：记录加入列式存储后读写对应的数组元素，否则读写记录自身"""
+
+    def __init__(self, dtype):
+        self.dtype = dtype
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, record, owner=None):
+        if record is None:
+            return self
+        if record._store is None:
+            return record._values[self.name]
+        return record._store.get(self.name, record._row)
+
+    def __set__(self, record, value):
+        if record._store is None:
+            record._values[self.name] = value
+        else:
+            record._store.set(self.name, record._row, value)
+
+
+class ColumnarRecord:
+    """
+    数值字段存放在列式存储中的记录基类
+
+    子类用 NumericField 声明数值字段，用 __slots__ 声明其他字段，并在 FIELDS 中按序列化顺序列出全部字段；
+    子类的 __init__ 需先调用基类 __init__ 再设置字段
+    """
+
+    __slots__ = ("_store", "_row", "_values")
+    FIELDS: Tuple[str, ...] = ()
+
+    def __init__(self):
+        self._store: Optional[ColumnStore] = None
+        self._row = -1
+        self._values: Optional[Dict[str, Any]] = {}
+
+    @classmethod
+    def numeric_columns(cls) -> Dict[str, Any]:
+        """数值字段名 -> NumPy数据类型，按声明顺序"""
+        columns = {}
+        for klass in reversed(cls.__mro__):
+            for name, attr in vars(klass).items():
+                if isinstance(attr, NumericField):
+                    columns[name] = attr.dtype
+        return columns
+
+    def attach(self, store: ColumnStore):
+        """将数值字段移入列式存储（追加到末尾）"""
+        values = {name: getattr(self, name) for name in store.dtypes}
+        self._row = store.append(values)
+        self._store = store
+        self._values = None
+
+    def detach(self):
+        """将数值字段从列式存储复制回记录自身"""
+        if self._store is None:
+            return
+        self._values = {name: self._store.get(name, self._row) for name in self._store.dtypes}
+        self._store = None
+        self._row = -1
+
+    def to_dict(self) -> Dict[str, Any]:
+        """按字段顺序转换为字典，用于序列化"""
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    def copy(self, **changes) -> "ColumnarRecord":
+        """生成独立于列式存储的副本，可同时修改部分字段"""
+        values = self.to_dict()
+        values.update(changes)
+        return type(self)(**values)
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.FIELDS)
+        return f"{type(self).__name__}({fields})"
+
+
+class RecordTable:
+    """记录列表及其列式存储，记录在列表中的位置等于其在存储中的行号"""
+
+    def __init__(self, record_type):
+        self.record_type = record_type
+        self.store = ColumnStore(record_type.numeric_columns())
+        self.records: List[ColumnarRecord] = []
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __getitem__(self, index):
+        return self.records[index]
+
+    def __bool__(self) -> bool:
+        return bool(self.records)
+
+    def append(self, record: ColumnarRecord):
+        """追加记录，已属于其他存储的记录先复制"""
+        if record._store is not None:
+            record = record.copy()
+        record.attach(self.store)
+        self.records.append(record)
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def replace_all(self, records):
+        """清空后重新加载记录"""
+        for record in self.records:
+            record.detach()
+        self.store.clear()
+        self.records = []
+        self.extend(records)
+        self.store.trim()
+
+    def column(self, name: str) -> np.ndarray:
+        return self.store.column(name)
+
+    def filter(self, keep: np.ndarray) -> List[ColumnarRecord]:
+        """
+        只保留 keep 为True的记录
+
+        Returns:
+            List: 被删除的记录
+        """
+        keep = np.asarray(keep, dtype=bool)
+        removed = [record for record, kept in zip(self.records, keep) if not kept]
+        for record in removed:
+            # 删除的记录脱离存储，保留当前数值
+            record.detach()
+        self.records = [record for record, kept in zip(self.records, keep) if kept]
+        self.store.compact(keep)
+        for row, record in enumerate(self.records):
+            record._row = row
+        return removed
@@ -0,0 +1,118 @@
+"""
+截图编码器
+为模型请求提供PNG、JPEG、WebP和调色板PNG等编码方式，减小上传体积
+"""
+
+import io
+from typing import Dict, Optional, Type
+from PIL import Image
+
+
+class ImageEncoder:
+    """图像编码器基类"""
+
+    name = "png"
+    mime_type = "image/png"
+    extension = ".png"
+
+    def __init__(self, quality: Optional[int] = None):
+        """
+        Args:
+            quality: 编码质量，含义由具体编码器决定
+        """
+        self.quality = quality
+
+    def encode(self, image: Image.Image) -> bytes:
+        """将图像编码为字节"""
+        buffered = io.BytesIO()
+        self._save(image, buffered)
+        return buffered.getvalue()
+
+    def _save(self, image: Image.Image, buffered: io.BytesIO):
+        image.save(buffered, format="PNG")
+
+    def data_url(self, image_base64: str) -> str:
+        """构建模型请求使用的data URL"""
+        return f"data:{self.mime_type};base64,{image_base64}"
+
+    def describe(self) -> str:
+        return self.name if self.quality is None else f"{self.name}(q={self.quality})"
+
+
+class PNGEncoder(ImageEncoder):
+    """全彩PNG编码（无损，默认）"""
+
+
+class JPEGEncoder(ImageEncoder):
+    """JPEG编码，quality取值1-95"""
+
+    name = "jpeg"
+    mime_type = "image/jpeg"
+    extension = ".jpg"
+
+    def __init__(self, quality: Optional[int] = 80):
+        super().__init__(80 if quality is None else quality)
+
+    def _save(self, image: Image.Image, buffered: io.BytesIO):
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        image.save(buffered, format="JPEG", quality=self.quality)
+
+
+class WebPEncoder(ImageEncoder):
+    """WebP编码，quality取值0-100"""
+
+    name = "webp"
+    mime_type = "image/webp"
+    extension = ".webp"
+
+    def __init__(self, quality: Optional[int] = 80, method: int = 4):
+        super().__init__(80 if quality is None else quality)
+        self.method = method
+
+    def _save(self, image: Image.Image, buffered: io.BytesIO):
+        image.save(buffered, format="WEBP", quality=self.quality, method=self.method)
+
+
+class PalettePNGEncoder(ImageEncoder):
+    """调色板PNG编码，quality表示调色板颜色数（2-256）"""
+
+    name = "palette_png"
+    mime_type = "image/png"
+    extension = ".png"
+
+    def __init__(self, quality: Optional[int] = 256):
+        super().__init__(256 if quality is None else max(2, min(256, quality)))
+
+    def _save(self, image: Image.Image, buffered: io.BytesIO):
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        quantized = image.quantize(colors=self.quality, method=Image.Quantize.FASTOCTREE)
+        quantized.save(buffered, format="PNG", optimize=False)
+
+
+IMAGE_ENCODERS: Dict[str, Type[ImageEncoder]] = {
+    "png": PNGEncoder,
+    "jpeg": JPEGEncoder,
+    "webp": WebPEncoder,
+    "palette_png": PalettePNGEncoder,
+}
+
+
+def get_image_encoder(name: str = "png", quality: Optional[int] = None) -> ImageEncoder:
+    """
+    按名称创建图像编码器
+
+    Args:
+        name: 编码器名称，见 IMAGE_ENCODERS
+        quality: 编码质量，为None时使用编码器默认值
+
+    Returns:
+        ImageEncoder: 编码器实例
+    """
+    encoder_cls = IMAGE_ENCODERS.get(name.lower())
+    if encoder_cls is None:
+        raise ValueError(f"不支持的图像编码: {name}，可选: {', '.join(IMAGE_ENCODERS)}")
+    if encoder_cls is PNGEncoder:
+        return encoder_cls()
+    return encoder_cls(quality)
@@ -0,0 +1,175 @@
+"""
+推理响应缓存
+temperature=0 时相同的提示词和截图会得到相同的结果，按模型名、提示词摘要和截图感知哈希缓存模型响应
+"""
+
+import os
+import io
+import json
+import time
+import base64
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from PIL import Image
+
+from screen_change import compute_dhash
+
+
+class InferenceResponseCache:
+    """持久化的推理响应缓存，基于SQLite存储，按最近访问时间做LRU淘汰"""
+
+    MODES = ("read_write", "read_only", "bypass")
+
+    def __init__(self,
+                 cache_path: str = "cache/inference_cache.db",
+                 max_entries: int = 5000,
+                 mode: str = "read_write",
+                 hash_size: int = 16):
+        """
+        初始化推理响应缓存
+
+        Args:
+            cache_path: SQLite缓存文件路径
+            max_entries: 最大缓存条目数，超过后淘汰最久未访问的条目
+            mode: 缓存模式
+                read_write: 读取缓存并写入新响应
+                read_only: 只读取缓存，不写入
+                bypass: 不使用缓存
+            hash_size: 截图感知哈希的边长
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"不支持的缓存模式: {mode}，可选: {', '.join(self.MODES)}")
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self.mode = mode
+        self.hash_size = hash_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._image_hash_memo: "OrderedDict[str, str]" = OrderedDict()
+
+        directory = os.path.dirname(cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, response TEXT, tokens INTEGER, "
+            "created_at REAL, last_access REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON responses(last_access)")
+        self._conn.commit()
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "bypass"
+
+    def _image_hash(self, url: str) -> str:
+        """计算data URL中截图的感知哈希，同一截图只解码一次"""
+        digest = hashlib.sha1(url.encode()).hexdigest()
+        # 预取线程和推理线程可能同时计算，备忘录的读写都在锁内进行，解码在锁外
+        with self._lock:
+            cached = self._image_hash_memo.get(digest)
+            if cached is not None:
+                self._image_hash_memo.move_to_end(digest)
+                return cached
+        encoded = url.split(",", 1)[-1]
+        with Image.open(io.BytesIO(base64.b64decode(encoded))) as img:
+            image_hash = compute_dhash(img, self.hash_size)
+        with self._lock:
+            self._image_hash_memo[digest] = image_hash
+            self._image_hash_memo.move_to_end(digest)
+            while len(self._image_hash_memo) > 256:
+                self._image_hash_memo.popitem(last=False)
+        return image_hash
+
+    def make_key(self, model_name: str, messages: List[Dict[str, Any]]) -> Optional[str]:
+        """
+        根据模型名、提示词摘要和截图感知哈希生成缓存键
+
+        Returns:
+            缓存键，bypass模式下返回None
+        """
+        if not self.enabled:
+            return None
+        prompt_parts = []
+        image_hashes = []
+        for message in messages:
+            content = message.get("content")
+            if isinstance(content, list):
+                for part in content:
+                    if part.get("type") == "image_url":
+                        image_hashes.append(self._image_hash(part["image_url"]["url"]))
+                        prompt_parts.append([message.get("role"), "<image>"])
+                    else:
+                        prompt_parts.append([message.get("role"), part.get("text")])
+            else:
+                prompt_parts.append([message.get("role"), content])
+        prompt_digest = hashlib.sha256(
+            json.dumps(prompt_parts, ensure_ascii=False).encode()
+        ).hexdigest()
+        return hashlib.sha256(
+            f"{model_name}|{prompt_digest}|{','.join(image_hashes)}".encode()
+        ).hexdigest()
+
+    def get(self, key: Optional[str]) -> Optional[Tuple[Any, int]]:
+        """读取缓存，返回 (响应, 原始token数)，未命中返回None"""
+        if key is None or not self.enabled:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, tokens FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if self.mode == "read_write":
+                self._conn.execute(
+                    "UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key)
+                )
+                self._conn.commit()
+        return json.loads(row[0]), row[1]
+
+    def put(self, key: Optional[str], model_name: str, response: Any, tokens: int):
+        """写入缓存，只在read_write模式下生效"""
+        if key is None or self.mode != "read_write":
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, tokens, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model_name, json.dumps(response, ensure_ascii=False), tokens, now, now)
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    "SELECT key FROM responses ORDER BY last_access ASC LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+            self._conn.commit()
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "mode": self.mode,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total > 0 else 0
+        }
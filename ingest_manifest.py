@@ -0,0 +1,109 @@
+"""
+Markdown导入清单
+记录每个已导入文件的内容摘要、修改时间和各文档块的摘要与ID，
+重新导入时据此只处理新增或修改的文档块，并删除已不存在的文档块
+"""
+
+import os
+import json
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional
+
+from knowledge_storage import atomic_write
+
+
+def file_key(file_path: str) -> str:
+    """清单中文件的键（规范化的绝对路径）"""
+    return os.path.normcase(os.path.abspath(file_path))
+
+
+def content_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def chunk_digest(title: str, content: str) -> str:
+    """文档块摘要，标题或内容变化都视为新的文档块"""
+    return hashlib.sha256(f"{title}\0{content}".encode("utf-8")).hexdigest()
+
+
+def make_chunk_ids(file_path: str, digests: List[str]) -> List[str]:
+    """
+    按文件路径和文档块摘要生成稳定的ID，同一文件中内容相同的文档块按出现顺序编号
+
+    ID形如 <文件名>_<路径摘要>_<块摘要>_<序号>，文档块位置变化时ID不变
+    """
+    name = os.path.basename(file_path)
+    path_tag = hashlib.sha1(file_key(file_path).encode("utf-8")).hexdigest()[:8]
+    seen: Dict[str, int] = {}
+    ids = []
+    for digest in digests:
+        occurrence = seen.get(digest, 0)
+        seen[digest] = occurrence + 1
+        ids.append(f"{name}_{path_tag}_{digest[:16]}_{occurrence}")
+    return ids
+
+
+class IngestManifest:
+    """导入清单，保存为JSON文件"""
+
+    def __init__(self, manifest_path: str):
+        """
+        Args:
+            manifest_path: 清单文件路径
+        """
+        self.manifest_path = manifest_path
+        self._lock = threading.RLock()
+        self.files: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(manifest_path):
+            try:
+                with open(manifest_path, "r", encoding="utf-8") as f:
+                    self.files = json.load(f).get("files", {})
+            except (OSError, ValueError) as e:
+                print(f"⚠️ 读取导入清单失败，将重新导入全部文件: {e}")
+
+    def get(self, file_path: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self.files.get(file_key(file_path))
+
+    def set(self, file_path: str, entry: Dict[str, Any]):
+        """更新文件记录并写盘"""
+        with self._lock:
+            self.files[file_key(file_path)] = entry
+            self.save()
+
+    def set_many(self, entries: Dict[str, Dict[str, Any]]):
+        """批量更新文件记录（文件路径 -> 记录），只写盘一次"""
+        with self._lock:
+            for file_path, entry in entries.items():
+                self.files[file_key(file_path)] = entry
+            self.save()
+
+    def remove(self, file_path: str) -> Optional[Dict[str, Any]]:
+        """删除文件记录并写盘，返回原记录"""
+        with self._lock:
+            entry = self.files.pop(file_key(file_path), None)
+            if entry is not None:
+                self.save()
+            return entry
+
+    def remove_by_name(self, file_name: str) -> List[Dict[str, Any]]:
+        """删除指定文件名的所有记录"""
+        with self._lock:
+            keys = [key for key, entry in self.files.items() if entry.get("file_name") == file_name]
+            removed = [self.files.pop(key) for key in keys]
+            if removed:
+                self.save()
+            return removed
+
+    def files_under(self, directory_path: str) -> List[str]:
+        """目录下（含子目录）已导入的文件键"""
+        prefix = os.path.join(file_key(directory_path), "")
+        with self._lock:
+            return [key for key in self.files if key.startswith(prefix)]
+
+    def save(self):
+        with self._lock:
+            atomic_write(self.manifest_path, json.dumps(
+                {"version": 1, "files": self.files}, ensure_ascii=False, indent=2
+            ).encode("utf-8"))
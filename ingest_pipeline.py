@@ -0,0 +1,166 @@
+"""
+Markdown并发导入流水线
+读取分块和嵌入在线程池中并行执行，嵌入请求经令牌桶限流，向量数据库写入在调用线程中按批次合并执行；
+在途文件数有上限（写入跟不上时暂停读取），每个文件单独返回结果，进度回调可随时取消
+"""
+
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+
+class TokenBucket:
+    """令牌桶限流：平均每秒发放 rate 个令牌，最多积累 capacity 个（允许的突发量）"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """
+        Args:
+            rate: 每秒发放的令牌数
+            capacity: 桶容量，默认为 max(1, rate)
+        """
+        if rate <= 0:
+            raise ValueError("rate 必须大于0")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0):
+        """取出令牌，不足时阻塞等待"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# 进度回调: (已完成文件数, 文件总数, 文件路径, 该文件的结果)，返回False时取消剩余文件
+ProgressCallback = Callable[[int, int, str, Dict[str, Any]], Optional[bool]]
+
+
+class IngestPipeline:
+    """Markdown文件并发导入"""
+
+    def __init__(self,
+                 vector_db,
+                 workers: int = 4,
+                 max_pending: Optional[int] = None,
+                 write_batch_size: int = 256,
+                 flush_interval: float = 0.5):
+        """
+        Args:
+            vector_db: OpenAIMarkdownVectorDB 实例，嵌入限流使用其 rate_limiter
+            workers: 读取分块和嵌入的线程数
+            max_pending: 已开始处理但尚未写入的最大文件数，默认为 workers 的两倍
+            write_batch_size: 每次写入向量数据库的文档块数
+            flush_interval: 待写入的计划最长等待时间（秒），未达到批次大小时到时也写入
+        """
+        self.vector_db = vector_db
+        self.workers = max(1, workers)
+        self.max_pending = max_pending or self.workers * 2
+        self.write_batch_size = write_batch_size
+        self.flush_interval = flush_interval
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        """取消尚未开始处理的文件，正在处理的文件会处理完毕"""
+        self._cancel.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def _prepare(self, file_path: str, force: bool) -> Dict[str, Any]:
+        """读取、分块并嵌入单个文件，返回待写入的同步计划"""
+        try:
+            plan = self.vector_db.plan_markdown_sync(file_path, force)
+            if "result" not in plan:
+                self.vector_db.embed_sync_plan(plan)
+            return plan
+        except Exception as e:
+            return {"file_path": file_path, "result": {"success": False, "error": str(e)}}
+
+    def run(self,
+            file_paths: List[str],
+            on_progress: Optional[ProgressCallback] = None,
+            force: bool = False) -> List[Dict[str, Any]]:
+        """
+        并发导入文件
+
+        Args:
+            file_paths: Markdown文件路径
+            on_progress: 每个文件完成时的回调，在调用线程中执行
+            force: 忽略导入清单，重新嵌入全部文档块
+
+        Returns:
+            List[Dict]: 与 file_paths 顺序一致的各文件结果，被取消的文件 cancelled 为True
+        """
+        self._cancel.clear()
+        total = len(file_paths)
+        results: Dict[int, Dict[str, Any]] = {}
+        ready: "queue.Queue" = queue.Queue()
+        # 限制在途文件数（开始处理到写入完成）：写入跟不上时暂停提交，避免已分块和嵌入的数据在内存中堆积
+        slots = threading.BoundedSemaphore(self.max_pending)
+
+        def prepare(position: int, file_path: str):
+            ready.put((position, self._prepare(file_path, force)))
+
+        def submit(executor: ThreadPoolExecutor):
+            for position, file_path in enumerate(file_paths):
+                slots.acquire()
+                if self._cancel.is_set():
+                    ready.put((position, {"file_path": file_path, "result": {
+                        "success": False, "error": "已取消", "cancelled": True
+                    }}))
+                else:
+                    executor.submit(prepare, position, file_path)
+
+        def finish(position: int, result: Dict[str, Any]):
+            results[position] = result
+            slots.release()
+            if on_progress and on_progress(len(results), total, file_paths[position], result) is False:
+                self.cancel()
+
+        pending: List = []
+        oldest = 0.0
+
+        def flush():
+            if not pending:
+                return
+            plans = [plan for _, plan in pending]
+            for (position, _), result in zip(pending, self.vector_db.apply_sync_plans(plans, self.write_batch_size)):
+                finish(position, result)
+            pending.clear()
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="md-ingest") as executor:
+            submitter = threading.Thread(target=submit, args=(executor,), daemon=True)
+            submitter.start()
+            while len(results) < total:
+                # 多个文件的计划合并写入：达到批次大小、剩余文件都已就绪或等待超过 flush_interval 时才写入
+                timeout = max(0.0, oldest + self.flush_interval - time.monotonic()) if pending else None
+                try:
+                    position, plan = ready.get(timeout=timeout)
+                except queue.Empty:
+                    flush()
+                    continue
+                if "result" in plan:
+                    finish(position, plan["result"])
+                else:
+                    if not pending:
+                        oldest = time.monotonic()
+                    pending.append((position, plan))
+                if (len(pending) >= self.max_pending
+                        or len(results) + len(pending) >= total
+                        or sum(len(p["added"]) for _, p in pending) >= self.write_batch_size):
+                    flush()
+            submitter.join()
+
+        return [results[position] for position in range(total)]
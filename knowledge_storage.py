@@ -0,0 +1,352 @@
+"""
+知识库存储后端
+JSON后端整体重写文件；SQLite后端（WAL模式）按行写入任务经验、截图知识、操作和使用计数
+
+用法（将已有JSON知识库迁移到SQLite）:
+    python knowledge_storage.py knowledge_base
+"""
+
+import os
+import json
+import sqlite3
+import argparse
+import tempfile
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Set, Tuple
+
+EXPERIENCE_FILE = "task_experiences.json"
+SCREENSHOT_FILE = "screenshot_knowledge.json"
+SQLITE_FILE = "knowledge.db"
+
+TASK_JSON_FIELDS = ("screenshots", "thoughts", "action_usefulness")
+SCREENSHOT_JSON_FIELDS = ("successful_actions", "failed_actions", "ui_elements", "similarity_tags")
+
+
+@dataclass
+class KnowledgeChanges:
+    """自上次保存以来发生变化的知识条目"""
+    tasks: Dict[str, Any] = field(default_factory=dict)  # 新增或修改的任务经验
+    screenshots: Dict[str, Any] = field(default_factory=dict)  # 新增或修改的截图知识
+    task_counters: Dict[str, Any] = field(default_factory=dict)  # 只有使用计数变化的任务经验
+    screenshot_counters: Dict[str, Any] = field(default_factory=dict)  # 只有使用计数变化的截图知识
+    deleted_tasks: Set[str] = field(default_factory=set)
+    deleted_screenshots: Set[str] = field(default_factory=set)
+
+    def is_empty(self) -> bool:
+        return not (self.tasks or self.screenshots or self.task_counters or
+                    self.screenshot_counters or self.deleted_tasks or self.deleted_screenshots)
+
+    def delete_tasks(self, task_ids: Set[str]):
+        """记录删除的任务经验，并丢弃它们尚未写入的修改"""
+        for task_id in task_ids:
+            self.tasks.pop(task_id, None)
+            self.task_counters.pop(task_id, None)
+        self.deleted_tasks |= task_ids
+
+    def delete_screenshots(self, screenshot_ids: Set[str]):
+        """记录删除的截图知识，并丢弃它们尚未写入的修改"""
+        for screenshot_id in screenshot_ids:
+            self.screenshots.pop(screenshot_id, None)
+            self.screenshot_counters.pop(screenshot_id, None)
+        self.deleted_screenshots |= screenshot_ids
+
+    def merge(self, newer: "KnowledgeChanges"):
+        """合并之后发生的变化（保存失败时把未写入的变化放回）"""
+        self.tasks.update(newer.tasks)
+        self.screenshots.update(newer.screenshots)
+        self.task_counters.update(newer.task_counters)
+        self.screenshot_counters.update(newer.screenshot_counters)
+        self.deleted_tasks = (self.deleted_tasks - set(newer.tasks)) | newer.deleted_tasks
+        self.deleted_screenshots = (self.deleted_screenshots - set(newer.screenshots)) | newer.deleted_screenshots
+        for task_id in newer.deleted_tasks:
+            self.tasks.pop(task_id, None)
+            self.task_counters.pop(task_id, None)
+        for screenshot_id in newer.deleted_screenshots:
+            self.screenshots.pop(screenshot_id, None)
+            self.screenshot_counters.pop(screenshot_id, None)
+
+
+def atomic_write(path: str, data: bytes):
+    """原子写入文件：先写同目录临时文件并刷盘，再替换目标文件"""
+    directory = os.path.dirname(path) or "."
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    # 目录项刷盘，保证重命名在崩溃后仍然生效
+    if hasattr(os, "O_DIRECTORY"):
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+class JSONKnowledgeStorage:
+    """JSON文件存储，有任何变化时整体重写"""
+
+    name = "json"
+
+    def __init__(self, knowledge_dir: str):
+        self.knowledge_dir = knowledge_dir
+        self.experience_file = os.path.join(knowledge_dir, EXPERIENCE_FILE)
+        self.screenshot_file = os.path.join(knowledge_dir, SCREENSHOT_FILE)
+
+    def load(self) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """读取全部任务经验和截图知识"""
+        tasks, screenshots = [], []
+        if os.path.exists(self.experience_file):
+            with open(self.experience_file, 'r', encoding='utf-8') as f:
+                tasks = json.load(f)
+        if os.path.exists(self.screenshot_file):
+            with open(self.screenshot_file, 'r', encoding='utf-8') as f:
+                screenshots = json.load(f)
+        return tasks, screenshots
+
+    def save(self, tasks: List[Any], screenshots: List[Any], changes: KnowledgeChanges):
+        """原子重写全部数据"""
+        if changes.tasks or changes.task_counters or changes.deleted_tasks or not os.path.exists(self.experience_file):
+            atomic_write(self.experience_file, json.dumps(
+                [exp.to_dict() for exp in tasks], ensure_ascii=False, indent=2
+            ).encode("utf-8"))
+        if (changes.screenshots or changes.screenshot_counters or changes.deleted_screenshots
+                or not os.path.exists(self.screenshot_file)):
+            atomic_write(self.screenshot_file, json.dumps(
+                [sk.to_dict() for sk in screenshots], ensure_ascii=False, indent=2
+            ).encode("utf-8"))
+
+    def size_bytes(self) -> int:
+        return sum(os.path.getsize(p) for p in (self.experience_file, self.screenshot_file) if os.path.exists(p))
+
+    def close(self):
+        pass
+
+
+class SQLiteKnowledgeStorage:
+    """SQLite存储（WAL模式），只写入发生变化的行"""
+
+    name = "sqlite"
+
+    def __init__(self, knowledge_dir: str):
+        self.knowledge_dir = knowledge_dir
+        self.db_file = os.path.join(knowledge_dir, SQLITE_FILE)
+        self.created = not os.path.exists(self.db_file)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS experiences (
+                task_id TEXT PRIMARY KEY,
+                task_description TEXT,
+                task_goal TEXT,
+                success INTEGER,
+                total_steps INTEGER,
+                total_tokens INTEGER,
+                screenshots TEXT,
+                thoughts TEXT,
+                action_usefulness TEXT,
+                error_message TEXT,
+                created_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS screenshots (
+                screenshot_id TEXT PRIMARY KEY,
+                screenshot_path TEXT,
+                screenshot_base64 TEXT,
+                task_context TEXT,
+                successful_actions TEXT,
+                failed_actions TEXT,
+                ui_elements TEXT,
+                similarity_tags TEXT,
+                created_at REAL,
+                screenshot_digest TEXT
+            );
+            CREATE TABLE IF NOT EXISTS actions (
+                task_id TEXT,
+                position INTEGER,
+                action TEXT,
+                PRIMARY KEY (task_id, position)
+            );
+            CREATE TABLE IF NOT EXISTS counters (
+                kind TEXT,
+                item_id TEXT,
+                usage_count INTEGER DEFAULT 0,
+                failure_count INTEGER DEFAULT 0,
+                PRIMARY KEY (kind, item_id)
+            );
+        """)
+        # 旧版本数据库没有截图摘要列
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(screenshots)")}
+        if "screenshot_digest" not in columns:
+            self._conn.execute("ALTER TABLE screenshots ADD COLUMN screenshot_digest TEXT")
+        self._conn.commit()
+
+    def load(self) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """按插入顺序读取全部任务经验和截图知识"""
+        with self._lock:
+            self._conn.row_factory = sqlite3.Row
+            try:
+                counters = {
+                    (row["kind"], row["item_id"]): (row["usage_count"], row["failure_count"])
+                    for row in self._conn.execute("SELECT * FROM counters")
+                }
+                actions: Dict[str, List[Dict]] = {}
+                for row in self._conn.execute("SELECT task_id, action FROM actions ORDER BY task_id, position"):
+                    actions.setdefault(row["task_id"], []).append(json.loads(row["action"]))
+
+                tasks = []
+                for row in self._conn.execute("SELECT * FROM experiences ORDER BY rowid"):
+                    item = dict(row)
+                    item["success"] = bool(item["success"])
+                    for name in TASK_JSON_FIELDS:
+                        item[name] = json.loads(item[name]) if item[name] is not None else None
+                    item["actions"] = actions.get(item["task_id"], [])
+                    item["usage_count"], item["failure_count"] = counters.get(("task", item["task_id"]), (0, 0))
+                    tasks.append(item)
+
+                screenshots = []
+                for row in self._conn.execute("SELECT * FROM screenshots ORDER BY rowid"):
+                    item = dict(row)
+                    for name in SCREENSHOT_JSON_FIELDS:
+                        item[name] = json.loads(item[name]) if item[name] is not None else None
+                    item["usage_count"], item["failure_count"] = counters.get(
+                        ("screenshot", item["screenshot_id"]), (0, 0)
+                    )
+                    screenshots.append(item)
+            finally:
+                self._conn.row_factory = None
+        return tasks, screenshots
+
+    def _upsert_task(self, exp):
+        self._conn.execute(
+            "INSERT INTO experiences (task_id, task_description, task_goal, success, total_steps, total_tokens, "
+            "screenshots, thoughts, action_usefulness, error_message, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(task_id) DO UPDATE SET task_description=excluded.task_description, "
+            "task_goal=excluded.task_goal, success=excluded.success, total_steps=excluded.total_steps, "
+            "total_tokens=excluded.total_tokens, screenshots=excluded.screenshots, thoughts=excluded.thoughts, "
+            "action_usefulness=excluded.action_usefulness, error_message=excluded.error_message, "
+            "created_at=excluded.created_at",
+            (exp.task_id, exp.task_description, exp.task_goal, int(exp.success), exp.total_steps,
+             exp.total_tokens, *(json.dumps(getattr(exp, name), ensure_ascii=False) for name in TASK_JSON_FIELDS),
+             exp.error_message, exp.created_at)
+        )
+        self._conn.execute("DELETE FROM actions WHERE task_id = ?", (exp.task_id,))
+        self._conn.executemany(
+            "INSERT INTO actions (task_id, position, action) VALUES (?, ?, ?)",
+            [(exp.task_id, i, json.dumps(action, ensure_ascii=False)) for i, action in enumerate(exp.actions)]
+        )
+        self._upsert_counter("task", exp.task_id, exp)
+
+    def _upsert_screenshot(self, sk):
+        self._conn.execute(
+            "INSERT INTO screenshots (screenshot_id, screenshot_path, screenshot_base64, task_context, "
+            "successful_actions, failed_actions, ui_elements, similarity_tags, created_at, screenshot_digest) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(screenshot_id) DO UPDATE SET screenshot_path=excluded.screenshot_path, "
+            "screenshot_base64=excluded.screenshot_base64, task_context=excluded.task_context, "
+            "successful_actions=excluded.successful_actions, failed_actions=excluded.failed_actions, "
+            "ui_elements=excluded.ui_elements, similarity_tags=excluded.similarity_tags, "
+            "created_at=excluded.created_at, screenshot_digest=excluded.screenshot_digest",
+            (sk.screenshot_id, sk.screenshot_path, sk.screenshot_base64, sk.task_context,
+             *(json.dumps(getattr(sk, name), ensure_ascii=False) for name in SCREENSHOT_JSON_FIELDS),
+             sk.created_at, sk.screenshot_digest)
+        )
+        self._upsert_counter("screenshot", sk.screenshot_id, sk)
+
+    def _upsert_counter(self, kind: str, item_id: str, item):
+        self._conn.execute(
+            "INSERT INTO counters (kind, item_id, usage_count, failure_count) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(kind, item_id) DO UPDATE SET usage_count=excluded.usage_count, "
+            "failure_count=excluded.failure_count",
+            (kind, item_id, item.usage_count, item.failure_count)
+        )
+
+    def save(self, tasks: List[Any], screenshots: List[Any], changes: KnowledgeChanges):
+        """在一个事务中写入变化的行（计数变化按ID更新，不遍历全部记录）"""
+        with self._lock, self._conn:
+            for task_id in changes.deleted_tasks:
+                self._conn.execute("DELETE FROM experiences WHERE task_id = ?", (task_id,))
+                self._conn.execute("DELETE FROM actions WHERE task_id = ?", (task_id,))
+                self._conn.execute("DELETE FROM counters WHERE kind = 'task' AND item_id = ?", (task_id,))
+            for screenshot_id in changes.deleted_screenshots:
+                self._conn.execute("DELETE FROM screenshots WHERE screenshot_id = ?", (screenshot_id,))
+                self._conn.execute("DELETE FROM counters WHERE kind = 'screenshot' AND item_id = ?", (screenshot_id,))
+            for exp in changes.tasks.values():
+                self._upsert_task(exp)
+            for sk in changes.screenshots.values():
+                self._upsert_screenshot(sk)
+            for task_id, exp in changes.task_counters.items():
+                if task_id not in changes.tasks:
+                    self._upsert_counter("task", task_id, exp)
+            for screenshot_id, sk in changes.screenshot_counters.items():
+                if screenshot_id not in changes.screenshots:
+                    self._upsert_counter("screenshot", screenshot_id, sk)
+
+    def size_bytes(self) -> int:
+        return sum(
+            os.path.getsize(p) for p in (self.db_file, self.db_file + "-wal") if os.path.exists(p)
+        )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+STORAGE_BACKENDS = {
+    "json": JSONKnowledgeStorage,
+    "sqlite": SQLiteKnowledgeStorage,
+}
+
+
+def create_storage(backend: str, knowledge_dir: str):
+    """按名称创建存储后端"""
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"不支持的存储后端: {backend}，可选: {', '.join(STORAGE_BACKENDS)}")
+    return STORAGE_BACKENDS[backend](knowledge_dir)
+
+
+def migrate_json_to_sqlite(knowledge_dir: str) -> Dict[str, int]:
+    """
+    将JSON知识库一次性迁移到SQLite
+
+    Args:
+        knowledge_dir: 知识库目录
+
+    Returns:
+        迁移的任务经验和截图知识数量
+    """
+    from rag_knowledge_base import TaskExperience, ScreenshotKnowledge
+
+    tasks, screenshots = JSONKnowledgeStorage(knowledge_dir).load()
+    tasks = [TaskExperience(**item) for item in tasks]
+    screenshots = [ScreenshotKnowledge(**item) for item in screenshots]
+    storage = SQLiteKnowledgeStorage(knowledge_dir)
+    try:
+        storage.save(tasks, screenshots, KnowledgeChanges(
+            tasks={exp.task_id: exp for exp in tasks},
+            screenshots={sk.screenshot_id: sk for sk in screenshots}
+        ))
+    finally:
+        storage.close()
+    print(f"✅ 已迁移 {len(tasks)} 条任务经验和 {len(screenshots)} 条截图知识到 {storage.db_file}")
+    return {"tasks": len(tasks), "screenshots": len(screenshots)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="将JSON知识库迁移到SQLite")
+    parser.add_argument("knowledge_dir", nargs="?", default="knowledge_base", help="知识库目录")
+    args = parser.parse_args()
+    migrate_json_to_sqlite(args.knowledge_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,66 +1,186 @@
 import re
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Union
 import os
 import json
 import chromadb
 from chromadb.config import Settings
 import tiktoken
-import openai
-from openai import OpenAI
+
+from embedding_backends import EmbeddingBackend, create_embedding_backend
+from embedding_cache import EmbeddingCache
+from ingest_pipeline import IngestPipeline, ProgressCallback, TokenBucket
+from ingest_manifest import IngestManifest, chunk_digest, content_digest, file_key, make_chunk_ids
+
+# 默认嵌入模型沿用原有的集合和导入清单，其他后端或维度各自使用独立的集合
+DEFAULT_COLLECTION = "markdown_documents"
+DEFAULT_EMBEDDING_MODEL = "text-embedding-v4"
+# 嵌入请求默认速率上限（每秒请求数），多线程导入时避免触发接口限流
+DEFAULT_REQUESTS_PER_SECOND = 5.0
 
 class OpenAIMarkdownVectorDB:
     """使用纯OpenAI API的Markdown向量数据库"""
     
     def __init__(self, 
                  persist_directory: str = "./openai_markdown_db",
-                 embedding_model: str = "text-embedding-v4",
-                 api_key: Optional[str] = None):
-        
+                 embedding_model: str = DEFAULT_EMBEDDING_MODEL,
+                 api_key: Optional[str] = None,
+                 embedding_batch_size: int = 10,
+                 max_batch_tokens: int = 8192,
+                 max_retries: int = 3,
+                 embedding_cache: Optional[EmbeddingCache] = None,
+                 use_embedding_cache: bool = True,
+                 requests_per_second: Optional[float] = DEFAULT_REQUESTS_PER_SECOND,
+                 embedding_backend: Union[str, EmbeddingBackend] = "dashscope",
+                 embedding_dimension: Optional[int] = None):
+        """
+        Args:
+            persist_directory: Chroma数据目录
+            embedding_model: 嵌入模型名称（dashscope 后端）
+            api_key: API Key
+            embedding_batch_size: 每次嵌入请求最多包含的文本数
+            max_batch_tokens: 每次嵌入请求最多包含的token数，超出时拆成多个请求
+            max_retries: 每个批次请求失败后的最大重试次数
+            embedding_cache: 嵌入向量缓存，为None时在数据目录下创建（仅远程后端）
+            use_embedding_cache: 是否使用嵌入向量缓存
+            requests_per_second: 嵌入请求的速率上限（令牌桶限流），为None或0时不限流
+            embedding_backend: 嵌入后端名称（dashscope 或 hashing）或 EmbeddingBackend 实例；
+                hashing 为本地字符n-gram哈希向量，不需要网络；
+                传入的远程后端实例未设置限流器时使用 requests_per_second 的限流器
+            embedding_dimension: 向量维度，hashing 默认512，dashscope 默认使用模型维度
+        """
+    
         self.persist_directory = persist_directory
-        self.embedding_model = embedding_model
-        self.api_key = api_key or "sk-1b79273a7a7347349e7ce57275ab0c8c"
-        
-        if not self.api_key:
-            raise ValueError("OpenAI API密钥未提供，请设置OPENAI_API_KEY环境变量或传入api_key参数")
-        
-        # 初始化OpenAI客户端
-        self.client = OpenAI(api_key=self.api_key, base_url="https://dashscope.aliyuncs.com/compatible-mode/v1")
-        
+        self.embedding_batch_size = max(1, embedding_batch_size)
+        self.max_batch_tokens = max_batch_tokens
+        self.rate_limiter = TokenBucket(requests_per_second) if requests_per_second else None
+        if isinstance(embedding_backend, str):
+            embedding_backend = create_embedding_backend(
+                embedding_backend, embedding_model, api_key, embedding_dimension, max_retries, self.rate_limiter
+            )
+        elif embedding_backend.remote:
+            if embedding_backend.rate_limiter is None:
+                embedding_backend.rate_limiter = self.rate_limiter
+            self.rate_limiter = embedding_backend.rate_limiter
+        self.embedding_backend = embedding_backend
+        self.embedding_model = embedding_backend.model_name
+    
+        # 本地后端计算比读取缓存更快，默认不创建缓存
+        if use_embedding_cache and embedding_cache is None and embedding_backend.remote:
+            embedding_cache = EmbeddingCache(os.path.join(persist_directory, "embedding_cache.db"))
+        self.embedding_cache = embedding_cache if use_embedding_cache else None
+    
         # 初始化Chroma客户端
         self.chroma_client = chromadb.PersistentClient(
             path=persist_directory,
             settings=Settings(anonymized_telemetry=False)
         )
-        
-        # 获取或创建集合
+    
+        # 获取或创建集合，不同后端和维度的向量不能混在同一个集合中
+        if embedding_backend.name == "dashscope" and self.embedding_model == DEFAULT_EMBEDDING_MODEL:
+            self.collection_name = DEFAULT_COLLECTION
+            manifest_file = "ingest_manifest.json"
+            metadata = {"description": "Markdown文档向量数据库"}
+        else:
+            self.collection_name = f"{DEFAULT_COLLECTION}_{embedding_backend.collection_suffix()}"
+            manifest_file = f"ingest_manifest_{self.collection_name}.json"
+            metadata = {
+                "description": "Markdown文档向量数据库",
+                "embedding_backend": embedding_backend.name,
+                "embedding_model": self.embedding_model,
+                "hnsw:space": "cosine"
+            }
+            if embedding_backend.dimension:
+                metadata["embedding_dimension"] = embedding_backend.dimension
         self.collection = self.chroma_client.get_or_create_collection(
-            name="markdown_documents",
-            metadata={"description": "Markdown文档向量数据库"}
+            name=self.collection_name,
+            metadata=metadata
         )
-        
-        # 初始化tokenizer用于计算token数量
-        self.encoding = tiktoken.get_encoding("cl100k_base")
     
-    def get_embedding(self, text: str) -> List[float]:
-        """使用OpenAI API获取文本嵌入向量"""
+        # 导入清单，用于增量同步（与集合一一对应）
+        self.manifest = IngestManifest(os.path.join(persist_directory, manifest_file))
+    
+        # 初始化tokenizer用于计算token数量；离线环境无法下载词表时按字符数估算
         try:
-            # 清理文本
-            text = text.replace("\n", " ").strip()
-            if len(text) > 8192:  # OpenAI模型的最大token限制
-                text = text[:8192]
-            
-            response = self.client.embeddings.create(
-                model=self.embedding_model,
-                input=text
-            )
-            return response.data[0].embedding
+            self.encoding = tiktoken.get_encoding("cl100k_base")
         except Exception as e:
-            print(f"获取嵌入向量失败: {e}")
-            # 返回零向量作为fallback
-            return [0.0] * 1536  # text-embedding-3-small的维度
+            print(f"⚠️ 加载tokenizer失败，按字符数估算token数量: {e}")
+            self.encoding = None
+    
+    @staticmethod
+    def _prepare_text(text: str) -> str:
+        """清理待嵌入的文本"""
+        text = text.replace("\n", " ").strip()
+        if len(text) > 8192:  # OpenAI模型的最大token限制
+            text = text[:8192]
+        return text
+    
+    def get_embedding(self, text: str) -> List[float]:
+        """
+        获取单个文本的嵌入向量（优先读取缓存）
+    
+        Raises:
+            嵌入失败时抛出异常
+        """
+        return self.get_embeddings([text])[0]
+    
+    def _make_batches(self, texts: List[str]) -> List[List[int]]:
+        """按文本数量和token数量把文本分成批次，返回每批的文本下标"""
+        if not self.embedding_backend.remote:
+            # 本地后端没有请求大小限制，一次计算全部文本
+            return [list(range(len(texts)))] if texts else []
+        batches = []
+        current, current_tokens = [], 0
+        for i, text in enumerate(texts):
+            tokens = self.count_tokens(text)
+            if current and (len(current) >= self.embedding_batch_size
+                            or current_tokens + tokens > self.max_batch_tokens):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(i)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+    
+    def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """
+        批量获取文本嵌入向量
+        
+        Args:
+            texts: 文本列表
+            
+        Returns:
+            List[List[float]]: 与输入顺序一致的嵌入向量
+        
+        Raises:
+            某个批次重试后仍失败时抛出最后一次的异常
+        """
+        texts = [self._prepare_text(text) for text in texts]
+        if self.embedding_cache is not None:
+            embeddings = self.embedding_cache.get_many(self.embedding_model, texts)
+        else:
+            embeddings = [None] * len(texts)
+        
+        # 只请求缓存未命中的文本，相同文本只请求一次
+        missing: Dict[str, List[int]] = {}
+        for i, embedding in enumerate(embeddings):
+            if embedding is None:
+                missing.setdefault(texts[i], []).append(i)
+        pending = list(missing)
+        for batch in self._make_batches(pending):
+            batch_texts = [pending[i] for i in batch]
+            batch_embeddings = self.embedding_backend.embed(batch_texts)
+            if self.embedding_cache is not None:
+                self.embedding_cache.put_many(self.embedding_model, batch_texts, batch_embeddings)
+            for text, embedding in zip(batch_texts, batch_embeddings):
+                for i in missing[text]:
+                    embeddings[i] = embedding
+        return embeddings
     
     def count_tokens(self, text: str) -> int:
         """计算文本的token数量"""
+        if self.encoding is None:
+            return len(text)
         return len(self.encoding.encode(text))
     
     def split_markdown_content(self, md_content: str) -> List[Dict[str, Any]]:
@@ -142,69 +262,235 @@ class OpenAIMarkdownVectorDB:
         
         return chunks
     
-    def read_markdown_file(self, file_path: str) -> str:
-        """读取Markdown文件"""
+    @staticmethod
+    def _decode_markdown(data: bytes) -> str:
+        """解码Markdown文件内容，UTF-8失败时按GBK解码"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                return file.read()
+            return data.decode('utf-8')
         except UnicodeDecodeError:
-            with open(file_path, 'r', encoding='gbk') as file:
-                return file.read()
+            return data.decode('gbk')
+    
+    def read_markdown_file(self, file_path: str) -> str:
+        """读取Markdown文件"""
+        with open(file_path, 'rb') as file:
+            return self._decode_markdown(file.read())
     
     def add_markdown_file(self, file_path: str) -> Dict[str, Any]:
-        """添加Markdown文件到向量数据库"""
-        if not os.path.exists(file_path):
-            return {"success": False, "error": f"文件不存在: {file_path}"}
+        """添加Markdown文件到向量数据库（已导入过的文件增量更新）"""
+        return self.sync_markdown_file(file_path)
+    
+    def _legacy_chunk_ids(self, file_path: str) -> List[str]:
+        """
+        没有清单记录的文件在向量数据库中已有的文档块ID（旧版本按 <文件名>_<序号> 导入），
+        按 source 的完整路径匹配；文件没有清单记录，这些文档块不属于任何已记录的文件
+        """
+        existing = self.collection.get(where={"file_name": os.path.basename(file_path)}, include=["metadatas"])
+        key = file_key(file_path)
+        return [
+            chunk_id for chunk_id, metadata in zip(existing.get('ids', []), existing.get('metadatas') or [])
+            if metadata and file_key(metadata.get("source", "")) == key
+        ]
+    
+    def sync_markdown_file(self, file_path: str, force: bool = False) -> Dict[str, Any]:
+        """
+        增量同步Markdown文件：与导入清单比较，只嵌入新增或修改的文档块，删除已不存在的文档块
         
+        Args:
+            file_path: Markdown文件路径
+            force: 忽略清单，重新嵌入全部文档块
+            
+        Returns:
+            Dict: 处理结果，added/updated/deleted 为新增、位置变化、删除的文档块数，
+                  unchanged 表示文件未修改而跳过
+        """
         try:
-            content = self.read_markdown_file(file_path)
-            chunks = self.split_markdown_content(content)
-            
-            if not chunks:
-                return {"success": False, "error": "文件内容为空或无法分块"}
-            
-            # 准备数据
-            documents = []
-            metadatas = []
-            ids = []
-            embeddings = []
-            
-            for i, chunk in enumerate(chunks):
-                chunk_id = f"{os.path.basename(file_path)}_{i}"
-                
-                # 获取嵌入向量
-                embedding = self.get_embedding(chunk['content'])
-                
-                documents.append(chunk['content'])
-                metadatas.append({
-                    "title": chunk['title'],
-                    "source": file_path,
-                    "chunk_id": i,
-                    "token_count": chunk['token_count'],
-                    "file_name": os.path.basename(file_path)
-                })
-                ids.append(chunk_id)
-                embeddings.append(embedding)
-            
-            # 添加到向量数据库
-            self.collection.add(
-                embeddings=embeddings,
-                documents=documents,
-                metadatas=metadatas,
-                ids=ids
-            )
-            
-            total_tokens = sum(chunk['token_count'] for chunk in chunks)
-            
-            return {
-                "success": True,
-                "chunks_processed": len(chunks),
+            plan = self.plan_markdown_sync(file_path, force)
+            if "result" in plan:
+                return plan["result"]
+            self.embed_sync_plan(plan)
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+        return self.apply_sync_plans([plan])[0]
+    
+    def plan_markdown_sync(self, file_path: str, force: bool = False) -> Dict[str, Any]:
+        """
+        读取并分块文件，与导入清单比较得到同步计划（不请求嵌入接口，不写入向量数据库）
+        
+        Returns:
+            Dict: 同步计划；无需写入时只包含 file_path 和 result，
+                  只有修改时间变化时 unchanged 为True，由 apply_sync_plans 更新清单记录
+        """
+        if not os.path.exists(file_path):
+            return {"file_path": file_path, "result": {"success": False, "error": f"文件不存在: {file_path}"}}
+        
+        file_name = os.path.basename(file_path)
+        stat = os.stat(file_path)
+        entry = None if force else self.manifest.get(file_path)
+        
+        # 修改时间和大小都未变化时不读取文件
+        if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+            return {"file_path": file_path, "result": self._unchanged_result(entry)}
+        
+        with open(file_path, 'rb') as file:
+            data = file.read()
+        file_digest = content_digest(data)
+        if entry and entry["file_digest"] == file_digest:
+            return self._empty_plan(file_path, file_name, [], dict(entry, mtime=stat.st_mtime, size=stat.st_size),
+                                    unchanged=True)
+        
+        chunks = self.split_markdown_content(self._decode_markdown(data))
+        digests = [chunk_digest(chunk['title'], chunk['content']) for chunk in chunks]
+        ids = make_chunk_ids(file_path, digests)
+        
+        # 清单中的旧文档块；没有清单记录时清理旧版本导入的文档块
+        old_entry = self.manifest.get(file_path)
+        old_positions = {chunk["id"]: i for i, chunk in enumerate(old_entry["chunks"])} if old_entry else {}
+        stale_ids = set(old_positions) - set(ids)
+        if not old_entry:
+            stale_ids |= set(self._legacy_chunk_ids(file_path)) - set(ids)
+        
+        if not chunks:
+            # 文件已清空：旧文档块的删除和清单记录的移除都留给 apply_sync_plans 执行
+            return self._empty_plan(file_path, file_name, sorted(stale_ids), None)
+        
+        total_tokens = sum(chunk['token_count'] for chunk in chunks)
+        return {
+            "file_path": file_path,
+            "file_name": file_name,
+            "chunks": chunks,
+            "ids": ids,
+            "metadatas": [{
+                "title": chunk['title'],
+                "source": file_path,
+                "chunk_id": i,
+                "token_count": chunk['token_count'],
+                "file_name": file_name,
+                "chunk_digest": digests[i]
+            } for i, chunk in enumerate(chunks)],
+            "added": [i for i, chunk_id in enumerate(ids) if force or chunk_id not in old_positions],
+            "moved": [i for i, chunk_id in enumerate(ids)
+                      if not force and chunk_id in old_positions and old_positions[chunk_id] != i],
+            "stale_ids": sorted(stale_ids),
+            "total_tokens": total_tokens,
+            "manifest_entry": {
+                "file_name": file_name,
+                "source": file_path,
+                "file_digest": file_digest,
+                "mtime": stat.st_mtime,
+                "size": stat.st_size,
                 "total_tokens": total_tokens,
-                "file_name": os.path.basename(file_path)
+                "chunks": [{"id": chunk_id, "digest": digest} for chunk_id, digest in zip(ids, digests)]
             }
+        }
+    
+    @staticmethod
+    def _empty_plan(file_path: str,
+                    file_name: str,
+                    stale_ids: List[str],
+                    manifest_entry: Optional[Dict[str, Any]],
+                    unchanged: bool = False) -> Dict[str, Any]:
+        """不写入文档块的同步计划：只删除 stale_ids 并更新（manifest_entry 为None时移除）清单记录"""
+        return {
+            "file_path": file_path,
+            "file_name": file_name,
+            "chunks": [],
+            "ids": [],
+            "metadatas": [],
+            "added": [],
+            "moved": [],
+            "stale_ids": stale_ids,
+            "total_tokens": 0,
+            "manifest_entry": manifest_entry,
+            "unchanged": unchanged
+        }
+    
+    def embed_sync_plan(self, plan: Dict[str, Any]):
+        """为同步计划中新增或修改的文档块批量获取嵌入向量"""
+        plan["embeddings"] = self.get_embeddings([plan["chunks"][i]['content'] for i in plan["added"]])
+    
+    def apply_sync_plans(self, plans: List[Dict[str, Any]], write_batch_size: int = 256) -> List[Dict[str, Any]]:
+        """
+        将已嵌入的同步计划批量写入向量数据库并更新导入清单
+        
+        Args:
+            plans: embed_sync_plan 处理过的同步计划
+            write_batch_size: 每次写入向量数据库的文档块数
             
+        Returns:
+            List[Dict]: 与 plans 顺序一致的各文件处理结果
+        """
+        try:
+            # 新增或修改的文档块：合并多个文件后分批写入
+            rows = [
+                (plan["ids"][i], embedding, plan["chunks"][i]['content'], plan["metadatas"][i])
+                for plan in plans for i, embedding in zip(plan["added"], plan["embeddings"])
+            ]
+            for start in range(0, len(rows), write_batch_size):
+                batch = rows[start:start + write_batch_size]
+                self.collection.upsert(
+                    ids=[row[0] for row in batch],
+                    embeddings=[row[1] for row in batch],
+                    documents=[row[2] for row in batch],
+                    metadatas=[row[3] for row in batch]
+                )
+            # 内容未变、位置变化的文档块只更新元数据
+            moved = [(plan["ids"][i], plan["metadatas"][i]) for plan in plans for i in plan["moved"]]
+            if moved:
+                self.collection.update(ids=[row[0] for row in moved], metadatas=[row[1] for row in moved])
+            stale_ids = [chunk_id for plan in plans for chunk_id in plan["stale_ids"]]
+            if stale_ids:
+                self.collection.delete(ids=stale_ids)
+            self.manifest.set_many({
+                plan["file_path"]: plan["manifest_entry"] for plan in plans if plan["manifest_entry"] is not None
+            })
+            for plan in plans:
+                if plan["manifest_entry"] is None:
+                    self.manifest.remove(plan["file_path"])
         except Exception as e:
-            return {"success": False, "error": str(e)}
+            return [{"success": False, "error": str(e)} for _ in plans]
+        
+        return [self._plan_result(plan) for plan in plans]
+    
+    def _plan_result(self, plan: Dict[str, Any]) -> Dict[str, Any]:
+        """已写入的同步计划对应的文件处理结果"""
+        if plan["manifest_entry"] is None:
+            return {"success": False, "error": "文件内容为空或无法分块", "deleted": len(plan["stale_ids"])}
+        if plan.get("unchanged"):
+            return self._unchanged_result(plan["manifest_entry"])
+        return {
+            "success": True,
+            "chunks_processed": len(plan["chunks"]),
+            "total_tokens": plan["total_tokens"],
+            "file_name": plan["file_name"],
+            "added": len(plan["added"]),
+            "updated": len(plan["moved"]),
+            "deleted": len(plan["stale_ids"]),
+            "unchanged": False
+        }
+    
+    @staticmethod
+    def _unchanged_result(entry: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "success": True,
+            "chunks_processed": len(entry["chunks"]),
+            "total_tokens": entry.get("total_tokens", 0),
+            "file_name": entry["file_name"],
+            "added": 0,
+            "updated": 0,
+            "deleted": 0,
+            "unchanged": True
+        }
+    
+    def remove_synced_file(self, file_path: str) -> int:
+        """删除清单中记录的文件及其全部文档块，返回删除的文档块数"""
+        entry = self.manifest.get(file_path)
+        if entry is None:
+            return 0
+        ids = [chunk["id"] for chunk in entry["chunks"]]
+        if ids:
+            self.collection.delete(ids=ids)
+        self.manifest.remove(file_path)
+        return len(ids)
     
     def search_similar(self, 
                       query: str, 
@@ -248,58 +534,111 @@ class OpenAIMarkdownVectorDB:
             print(f"搜索失败: {e}")
             return []
     
-    def batch_add_files(self, directory_path: str) -> Dict[str, Any]:
-        """批量添加目录下的所有Markdown文件"""
+    def batch_add_files(self,
+                        directory_path: str,
+                        recursive: bool = False,
+                        remove_missing: bool = True,
+                        workers: int = 4,
+                        on_progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+        """
+        增量同步目录下的所有Markdown文件
+        
+        Args:
+            directory_path: 目录路径
+            recursive: 是否包含子目录
+            remove_missing: 是否删除已从目录中移除的文件的文档块
+            workers: 并发读取和嵌入的线程数
+            on_progress: 每个文件完成时的回调 (已完成数, 总数, 文件路径, 结果)，返回False时取消剩余文件
+        """
         if not os.path.exists(directory_path):
             return {"success": False, "error": f"目录不存在: {directory_path}"}
         
         md_files = []
-        for file_name in os.listdir(directory_path):
-            if file_name.endswith('.md'):
-                md_files.append(os.path.join(directory_path, file_name))
+        if recursive:
+            for root, _, file_names in os.walk(directory_path):
+                md_files.extend(os.path.join(root, name) for name in sorted(file_names) if name.endswith('.md'))
+        else:
+            for file_name in sorted(os.listdir(directory_path)):
+                if file_name.endswith('.md'):
+                    md_files.append(os.path.join(directory_path, file_name))
+        
+        # 清单中记录、但已从目录中移除的文件
+        current = {file_key(md_file) for md_file in md_files}
+        directory_key = file_key(directory_path)
+        missing_files = [
+            key for key in self.manifest.files_under(directory_path)
+            if key not in current and (recursive or os.path.dirname(key) == directory_key)
+        ] if remove_missing else []
         
-        if not md_files:
+        if not md_files and not missing_files:
             return {"success": False, "error": "目录下未找到Markdown文件"}
         
         results = {
             "total_files": len(md_files),
             "successful_files": 0,
             "failed_files": 0,
+            "unchanged_files": 0,
+            "removed_files": 0,
             "total_chunks": 0,
+            "added_chunks": 0,
+            "deleted_chunks": 0,
             "file_results": []
         }
         
-        for md_file in md_files:
-            print(f"处理文件: {os.path.basename(md_file)}")
-            result = self.add_markdown_file(md_file)
-            
-            if result['success']:
-                results['successful_files'] += 1
-                results['total_chunks'] += result['chunks_processed']
-                results['file_results'].append({
-                    "file": os.path.basename(md_file),
-                    "status": "success",
-                    "chunks": result['chunks_processed']
-                })
-            else:
-                results['failed_files'] += 1
-                results['file_results'].append({
-                    "file": os.path.basename(md_file),
-                    "status": "failed",
-                    "error": result['error']
-                })
+        pipeline = IngestPipeline(self, workers=workers)
+        for md_file, result in zip(md_files, pipeline.run(md_files, on_progress)):
+            self._collect_file_result(results, md_file, result)
+        if pipeline.cancelled:
+            results["cancelled"] = True
+            return results
+        
+        for missing_file in missing_files:
+            print(f"删除已移除的文件: {os.path.basename(missing_file)}")
+            results['removed_files'] += 1
+            results['deleted_chunks'] += self.remove_synced_file(missing_file)
         
         return results
     
+    @staticmethod
+    def _collect_file_result(results: Dict[str, Any], md_file: str, result: Dict[str, Any]):
+        """把单个文件的同步结果汇总到目录同步结果中"""
+        if result['success']:
+            results['successful_files'] += 1
+            results['total_chunks'] += result['chunks_processed']
+            results['added_chunks'] += result.get('added', 0)
+            results['deleted_chunks'] += result.get('deleted', 0)
+            if result.get('unchanged'):
+                results['unchanged_files'] += 1
+            results['file_results'].append({
+                "file": os.path.basename(md_file),
+                "status": "unchanged" if result.get('unchanged') else "success",
+                "chunks": result['chunks_processed'],
+                "added": result.get('added', 0),
+                "deleted": result.get('deleted', 0)
+            })
+        else:
+            results['failed_files'] += 1
+            results['file_results'].append({
+                "file": os.path.basename(md_file),
+                "status": "cancelled" if result.get('cancelled') else "failed",
+                "error": result['error']
+            })
+    
     def get_collection_stats(self) -> Dict[str, Any]:
         """获取集合统计信息"""
         try:
             count = self.collection.count()
-            return {
+            stats = {
                 "document_count": count,
                 "persist_directory": self.persist_directory,
-                "embedding_model": self.embedding_model
+                "embedding_backend": self.embedding_backend.name,
+                "embedding_model": self.embedding_model,
+                "embedding_dimension": self.embedding_backend.dimension,
+                "collection": self.collection_name
             }
+            if self.embedding_cache is not None:
+                stats["embedding_cache"] = self.embedding_cache.get_statistics()
+            return stats
         except Exception as e:
             return {"error": f"获取统计信息失败: {e}"}
     
@@ -360,6 +699,7 @@ class OpenAIMarkdownVectorDB:
             
             # 删除数据
             self.collection.delete(ids=ids_to_delete)
+            self.manifest.remove_by_name(file_name)
             
             return {
                 "success": True,
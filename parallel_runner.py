@@ -0,0 +1,424 @@
+"""
+并行测试执行
+为每个工作进程启动独立的虚拟显示（Xvfb），每个进程绑定自己的显示、智能体和执行器，
+从导入的测试用例中领取任务并行执行
+"""
+
+import os
+import time
+import queue
+import shutil
+import sqlite3
+import threading
+import subprocess
+import multiprocessing
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+
+KNOWLEDGE_FILES = ("task_experiences.json", "screenshot_knowledge.json", "task_index.pkl")
+KNOWLEDGE_DATABASE = "knowledge.db"
+BLOB_DIR = "blobs"
+MARKDOWN_DB_DIR = "openai_markdown_db"
+
+# 启动工作进程时临时修改本进程的DISPLAY环境变量，多个执行器同时启动时需要串行
+_environ_lock = threading.Lock()
+
+
+class VirtualDisplay:
+    """Xvfb虚拟显示"""
+
+    def __init__(self,
+                 display_number: int,
+                 size: Tuple[int, int] = (1920, 1080),
+                 depth: int = 24,
+                 startup_timeout: float = 10.0):
+        """
+        初始化虚拟显示
+
+        Args:
+            display_number: 显示编号，对应 DISPLAY=:<编号>
+            size: 屏幕分辨率
+            depth: 颜色深度
+            startup_timeout: 等待Xvfb启动的最长时间（秒）
+        """
+        self.display_number = display_number
+        self.size = size
+        self.depth = depth
+        self.startup_timeout = startup_timeout
+        self.process: Optional[subprocess.Popen] = None
+
+    @property
+    def name(self) -> str:
+        return f":{self.display_number}"
+
+    def start(self):
+        """启动Xvfb并等待显示就绪"""
+        if shutil.which("Xvfb") is None:
+            raise RuntimeError("未找到Xvfb，请先安装（例如 apt install xvfb）")
+        width, height = self.size
+        self.process = subprocess.Popen(
+            ["Xvfb", self.name, "-screen", "0", f"{width}x{height}x{self.depth}", "-nolisten", "tcp"],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        socket_path = f"/tmp/.X11-unix/X{self.display_number}"
+        deadline = time.time() + self.startup_timeout
+        while not os.path.exists(socket_path):
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Xvfb {self.name} 启动失败，退出码 {self.process.returncode}")
+            if time.time() > deadline:
+                self.stop()
+                raise RuntimeError(f"Xvfb {self.name} 启动超时")
+            time.sleep(0.1)
+        print(f"🖥️ 虚拟显示 {self.name} 已启动 ({width}x{height})")
+
+    def stop(self):
+        """关闭Xvfb"""
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.process = None
+
+
+def _worker_main(worker_id: int,
+                 display: str,
+                 api_key: str,
+                 agent_kwargs: Dict[str, Any],
+                 task_queue,
+                 result_queue):
+    """工作进程入口：逐个领取并执行测试用例（DISPLAY已由父进程在启动前设置）"""
+    os.environ["DISPLAY"] = display
+    from rag_enhanced_agent import RAGEnhancedGUIAgent
+
+    agent = RAGEnhancedGUIAgent(api_key=api_key, **agent_kwargs)
+    while True:
+        item = task_queue.get()
+        if item is None:
+            break
+        case_id, goal = item
+        start = time.time()
+        result = {"case_id": case_id, "worker": worker_id, "display": display}
+        try:
+            response, success, total_token = agent.run_rag_enhanced_goal(goal)
+            result.update({
+                "success": success,
+                "total_token": total_token,
+                "thought": response.get("thought") if response else None,
+                "error": None
+            })
+        except Exception as e:
+            result.update({"success": False, "total_token": 0, "thought": None, "error": str(e)})
+        result["duration"] = time.time() - start
+        result_queue.put(result)
+
+
+def _start_on_display(process, display: str):
+    """
+    以指定的DISPLAY启动工作进程
+
+    spawn方式启动的子进程会先重新导入父进程的主模块（例如 agent_ui_xlsx.py），
+    其中导入的pyautogui在导入时就连接DISPLAY，因此必须在 start() 之前设置环境变量，
+    子进程继承启动时的环境
+    """
+    with _environ_lock:
+        previous = os.environ.get("DISPLAY")
+        os.environ["DISPLAY"] = display
+        try:
+            process.start()
+        finally:
+            if previous is None:
+                os.environ.pop("DISPLAY", None)
+            else:
+                os.environ["DISPLAY"] = previous
+
+
+def _counter_snapshot(table, id_field: str, before: float) -> Dict[str, Tuple[int, int]]:
+    """创建时间早于 before 的条目的 ID -> (使用次数, 失败次数)"""
+    usage, failure = table.column("usage_count"), table.column("failure_count")
+    return {
+        getattr(table[i], id_field): (int(usage[i]), int(failure[i]))
+        for i in np.flatnonzero(table.column("created_at") < before)
+    }
+
+
+def _accumulate_deltas(totals: Dict[str, List[int]],
+                       baseline: Dict[str, Tuple[int, int]],
+                       current: Dict[str, Tuple[int, int]]):
+    """把工作进程副本相对初始副本的计数变化累加到 totals"""
+    for record_id, (usage, failure) in current.items():
+        if record_id not in baseline:
+            continue
+        base_usage, base_failure = baseline[record_id]
+        if usage != base_usage or failure != base_failure:
+            total = totals.setdefault(record_id, [0, 0])
+            total[0] += usage - base_usage
+            total[1] += failure - base_failure
+
+
+def _backup_sqlite(source_path: str, target_path: str):
+    """用在线备份复制SQLite数据库，包含WAL中尚未合并的数据"""
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(target_path + suffix):
+            os.remove(target_path + suffix)
+    source, target = sqlite3.connect(source_path), sqlite3.connect(target_path)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+
+
+def _copy_markdown_db(source_dir: str, target_dir: str):
+    """
+    复制Markdown向量数据库（Chroma数据和嵌入缓存）
+
+    Chroma的 PersistentClient 和嵌入缓存都不支持多个进程同时读写同一目录，每个工作进程使用自己的副本
+    """
+    if os.path.isdir(target_dir):
+        shutil.rmtree(target_dir)
+    if not os.path.isdir(source_dir):
+        return
+    sqlite_files = []
+
+    def ignore(directory, names):
+        skipped = {name for name in names if name.endswith(("-wal", "-shm", "-journal"))}
+        for name in names:
+            if name.endswith((".sqlite3", ".db")):
+                sqlite_files.append(os.path.relpath(os.path.join(directory, name), source_dir))
+                skipped.add(name)
+        return skipped
+
+    shutil.copytree(source_dir, target_dir, ignore=ignore)
+    for relative in sqlite_files:
+        _backup_sqlite(os.path.join(source_dir, relative), os.path.join(target_dir, relative))
+
+
+def _share_blobs(source_root: str, target_root: str):
+    """
+    让工作进程的截图存储包含共享知识库的全部截图
+
+    截图按内容寻址且写入后不再修改，优先使用硬链接，跨文件系统时复制
+    """
+    if not os.path.isdir(source_root):
+        return
+    for directory, _, files in os.walk(source_root):
+        target_dir = os.path.join(target_root, os.path.relpath(directory, source_root))
+        os.makedirs(target_dir, exist_ok=True)
+        for name in files:
+            if name.startswith(".tmp-"):
+                continue
+            target = os.path.join(target_dir, name)
+            if os.path.exists(target):
+                continue
+            source = os.path.join(directory, name)
+            try:
+                os.link(source, target)
+            except OSError:
+                shutil.copyfile(source, target)
+
+
+class ParallelTestRunner:
+    """多虚拟显示并行执行测试用例"""
+
+    def __init__(self,
+                 api_key: str,
+                 workers: int = 2,
+                 display_base: int = 99,
+                 screen_size: Tuple[int, int] = (1920, 1080),
+                 knowledge_dir: str = "knowledge_base",
+                 markdown_db_dir: str = "./openai_markdown_db",
+                 work_dir: str = "parallel_workers",
+                 startup_command: Optional[List[str]] = None,
+                 agent_kwargs: Optional[Dict[str, Any]] = None):
+        """
+        初始化并行执行器
+
+        Args:
+            api_key: 火山引擎API Key
+            workers: 工作进程（虚拟显示）数量
+            display_base: 第一个虚拟显示的编号，后续依次递增
+            screen_size: 虚拟显示分辨率
+            knowledge_dir: 共享知识库目录，各工作进程以其为初始内容，结束后合并新增经验
+            markdown_db_dir: Markdown向量数据库目录，每个工作进程使用其副本
+            work_dir: 工作进程的知识库副本、Markdown向量数据库副本和截图目录
+            startup_command: 每个虚拟显示启动后运行的命令（启动被测应用），为None时虚拟显示中没有被测应用
+            agent_kwargs: 传递给 RAGEnhancedGUIAgent 的其他参数
+        """
+        self.api_key = api_key
+        self.workers = max(1, workers)
+        self.display_base = display_base
+        self.screen_size = screen_size
+        self.knowledge_dir = knowledge_dir
+        self.markdown_db_dir = markdown_db_dir
+        self.work_dir = work_dir
+        self.startup_command = startup_command
+        self.agent_kwargs = agent_kwargs or {}
+        self._stop = multiprocessing.Event()
+
+    def _prepare_worker_dir(self, worker_id: int) -> Dict[str, str]:
+        """为工作进程准备独立的知识库副本（含截图存储）、Markdown向量数据库副本和截图目录"""
+        worker_dir = os.path.join(self.work_dir, f"worker_{worker_id}")
+        worker_knowledge = os.path.join(worker_dir, "knowledge_base")
+        os.makedirs(worker_knowledge, exist_ok=True)
+        for name in KNOWLEDGE_FILES:
+            source = os.path.join(self.knowledge_dir, name)
+            target = os.path.join(worker_knowledge, name)
+            if os.path.exists(source):
+                shutil.copyfile(source, target)
+            elif os.path.exists(target):
+                os.remove(target)
+        source_db = os.path.join(self.knowledge_dir, KNOWLEDGE_DATABASE)
+        target_db = os.path.join(worker_knowledge, KNOWLEDGE_DATABASE)
+        if os.path.exists(source_db):
+            _backup_sqlite(source_db, target_db)
+        else:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(target_db + suffix):
+                    os.remove(target_db + suffix)
+        _share_blobs(os.path.join(self.knowledge_dir, BLOB_DIR), os.path.join(worker_knowledge, BLOB_DIR))
+        worker_markdown_db = os.path.join(worker_dir, MARKDOWN_DB_DIR)
+        _copy_markdown_db(self.markdown_db_dir, worker_markdown_db)
+        return {
+            "knowledge_dir": worker_knowledge,
+            "screenshot_dir": os.path.join(worker_dir, "screenshot"),
+            "md_persist_directory": worker_markdown_db
+        }
+
+    def merge_worker_knowledge(self, since: float) -> int:
+        """
+        将各工作进程本次新增的经验合并回共享知识库，
+        并累加工作进程对已有条目的使用次数和失败次数变化
+
+        Args:
+            since: 本次执行的开始时间，创建时间不早于该时间戳的条目视为新增
+
+        Returns:
+            int: 合并的任务经验数量
+        """
+        from rag_knowledge_base import RAGKnowledgeBase
+
+        storage_backend = self.agent_kwargs.get("storage_backend", "json")
+        shared = RAGKnowledgeBase(self.knowledge_dir, storage_backend)
+        # 共享知识库在执行期间不变，其计数即工作进程副本的初始计数
+        task_baseline = _counter_snapshot(shared.task_experiences, "task_id", since)
+        screenshot_baseline = _counter_snapshot(shared.screenshot_knowledge, "screenshot_id", since)
+        task_deltas: Dict[str, List[int]] = {}
+        screenshot_deltas: Dict[str, List[int]] = {}
+        merged = 0
+        for worker_id in range(self.workers):
+            worker_knowledge = os.path.join(self.work_dir, f"worker_{worker_id}", "knowledge_base")
+            if not os.path.isdir(worker_knowledge):
+                continue
+            worker_kb = RAGKnowledgeBase(worker_knowledge, storage_backend)
+            try:
+                tasks, screenshots = worker_kb.task_experiences, worker_kb.screenshot_knowledge
+                _accumulate_deltas(task_deltas, task_baseline, _counter_snapshot(tasks, "task_id", since))
+                _accumulate_deltas(screenshot_deltas, screenshot_baseline,
+                                   _counter_snapshot(screenshots, "screenshot_id", since))
+                merged += shared.import_experiences(
+                    [tasks[i] for i in np.flatnonzero(tasks.column("created_at") >= since)],
+                    [screenshots[i] for i in np.flatnonzero(screenshots.column("created_at") >= since)],
+                    worker_kb.blob_store
+                )
+            finally:
+                worker_kb.close()
+        updated = shared.apply_counter_deltas(task_deltas, screenshot_deltas)
+        shared.close()
+        print(f"🔀 已合并 {merged} 条任务经验到共享知识库，更新 {updated} 条已有知识的计数")
+        return merged
+
+    def stop(self):
+        """停止领取新的测试用例，正在执行的用例会执行完毕"""
+        self._stop.set()
+
+    def run(self,
+            cases: List[Tuple[Any, Dict[str, Any]]],
+            on_result: Optional[Callable[[Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
+        """
+        并行执行测试用例
+
+        Args:
+            cases: (用例编号, 任务目标) 列表
+            on_result: 每个用例完成时的回调，在调用线程中执行
+
+        Returns:
+            List[Dict]: 各用例的执行结果，包含 case_id、success、total_token、error、worker、duration
+        """
+        if not cases:
+            return []
+        self._stop.clear()
+        start = time.time()
+        # 使用spawn保证每个进程重新导入pyautogui，并在启动时的环境中连接自己的显示
+        ctx = multiprocessing.get_context("spawn")
+        task_queue = ctx.Queue()
+        result_queue = ctx.Queue()
+        worker_count = min(self.workers, len(cases))
+        for case in cases:
+            task_queue.put(case)
+        for _ in range(worker_count):
+            task_queue.put(None)
+
+        displays: List[VirtualDisplay] = []
+        apps: List[subprocess.Popen] = []
+        processes = []
+        results = []
+        try:
+            for worker_id in range(worker_count):
+                display = VirtualDisplay(self.display_base + worker_id, self.screen_size)
+                display.start()
+                displays.append(display)
+                if self.startup_command:
+                    apps.append(subprocess.Popen(
+                        self.startup_command, env={**os.environ, "DISPLAY": display.name}
+                    ))
+                agent_kwargs = {**self.agent_kwargs, **self._prepare_worker_dir(worker_id)}
+                process = ctx.Process(
+                    target=_worker_main,
+                    args=(worker_id, display.name, self.api_key, agent_kwargs, task_queue, result_queue),
+                    daemon=True
+                )
+                _start_on_display(process, display.name)
+                processes.append(process)
+            print(f"🚀 {worker_count} 个工作进程开始执行 {len(cases)} 个测试用例")
+
+            pending = {case_id for case_id, _ in cases}
+            while pending:
+                if self._stop.is_set():
+                    # 清空尚未领取的用例，工作进程执行完当前用例后退出
+                    try:
+                        while task_queue.get_nowait() is not None:
+                            pass
+                    except queue.Empty:
+                        pass
+                    for _ in processes:
+                        task_queue.put(None)
+                    self._stop.clear()
+                try:
+                    result = result_queue.get(timeout=1.0)
+                except queue.Empty:
+                    if not any(p.is_alive() for p in processes):
+                        break
+                    continue
+                pending.discard(result["case_id"])
+                results.append(result)
+                if on_result:
+                    on_result(result)
+        finally:
+            for process in processes:
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+            for app in apps:
+                if app.poll() is None:
+                    app.terminate()
+            for display in displays:
+                display.stop()
+
+        if results:
+            self.merge_worker_knowledge(since=start)
+        elapsed = time.time() - start
+        print(f"🏁 并行执行完成: {len(results)}/{len(cases)} 个用例, 耗时 {elapsed:.1f} 秒")
+        return results
@@ -0,0 +1,79 @@
+"""
+知识库查询结果缓存
+按规范化的查询文本和参数缓存检索结果，知识库版本变化时整体失效，容量超出时淘汰最久未使用的条目
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable
+
+
+class QueryCache:
+    """按知识库版本失效的LRU缓存"""
+
+    def __init__(self, maxsize: int = 1024):
+        """
+        Args:
+            maxsize: 最多缓存的查询数量，为0时不缓存
+        """
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """规范化查询文本：统一小写并合并空白"""
+        return " ".join(str(query).lower().split())
+
+    def get_or_compute(self, key: Hashable, version: int, compute: Callable[[], Any]) -> Any:
+        """
+        读取缓存结果，未命中时计算并写入
+
+        Args:
+            key: 缓存键（查询类型、规范化查询和参数）
+            version: 当前知识库版本，与缓存版本不同时清空缓存
+            compute: 计算结果的函数
+        """
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        value = compute()
+        if self.maxsize <= 0:
+            return value
+        with self._lock:
+            # 计算期间知识库版本已变化时不写入过期结果
+            if version == self._version:
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        """清空缓存和命中统计"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """命中统计"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups > 0 else 0,
+                "size": len(self._entries),
+                "maxsize": self.maxsize
+            }
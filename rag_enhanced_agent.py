@@ -6,14 +6,16 @@ RAG增强的GUI智能体
 import os
 import json
 import time
+import asyncio
 import base64
 import io
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Any, Optional, Tuple
 from PIL import Image
 import pyautogui
 from volcenginesdkarkruntime import Ark
 
-from rag_knowledge_base import RAGKnowledgeBase, TaskExperience, ScreenshotKnowledge
+from rag_knowledge_base import RAGKnowledgeBase, RetrievalSession, TaskExperience, ScreenshotKnowledge
 from GUIAgent import DoubaoUITarsGUI
 from prompt import COMPUTER_USE_DOUBAO1
 from AutoGUI import PyAutoGUIActionExecutor
@@ -21,23 +23,37 @@ from ParseActionString import parse_action_string
 import re
 from markdown_rag import OpenAIMarkdownVectorDB, MarkdownKnowledgeRetriever
 
+# Markdown知识检索线程池，同一进程中的所有智能体共用，不随智能体实例创建和泄漏
+_retrieval_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="rag-retrieval")
+
 
 class RAGEnhancedGUIAgent(DoubaoUITarsGUI):
     """RAG增强的GUI智能体"""
     
-    def __init__(self, api_key=None, knowledge_dir="knowledge_base"):
+    def __init__(self, api_key=None, knowledge_dir="knowledge_base", screenshot_dir="screenshot",
+                 storage_backend="json", knowledge_base: Optional[RAGKnowledgeBase] = None,
+                 md_vector_db: Optional[OpenAIMarkdownVectorDB] = None,
+                 md_persist_directory: str = "./openai_markdown_db", **kwargs):
         """
         初始化RAG增强的GUI智能体
         
         Args:
             api_key: 火山引擎API Key
             knowledge_dir: 知识库目录
+            screenshot_dir: 截图保存目录
+            storage_backend: 知识库存储后端，json 或 sqlite
+            knowledge_base: 共享的知识库实例，同一进程中的多个智能体可共用一份已加载的索引
+            md_vector_db: Markdown向量数据库实例，例如离线环境中使用本地嵌入后端的
+                OpenAIMarkdownVectorDB(embedding_backend="hashing")，为None时使用默认的远程嵌入模型
+            md_persist_directory: 未传入 md_vector_db 时Markdown向量数据库的数据目录
+            **kwargs: 传递给 DoubaoUITarsGUI 的其他参数
         """
-        super().__init__(api_key)
+        super().__init__(api_key, **kwargs)
+        self.screenshot_dir = screenshot_dir
         
         # 初始化知识库
-        self.knowledge_base = RAGKnowledgeBase(knowledge_dir)
-        self.md_knowledge_base = OpenAIMarkdownVectorDB()
+        self.knowledge_base = knowledge_base or RAGKnowledgeBase(knowledge_dir, storage_backend)
+        self.md_knowledge_base = md_vector_db or OpenAIMarkdownVectorDB(persist_directory=md_persist_directory)
         self.retriever = MarkdownKnowledgeRetriever(self.md_knowledge_base)
         
         # 当前任务信息
@@ -49,10 +65,41 @@ class RAGEnhancedGUIAgent(DoubaoUITarsGUI):
               f"成功率 {stats['success_rate']:.1%}, "
               f"{stats['total_screenshots']} 个截图知识")
     
+    def retrieve_rag_context(self, instruction, session: Optional[RetrievalSession] = None) -> Dict[str, Any]:
+        """
+        检索RAG知识（与截图无关，可以和截图、推理并行执行）
+        
+        Args:
+            instruction: 任务指令
+            session: 检索会话，为None时新建
+            
+        Returns:
+            包含学习洞察、markdown知识、相似任务、相似截图和检索会话的字典
+        """
+        if session is None:
+            session = self.knowledge_base.start_retrieval_session()
+        
+        # markdown知识检索与经验库无关，在后台线程中同时执行
+        markdown_future = _retrieval_executor.submit(
+            self.retriever.query, instruction.get('task'), min_similarity=0.2
+        )
+        # 一次检索得到学习洞察、相似成功任务和相似截图
+        knowledge = self.knowledge_base.retrieve(
+            str(instruction), task_top_k=3, insight_top_k=5, screenshot_top_k=2, session=session
+        )
+        return {
+            "insights": knowledge["insights"],
+            "markdown_knowledge": markdown_future.result().get('results'),
+            "similar_tasks": knowledge["similar_tasks"],
+            "similar_screenshots": knowledge["similar_screenshots"],
+            "session": session
+        }
+    
     def construct_rag_enhanced_messages(self, 
                                       instruction, 
                                       image_base64: str, 
-                                      language: str = "Chinese") -> List[Dict]:
+                                      language: str = "Chinese",
+                                      context: Optional[Dict[str, Any]] = None) -> List[Dict]:
         """
         构建RAG增强的消息
         
@@ -60,48 +107,41 @@ class RAGEnhancedGUIAgent(DoubaoUITarsGUI):
             instruction: 任务指令
             image_base64: 截图base64
             language: 语言
+            context: 已检索的RAG知识，为None时现场检索
             
         Returns:
             增强后的消息列表
         """
-        # 获取学习洞察
-        insights = self.knowledge_base.get_learning_insights(str(instruction))
-
-        # 获取markdown知识
-        markdown_knowledge = self.retriever.query(instruction.get('task'),min_similarity=0.2).get('results')
-        # 搜索相似任务
-        similar_tasks = self.knowledge_base.search_similar_tasks(
-            str(instruction), top_k=3, only_successful=True
-        )
-        # 搜索相似截图
-        similar_screenshots = self.knowledge_base.search_similar_screenshots(
-            str(instruction), top_k=2
-        )
+        if context is None:
+            context = self.retrieve_rag_context(instruction)
         
         # 构建RAG增强的系统提示
         rag_system_prompt = self._build_rag_system_prompt(
-            instruction, insights, markdown_knowledge, similar_tasks, similar_screenshots, language
+            instruction,
+            context["insights"],
+            context["markdown_knowledge"],
+            context["similar_tasks"],
+            context["similar_screenshots"],
+            language
         )
         messages = [
             {
                 "role": "user",
                 "content": rag_system_prompt
             },
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/png;base64,{image_base64}"
-                        }
-                    }
-                ]
-            }
+            self.image_message(image_base64)
         ]
         
         return messages
     
+    def execute_action_early(self, action):
+        """流式推理时提前执行操作，创建群组/文档等复合操作留给主流程处理"""
+        action_info = parse_action_string(action)
+        if not action_info or action_info.get("action_type") in ("creategroup", "createfile"):
+            return None
+        message = self.action_executor.execute_parsed_action(action_info)
+        return action_info, message
+    
     def _build_rag_system_prompt(self, 
                                 instruction: str,
                                 insights: Dict[str, Any],
@@ -179,7 +219,40 @@ class RAGEnhancedGUIAgent(DoubaoUITarsGUI):
     
     def run_rag_enhanced_goal(self, goal) -> Tuple[Dict, bool, int]:
         """
-        运行RAG增强的目标执行
+        运行RAG增强的目标执行（同步接口，内部运行异步步骤循环）
+        
+        已在事件循环中运行的调用方请使用 await run_rag_enhanced_goal_async(goal)
+        
+        Args:
+            goal: 任务目标
+            
+        Returns:
+            Tuple[AI响应, 是否成功, 总token数]
+        """
+        return self._run_sync(self.run_rag_enhanced_goal_async, goal)
+    
+    async def run_rag_enhanced_goal_async(self, goal) -> Tuple[Dict, bool, int]:
+        """
+        运行RAG增强的目标执行（异步入口），最外层执行结束时关闭异步客户端
+        
+        Args:
+            goal: 任务目标
+            
+        Returns:
+            Tuple[AI响应, 是否成功, 总token数]
+        """
+        self._async_runs += 1
+        try:
+            return await self._run_rag_enhanced_goal_steps(goal)
+        finally:
+            await self._release_async_client()
+    
+    async def _run_rag_enhanced_goal_steps(self, goal) -> Tuple[Dict, bool, int]:
+        """
+        RAG增强目标执行的步骤循环
+        
+        知识检索与首次截图并行，界面稳定等待期间同时写盘上一步截图，
+        稳定时的最后一帧直接作为下一步截图
         
         Args:
             goal: 任务目标
@@ -188,79 +261,99 @@ class RAGEnhancedGUIAgent(DoubaoUITarsGUI):
             Tuple[AI响应, 是否成功, 总token数]
         """
         print(f"🎯 开始RAG增强执行: {goal}")
+        loop = asyncio.get_running_loop()
         
         # 初始化任务跟踪
         self.task_start_time = time.time()
         self.current_screenshots = []
+        self.current_screenshot_data = {}  # 最近一张截图的路径 -> 编码后的字节，更早的截图写盘后从磁盘读取
         self.current_actions = []
         self.current_thoughts = []
         self.current_actions_usefulness = []
         
         self.current_step = 0
         action_message = None
+        ai_response = None
+        last_action_type = None
+        prefetched_image = None
         self.total_token = 0
+        if self.change_detector:
+            self.change_detector.reset()
+        
+        # 知识检索与截图无关，和首次截图并行执行；检索会话属于本次执行，共享知识库时互不干扰
+        session = self.knowledge_base.start_retrieval_session()
+        retrieval = loop.run_in_executor(None, self.retrieve_rag_context, goal, session)
         
         while self.current_step < self.max_steps:
             self.current_step += 1
             print(f"🔄 执行步骤 {self.current_step}/{self.max_steps}")
             
             try:
-                # 截图
-                screenshot_path = f"screenshot/screenshot_{int(time.time())}.png"
-                image = self.capture_screenshot(screenshot_path)
+                # 截图（优先使用等待界面稳定时已截取的帧）
+                screenshot_path = os.path.join(self.screenshot_dir, f"screenshot_{int(time.time())}.png")
+                image = await loop.run_in_executor(
+                    None, self.capture_screenshot, screenshot_path, prefetched_image
+                )
+                prefetched_image = None
+                image, reuse_previous = await loop.run_in_executor(
+                    None, self.poll_for_screen_change, image, screenshot_path, last_action_type
+                )
+                # 实际保存路径的扩展名由编码器决定
+                screenshot_path = self.last_frame.path
                 self.current_screenshots.append(screenshot_path)
+                # 只保留最近一帧的编码字节，不在整个任务期间持有每一步的图像
+                self.current_screenshot_data = {screenshot_path: self.last_frame.data}
                 
             except Exception as e:
                 print(f"截图失败: {e}")
                 continue
             
             # AI分析并规划下一步（使用RAG增强）
+            early_result = None
             try:
-                if not action_message:
-                    action_message = self.construct_rag_enhanced_messages(
-                        instruction=goal, image_base64=image
-                    )
+                if reuse_previous:
+                    # 屏幕未变化，沿用上一步的思考和操作
+                    self.current_thoughts.append(self.current_thoughts[-1])
+                    self.current_actions_usefulness.append(self.current_actions_usefulness[-1])
                 else:
-                    # 维护对话历史
-                    if len(action_message) > 4:
-                        action_message = [action_message[0]] + action_message[-2:]
+                    if not action_message:
+                        action_message = self.construct_rag_enhanced_messages(
+                            instruction=goal, image_base64=image, context=await retrieval
+                        )
+                    else:
+                        action_message.append(self.image_message(image))
+                    # 维护对话历史：按token预算裁剪，只保留最近的截图
+                    action_message = self.history_manager.fit(action_message)
+                    if self.streaming:
+                        ai_response, token, early_result = await self.inference_with_early_action_async(
+                            action_message, self.execute_action_early
+                        )
+                    else:
+                        ai_response, token = await self.inference_async(action_message)
+                    # print(action_message)
+                    self.total_token += token
+                    
+                    # 记录思考过程
+                    thought = ai_response.get('thought', '')
+                    self.current_thoughts.append(thought)
+                    self.current_actions_usefulness.append({
+                        "score": ai_response.get("action_usefulness").get("score", 0.0),
+                        "reason": ai_response.get("action_usefulness").get("reasoning", "")
+                    })
+                    
+                    print(f"🧠 AI思考: {thought}")
+                    print(f"⚡ AI建议: {ai_response.get('action', '无')}")
+                    print(f"上一步操作置信度：{ai_response.get('action_usefulness','未知')}")
+                    print(f"🔤 使用token: {token}")
                     
                     action_message.append({
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/png;base64,{image}"
-                                }
-                            }
-                        ]
+                        "role": "assistant",
+                        "content": thought
                     })
-                ai_response, token = self.inference(messages=action_message)
-                # print(action_message)
-                self.total_token += token
-                
-                # 记录思考过程
-                thought = ai_response.get('thought', '')
-                self.current_thoughts.append(thought)
-                self.current_actions_usefulness.append({
-                    "score": ai_response.get("action_usefulness").get("score", 0.0),
-                    "reason": ai_response.get("action_usefulness").get("reasoning", "")
-                })
-                
-                print(f"🧠 AI思考: {thought}")
-                print(f"⚡ AI建议: {ai_response.get('action', '无')}")
-                print(f"上一步操作置信度：{ai_response.get('action_usefulness','未知')}")
-                print(f"🔤 使用token: {token}")
-                
-                action_message.append({
-                    "role": "assistant",
-                    "content": thought
-                })
-                
-                if not ai_response:
-                    print("AI分析失败")
-                    continue
+                    
+                    if not ai_response:
+                        print("AI分析失败")
+                        continue
                     
             except Exception as e:
                 print(f"AI分析失败: {e}")
@@ -268,8 +361,12 @@ class RAGEnhancedGUIAgent(DoubaoUITarsGUI):
             
             # 执行AI建议
             try:
-                action_info = parse_action_string(ai_response.get("action"))
+                if early_result:
+                    action_info = early_result[0]
+                else:
+                    action_info = parse_action_string(ai_response.get("action"))
                 if action_info:
+                    last_action_type = action_info.get("action_type")
                     # 记录操作
                     self.current_actions.append({
                         'step': self.current_step,
@@ -277,7 +374,9 @@ class RAGEnhancedGUIAgent(DoubaoUITarsGUI):
                         'action_info': action_info,
                         'timestamp': time.time()
                     })
-                    if action_info.get("action_type") == "creategroup":
+                    if early_result:
+                        print(f"✅ 执行成功: {early_result[1]}")
+                    elif action_info.get("action_type") == "creategroup":
                         try:
                             task = {
                                 "task": f"添加‘测试’群组",
@@ -285,7 +384,7 @@ class RAGEnhancedGUIAgent(DoubaoUITarsGUI):
                                 "steps": "1. 进入通讯录 2. 点击我的群组 3. 点击右上方创建群组 4. 输入群名称‘测试’ 5. 点击创建",
                                 "expected_result": "1. 群组创建成功"
                             }
-                            _,_,token = self.run_rag_enhanced_goal(task)
+                            _,_,token = await self.run_rag_enhanced_goal_async(task)
                             self.total_token += token
                         except Exception as e:
                             print(f"❌ 创建群组执行失败: {e}")
@@ -297,18 +396,21 @@ class RAGEnhancedGUIAgent(DoubaoUITarsGUI):
                                 "steps": "1. 进入云文档 2. 点击新建 3. 选择文档 4. 输入文档标题‘测试’",
                                 "expected_result": "1. 文档创建成功"
                             }
-                            _,_,token = self.run_rag_enhanced_goal(task)
+                            _,_,token = await self.run_rag_enhanced_goal_async(task)
                             self.total_token += token
                         except Exception as e:
                             print(f"❌ 创建文件执行失败: {e}")
                     else:
-                        message = self.action_executor.execute_parsed_action(action_info)
+                        message = await loop.run_in_executor(
+                            None, self.action_executor.execute_parsed_action, action_info
+                        )
                         print(f"✅ 执行成功: {message}")
-                    time.sleep(2)
+                    # 等待界面稳定，最长2秒
+                    prefetched_image = await self.settle_and_prefetch(ceiling=2.0)
                     
                     if action_info.get("action_type") == "finished":
                         # 任务完成，保存到知识库
-                        self._save_successful_experience(goal, ai_response)
+                        await loop.run_in_executor(None, self._save_successful_experience, goal, ai_response)
                         return ai_response, True, self.total_token
                 else:
                     print("❌ 执行失败: 无法解析操作")
@@ -318,10 +420,10 @@ class RAGEnhancedGUIAgent(DoubaoUITarsGUI):
                 continue
         
         # 记录任务失败
-        self.record_task_failure()
+        self.record_task_failure(session)
         
         # 任务失败，保存失败经验
-        self._save_failed_experience(goal, "达到最大步骤数限制")
+        await loop.run_in_executor(None, self._save_failed_experience, goal, "达到最大步骤数限制")
         print(f"❌ 达到最大步骤数 {self.max_steps}，目标未完成")
         return ai_response, False, self.total_token
     
@@ -344,7 +446,8 @@ class RAGEnhancedGUIAgent(DoubaoUITarsGUI):
             
             # 保存截图知识
             self._save_screenshot_knowledge(goal, success=True)
-            # self.knowledge_base.save_knowledge()
+            # 任务结束，立即写盘
+            self.knowledge_base.save_knowledge()
             print(f"💾 成功经验已保存到知识库 (任务ID: {task_id})")
             
         except Exception as e:
@@ -367,7 +470,8 @@ class RAGEnhancedGUIAgent(DoubaoUITarsGUI):
             
             # 保存截图知识
             self._save_screenshot_knowledge(goal, success=False)
-            # self.knowledge_base.save_knowledge()
+            # 任务结束，立即写盘
+            self.knowledge_base.save_knowledge()
             print(f"💾 失败经验已保存到知识库 (任务ID: {task_id})")
             
         except Exception as e:
@@ -379,15 +483,18 @@ class RAGEnhancedGUIAgent(DoubaoUITarsGUI):
             if not self.current_screenshots:
                 return
             
+            # 更早的截图从磁盘读取，先等待后台写盘完成
+            self.capture_pipeline.flush()
+            
             # 为每个截图创建知识条目
             for i, screenshot_path in enumerate(self.current_screenshots):
-                if not os.path.exists(screenshot_path):
-                    continue
-                
-                # 读取截图
-                with open(screenshot_path, 'rb') as f:
-                    screenshot_data = f.read()
-                    screenshot_base64 = base64.b64encode(screenshot_data).decode()
+                # 最近一帧复用采集时已编码的字节，避免重新读盘
+                screenshot_data = self.current_screenshot_data.get(screenshot_path)
+                if screenshot_data is None:
+                    if not os.path.exists(screenshot_path):
+                        continue
+                    with open(screenshot_path, 'rb') as f:
+                        screenshot_data = f.read()
                 
                 # 获取对应的操作
                 step_actions = [a for a in self.current_actions if a['step'] == i + 1]
@@ -398,16 +505,19 @@ class RAGEnhancedGUIAgent(DoubaoUITarsGUI):
                 similarity_tags = self._generate_similarity_tags(goal, i)
                 
                 # 生成UI元素描述
-                ui_elements = self._analyze_ui_elements(screenshot_path)
+                ui_elements = self._analyze_ui_elements(
+                    screenshot_path, frame.size if frame is not None else None
+                )
                 
                 self.knowledge_base.add_screenshot_knowledge(
                     screenshot_path=screenshot_path,
-                    screenshot_base64=screenshot_base64,
+                    screenshot_base64=None,
                     task_context=str(goal),
                     successful_actions=successful_actions,
                     failed_actions=failed_actions,
                     ui_elements=ui_elements,
-                    similarity_tags=similarity_tags
+                    similarity_tags=similarity_tags,
+                    screenshot_data=screenshot_data
                 )
                 
         except Exception as e:
@@ -442,17 +552,19 @@ class RAGEnhancedGUIAgent(DoubaoUITarsGUI):
         
         return tags
     
-    def _analyze_ui_elements(self, screenshot_path: str) -> Dict[str, Any]:
+    def _analyze_ui_elements(self, screenshot_path: str, size: Optional[Tuple[int, int]] = None) -> Dict[str, Any]:
         """分析UI元素（简化版本）"""
         try:
-            with Image.open(screenshot_path) as img:
-                width, height = img.size
-                
-                return {
-                    "resolution": f"{width}x{height}",
-                    "aspect_ratio": f"{width/height:.2f}",
-                    "estimated_ui_type": "desktop_application" if width > 1000 else "mobile_application"
-                }
+            if size is None:
+                with Image.open(screenshot_path) as img:
+                    size = img.size
+            width, height = size
+            
+            return {
+                "resolution": f"{width}x{height}",
+                "aspect_ratio": f"{width/height:.2f}",
+                "estimated_ui_type": "desktop_application" if width > 1000 else "mobile_application"
+            }
         except Exception:
             return {"error": "无法分析截图"}
     
@@ -482,6 +594,8 @@ class RAGEnhancedGUIAgent(DoubaoUITarsGUI):
         print(f"  截图总检索次数: {stats['screenshot_usage_count']}")
         print(f"  截图失败次数: {stats['screenshot_failure_count']}")
         print(f"  截图失败率: {stats['screenshot_failure_rate']:.1%}")
+        print(f"  查询缓存命中率: {stats['query_cache']['hit_rate']:.1%} "
+              f"({stats['query_cache']['hits']}/{stats['query_cache']['hits'] + stats['query_cache']['misses']})")
         
         # 显示最常使用的任务
         if stats['most_used_tasks']:
@@ -532,11 +646,14 @@ class RAGEnhancedGUIAgent(DoubaoUITarsGUI):
             experience_type=experience_type
         )
     
-    def record_task_failure(self):
+    def record_task_failure(self, session: Optional[RetrievalSession] = None):
         """
         记录当前任务执行失败，更新检索到的知识的失败计数
+        
+        Args:
+            session: 本次执行的检索会话，为None时使用知识库的默认会话
         """
-        updated_count = self.knowledge_base.record_task_failure()
+        updated_count = self.knowledge_base.record_task_failure(session)
         if updated_count > 0:
             print(f"已记录任务失败，更新了 {updated_count} 条知识的失败计数")
         return updated_count
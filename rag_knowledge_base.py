@@ -8,147 +8,349 @@ import json
 import time
 import hashlib
 from typing import Dict, List, Any, Tuple, Optional
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, field
 from PIL import Image
 import base64
 import io
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 import pickle
+import atexit
+import weakref
+import threading
+import copy
 
+from task_index import IncrementalTaskIndex
+from knowledge_storage import KnowledgeChanges, atomic_write, create_storage, migrate_json_to_sqlite
+from blob_store import BlobStore
+from screenshot_index import ScreenshotInvertedIndex
+from query_cache import QueryCache
+from experience_store import ColumnarRecord, NumericField, RecordTable
 
-@dataclass
-class TaskExperience:
-    """任务经验数据结构"""
-    task_id: str
-    task_description: str
-    task_goal: str
-    success: bool
-    total_steps: int
-    total_tokens: int
-    screenshots: List[str]  # 截图路径列表
-    actions: List[Dict]  # 操作序列
-    thoughts: List[str]  # 思考过程
-    action_usefulness: List[Dict] = None  # 新增：操作有用性评估
-    error_message: Optional[str] = None
-    similarity_score: Optional[float] = None
-    usage_count: int = 0  # 新增：记录被检索使用的次数
-    failure_count: int = 0  # 新增：记录检索使用但任务失败的次数
-    created_at: float = None
-    
-    def __post_init__(self):
-        if self.created_at is None:
-            self.created_at = time.time()
-        if self.action_usefulness is None:
-            self.action_usefulness = []
-        if self.usage_count is None:
-            self.usage_count = 0
-        if self.failure_count is None:
-            self.failure_count = 0
+
+class TaskExperience(ColumnarRecord):
+    """任务经验数据结构（数值字段加入知识库后保存在列式存储中）"""
+    __slots__ = ("task_id", "task_description", "task_goal", "screenshots", "actions", "thoughts",
+                 "action_usefulness", "error_message", "similarity_score")
+    FIELDS = ("task_id", "task_description", "task_goal", "success", "total_steps", "total_tokens",
+              "screenshots", "actions", "thoughts", "action_usefulness", "error_message",
+              "similarity_score", "usage_count", "failure_count", "created_at")
+    
+    success = NumericField(np.bool_)
+    total_steps = NumericField(np.int64)
+    total_tokens = NumericField(np.int64)
+    usage_count = NumericField(np.int64)  # 新增：记录被检索使用的次数
+    failure_count = NumericField(np.int64)  # 新增：记录检索使用但任务失败的次数
+    created_at = NumericField(np.float64)
+    
+    def __init__(self,
+                 task_id: str,
+                 task_description: str,
+                 task_goal: str,
+                 success: bool,
+                 total_steps: int,
+                 total_tokens: int,
+                 screenshots: List[str],  # 截图路径列表
+                 actions: List[Dict],  # 操作序列
+                 thoughts: List[str],  # 思考过程
+                 action_usefulness: List[Dict] = None,  # 新增：操作有用性评估
+                 error_message: Optional[str] = None,
+                 similarity_score: Optional[float] = None,
+                 usage_count: int = 0,
+                 failure_count: int = 0,
+                 created_at: float = None):
+        super().__init__()
+        self.task_id = task_id
+        self.task_description = task_description
+        self.task_goal = task_goal
+        self.success = success
+        self.total_steps = total_steps
+        self.total_tokens = total_tokens
+        self.screenshots = screenshots
+        self.actions = actions
+        self.thoughts = thoughts
+        self.action_usefulness = action_usefulness if action_usefulness is not None else []
+        self.error_message = error_message
+        self.similarity_score = similarity_score
+        self.usage_count = usage_count or 0
+        self.failure_count = failure_count or 0
+        self.created_at = created_at if created_at is not None else time.time()
+
+
+class ScreenshotKnowledge(ColumnarRecord):
+    """截图知识数据结构（数值字段加入知识库后保存在列式存储中）"""
+    __slots__ = ("screenshot_id", "screenshot_path", "screenshot_base64", "task_context",
+                 "successful_actions", "failed_actions", "ui_elements", "similarity_tags", "screenshot_digest")
+    FIELDS = ("screenshot_id", "screenshot_path", "screenshot_base64", "task_context", "successful_actions",
+              "failed_actions", "ui_elements", "similarity_tags", "usage_count", "failure_count",
+              "created_at", "screenshot_digest")
+    
+    usage_count = NumericField(np.int64)  # 新增：记录被检索使用的次数
+    failure_count = NumericField(np.int64)  # 新增：记录检索使用但任务失败的次数
+    created_at = NumericField(np.float64)
+    
+    def __init__(self,
+                 screenshot_id: str,
+                 screenshot_path: str,
+                 screenshot_base64: str,  # 旧版本内联的截图，新数据为空，图像保存在内容寻址存储中
+                 task_context: str,  # 任务上下文描述
+                 successful_actions: List[Dict],  # 在此截图下成功的操作
+                 failed_actions: List[Dict],  # 在此截图下失败的操作
+                 ui_elements: Dict[str, Any],  # UI元素描述
+                 similarity_tags: List[str],  # 相似性标签
+                 usage_count: int = 0,
+                 failure_count: int = 0,
+                 created_at: float = None,
+                 screenshot_digest: Optional[str] = None):  # 截图内容摘要，对应内容寻址存储中的文件
+        super().__init__()
+        self.screenshot_id = screenshot_id
+        self.screenshot_path = screenshot_path
+        self.screenshot_base64 = screenshot_base64
+        self.task_context = task_context
+        self.successful_actions = successful_actions
+        self.failed_actions = failed_actions
+        self.ui_elements = ui_elements
+        self.similarity_tags = similarity_tags
+        self.usage_count = usage_count or 0
+        self.failure_count = failure_count or 0
+        self.created_at = created_at if created_at is not None else time.time()
+        self.screenshot_digest = screenshot_digest
 
 
 @dataclass
-class ScreenshotKnowledge:
-    """截图知识数据结构"""
-    screenshot_id: str
-    screenshot_path: str
-    screenshot_base64: str
-    task_context: str  # 任务上下文描述
-    successful_actions: List[Dict]  # 在此截图下成功的操作
-    failed_actions: List[Dict]  # 在此截图下失败的操作
-    ui_elements: Dict[str, Any]  # UI元素描述
-    similarity_tags: List[str]  # 相似性标签
-    usage_count: int = 0  # 新增：记录被检索使用的次数
-    failure_count: int = 0  # 新增：记录检索使用但任务失败的次数
-    created_at: float = None
-    
-    def __post_init__(self):
-        if self.created_at is None:
-            self.created_at = time.time()
-        if self.usage_count is None:
-            self.usage_count = 0
-        if self.failure_count is None:
-            self.failure_count = 0
+class RetrievalSession:
+    """一次任务执行的检索记录，任务失败时据此更新被检索知识的失败计数"""
+    task_ids: List[str] = field(default_factory=list)
+    screenshot_ids: List[str] = field(default_factory=list)
+    
+    def clear(self):
+        self.task_ids = []
+        self.screenshot_ids = []
+
+
+# 尚未关闭的知识库，程序退出时统一写盘（弱引用，不会延长实例的生命周期）
+_open_knowledge_bases: "weakref.WeakSet" = weakref.WeakSet()
+
+
+@atexit.register
+def _save_open_knowledge_bases():
+    for kb in list(_open_knowledge_bases):
+        kb.save_knowledge()
 
 
 class RAGKnowledgeBase:
     """RAG知识库管理器"""
     
-    def __init__(self, knowledge_dir: str = "knowledge_base"):
+    def __init__(self, knowledge_dir: str = "knowledge_base", storage_backend: str = "json",
+                 flush_interval: float = 5.0, query_cache_size: int = 1024):
+        """
+        初始化知识库
+        
+        Args:
+            knowledge_dir: 知识库目录
+            storage_backend: 存储后端，json 或 sqlite；首次使用sqlite时自动迁移已有的JSON数据
+            flush_interval: 延迟写入间隔（秒），修改先保存在内存中，到期后批量写盘；
+                            任务结束和程序退出时也会写盘，为0时每次修改立即写盘
+            query_cache_size: 查询结果缓存容量，为0时不缓存
+        """
         self.knowledge_dir = knowledge_dir
         self.experience_file = os.path.join(knowledge_dir, "task_experiences.json")
         self.screenshot_file = os.path.join(knowledge_dir, "screenshot_knowledge.json")
-        self.vectorizer_file = os.path.join(knowledge_dir, "tfidf_vectorizer.pkl")
-        self.matrix_file = os.path.join(knowledge_dir, "similarity_matrix.pkl")
+        self.index_file = os.path.join(knowledge_dir, "task_index.pkl")
         
         # 创建知识库目录
         os.makedirs(knowledge_dir, exist_ok=True)
         
+        # 存储后端及自上次保存以来的变化
+        self.storage = create_storage(storage_backend, knowledge_dir)
+        if getattr(self.storage, "created", False) and (
+                os.path.exists(self.experience_file) or os.path.exists(self.screenshot_file)):
+            migrate_json_to_sqlite(knowledge_dir)
+        self._changes = KnowledgeChanges()
+        self._index_dirty = False
+        # 已删除的截图知识引用的截图摘要，删除写盘后才删除截图内容
+        self._unreferenced_digests = set()
+        self.flush_interval = flush_interval
+        self._lock = threading.RLock()  # 保护待写入的变化和写盘
+        self._task_lock = threading.RLock()  # 保护任务经验及其索引
+        self._screenshot_lock = threading.RLock()  # 保护截图知识及其索引
+        self._default_session = RetrievalSession()  # 未传入检索会话时使用
+        self._flush_timer: Optional[threading.Timer] = None
+        _open_knowledge_bases.add(self)
+        
+        # 截图内容寻址存储
+        self.blob_store = BlobStore(os.path.join(knowledge_dir, "blobs"))
+        
         # 初始化数据存储
-        self.task_experiences: List[TaskExperience] = []
-        self.screenshot_knowledge: List[ScreenshotKnowledge] = []
+        self.task_experiences = RecordTable(TaskExperience)
+        self.screenshot_knowledge = RecordTable(ScreenshotKnowledge)
         
-        # 向量化工具
-        self.vectorizer = None
-        self.similarity_matrix = None
+        # 任务经验增量索引和截图知识倒排索引
+        self.task_index = IncrementalTaskIndex()
+        self.screenshot_index = ScreenshotInvertedIndex()
+        
+        # 查询结果缓存，任务经验或截图知识变化时递增版本使缓存失效
+        self.query_cache = QueryCache(query_cache_size)
+        self.version = 0
         
         # 加载已有数据
         self.load_knowledge()
         
     def load_knowledge(self):
-        """加载已有知识库数据"""
+        """加载已有知识库数据，尚未写盘的修改先写盘，不会丢弃"""
+        with self._task_lock, self._screenshot_lock:
+            self.save_knowledge()
+            self._load_knowledge()
+    
+    def _load_knowledge(self):
         try:
+            tasks, screenshots = self.storage.load()
+            self._changes = KnowledgeChanges()
+            
             # 加载任务经验
-            if os.path.exists(self.experience_file):
-                with open(self.experience_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.task_experiences = [TaskExperience(**item) for item in data]
-                    print(f"✅ 加载了 {len(self.task_experiences)} 条任务经验")
+            self.task_experiences.replace_all(TaskExperience(**item) for item in tasks)
+            print(f"✅ 加载了 {len(self.task_experiences)} 条任务经验")
             
             # 加载截图知识
-            if os.path.exists(self.screenshot_file):
-                with open(self.screenshot_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.screenshot_knowledge = [ScreenshotKnowledge(**item) for item in data]
-                    print(f"✅ 加载了 {len(self.screenshot_knowledge)} 条截图知识")
+            self.screenshot_knowledge.replace_all(ScreenshotKnowledge(**item) for item in screenshots)
+            self.screenshot_index.rebuild(self.screenshot_knowledge)
+            print(f"✅ 加载了 {len(self.screenshot_knowledge)} 条截图知识")
+            self._migrate_inline_screenshots()
             
-            # 加载向量化数据
-            if os.path.exists(self.vectorizer_file) and os.path.exists(self.matrix_file):
-                with open(self.vectorizer_file, 'rb') as f:
-                    self.vectorizer = pickle.load(f)
-                with open(self.matrix_file, 'rb') as f:
-                    self.similarity_matrix = pickle.load(f)
-                print("✅ 加载了向量化数据")
+            # 加载任务索引，与任务经验数量不一致时重建
+            if os.path.exists(self.index_file):
+                with open(self.index_file, 'rb') as f:
+                    self.task_index = pickle.load(f)
+            if len(self.task_index) != len(self.task_experiences):
+                self.task_index.rebuild(self._experience_text(exp) for exp in self.task_experiences)
+                self._index_dirty = True
+            print("✅ 加载了任务索引")
+            self._bump_version()
                 
         except Exception as e:
             print(f"⚠️ 加载知识库数据时出错: {e}")
     
-    def save_knowledge(self):
-        """保存知识库数据"""
-        try:
-            # 保存任务经验
-            with open(self.experience_file, 'w', encoding='utf-8') as f:
-                data = [asdict(exp) for exp in self.task_experiences]
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            
-            # 保存截图知识
-            with open(self.screenshot_file, 'w', encoding='utf-8') as f:
-                data = [asdict(sk) for sk in self.screenshot_knowledge]
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            
-            # 保存向量化数据
-            if self.vectorizer is not None:
-                with open(self.vectorizer_file, 'wb') as f:
-                    pickle.dump(self.vectorizer, f)
-            if self.similarity_matrix is not None:
-                with open(self.matrix_file, 'wb') as f:
-                    pickle.dump(self.similarity_matrix, f)
-                    
-            print("💾 知识库数据已保存")
-            
-        except Exception as e:
-            print(f"❌ 保存知识库数据时出错: {e}")
+    def _migrate_inline_screenshots(self):
+        """将旧版本内联在记录中的base64截图移入内容寻址存储"""
+        migrated = 0
+        for sk in self.screenshot_knowledge:
+            if sk.screenshot_base64 and not sk.screenshot_digest:
+                sk.screenshot_digest = self.blob_store.put(base64.b64decode(sk.screenshot_base64))
+                sk.screenshot_base64 = ""
+                self._mark_screenshot(sk)
+                migrated += 1
+        if migrated:
+            self.save_knowledge()
+            print(f"📦 已将 {migrated} 条截图移入内容寻址存储")
+    
+    def get_screenshot_bytes(self, sk: ScreenshotKnowledge) -> Optional[bytes]:
+        """按需读取截图内容"""
+        if sk.screenshot_digest:
+            return self.blob_store.get(sk.screenshot_digest)
+        if sk.screenshot_base64:
+            return base64.b64decode(sk.screenshot_base64)
+        return None
+    
+    def get_screenshot_base64(self, sk: ScreenshotKnowledge) -> Optional[str]:
+        """按需读取截图的base64编码"""
+        if sk.screenshot_digest:
+            return self.blob_store.get_base64(sk.screenshot_digest)
+        return sk.screenshot_base64 or None
+    
+    @staticmethod
+    def _experience_text(exp: TaskExperience) -> str:
+        """任务经验用于检索的文本"""
+        return f"{exp.task_description} {exp.task_goal}"
+    
+    def _mark_task(self, exp: TaskExperience):
+        """标记任务经验已新增或修改"""
+        with self._lock:
+            self._changes.tasks[exp.task_id] = exp
+    
+    def _mark_screenshot(self, sk: ScreenshotKnowledge):
+        """标记截图知识已新增或修改"""
+        with self._lock:
+            self._changes.screenshots[sk.screenshot_id] = sk
+    
+    def _mark_task_counter(self, exp: TaskExperience):
+        """标记任务经验的使用计数已变化"""
+        with self._lock:
+            self._changes.task_counters[exp.task_id] = exp
+    
+    def _mark_screenshot_counter(self, sk: ScreenshotKnowledge):
+        """标记截图知识的使用计数已变化"""
+        with self._lock:
+            self._changes.screenshot_counters[sk.screenshot_id] = sk
+    
+    def _bump_version(self):
+        """任务经验、截图知识或索引变化后递增版本，使查询缓存失效"""
+        with self._lock:
+            self.version += 1
+    
+    def _task_candidates(self, query: str, k: int):
+        """相似度最高的k个任务经验（位置, 相似度），调用方需持有任务锁"""
+        return self.query_cache.get_or_compute(
+            ("tasks", query, k), self.version, lambda: self.task_index.top_k(query, k)
+        )
+    
+    def _screenshot_scores(self, query: str) -> List[Tuple[int, int]]:
+        """命中的截图知识（位置, 分数），按位置排序，调用方需持有截图锁"""
+        def compute():
+            scores = self.screenshot_index.scores(query)
+            return [(idx, scores[idx]) for idx in sorted(scores)]
+        return self.query_cache.get_or_compute(("screenshots", query), self.version, compute)
+    
+    def schedule_save(self):
+        """延迟写盘：flush_interval 秒内的修改合并为一次写入"""
+        if self.flush_interval <= 0:
+            self.save_knowledge()
+            return
+        with self._lock:
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(self.flush_interval, self.save_knowledge)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+    
+    def save_knowledge(self) -> bool:
+        """
+        保存知识库数据（只写入自上次保存以来的变化）
+        
+        Returns:
+            bool: 变化是否已全部写入（没有变化时为True）
+        """
+        # 写盘期间持有集合锁：记录的数值字段在列式存储中，清理压缩存储时不能同时读取
+        with self._task_lock, self._screenshot_lock, self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            changes, self._changes = self._changes, KnowledgeChanges()
+            index_dirty, self._index_dirty = self._index_dirty, False
+            if changes.is_empty() and not index_dirty:
+                return True
+            try:
+                # 保存任务经验和截图知识
+                if not changes.is_empty():
+                    self.storage.save(self.task_experiences, self.screenshot_knowledge, changes)
+                
+                # 保存任务索引
+                if index_dirty:
+                    atomic_write(self.index_file, pickle.dumps(self.task_index))
+                        
+                print("💾 知识库数据已保存")
+                return True
+                
+            except Exception as e:
+                # 未写入的变化放回，下次保存时重试
+                changes.merge(self._changes)
+                self._changes = changes
+                self._index_dirty = self._index_dirty or index_dirty
+                print(f"❌ 保存知识库数据时出错: {e}")
+                return False
+    
+    def close(self):
+        """写入尚未保存的修改并关闭存储后端，之后程序退出时不再写盘"""
+        self.save_knowledge()
+        _open_knowledge_bases.discard(self)
+        self.storage.close()
     
     def add_task_experience(self, 
                            task_description: str,
@@ -178,161 +380,235 @@ class RAGKnowledgeBase:
             error_message=error_message
         )
         
-        self.task_experiences.append(experience)
-        self.update_vectorization()
+        with self._task_lock:
+            self.task_experiences.append(experience)
+            self.task_index.append(self._experience_text(experience))
+            self._index_dirty = True
+            self._bump_version()
+            self._mark_task(experience)
+        self.schedule_save()
         return task_id
     
     def add_screenshot_knowledge(self,
                                 screenshot_path: str,
-                                screenshot_base64: str,
+                                screenshot_base64: Optional[str],
                                 task_context: str,
                                 successful_actions: List[Dict],
                                 failed_actions: List[Dict],
                                 ui_elements: Dict[str, Any],
-                                similarity_tags: List[str]) -> str:
-        """添加截图知识"""
+                                similarity_tags: List[str],
+                                screenshot_data: Optional[bytes] = None) -> str:
+        """
+        添加截图知识
+        
+        截图内容按摘要保存到内容寻址存储，相同的截图只保存一份；
+        提供 screenshot_data 时直接使用原始字节，避免base64解码
+        """
         screenshot_id = hashlib.md5(f"{screenshot_path}_{time.time()}".encode()).hexdigest()[:8]
         
+        if screenshot_data is None and screenshot_base64:
+            screenshot_data = base64.b64decode(screenshot_base64)
+        screenshot_digest = self.blob_store.put(screenshot_data) if screenshot_data else None
+        
         knowledge = ScreenshotKnowledge(
             screenshot_id=screenshot_id,
             screenshot_path=screenshot_path,
-            screenshot_base64=screenshot_base64,
+            screenshot_base64="",
             task_context=task_context,
             successful_actions=successful_actions,
             failed_actions=failed_actions,
             ui_elements=ui_elements,
-            similarity_tags=similarity_tags
+            similarity_tags=similarity_tags,
+            screenshot_digest=screenshot_digest
         )
         
-        self.screenshot_knowledge.append(knowledge)
-        self.update_vectorization()
+        with self._screenshot_lock:
+            self.screenshot_index.add(len(self.screenshot_knowledge), knowledge)
+            self.screenshot_knowledge.append(knowledge)
+            self._bump_version()
+            self._mark_screenshot(knowledge)
+        self.schedule_save()
         return screenshot_id
     
     def update_vectorization(self):
-        """更新向量化数据用于相似性搜索"""
-        if not self.task_experiences:
-            return
+        """按当前任务经验重建检索索引（删除经验后使用）"""
+        with self._task_lock:
+            self.task_index.rebuild(self._experience_text(exp) for exp in self.task_experiences)
+            self._index_dirty = True
+            self._bump_version()
+        self.save_knowledge()
+    
+    def import_experiences(self,
+                           task_experiences: List[TaskExperience],
+                           screenshot_knowledge: List[ScreenshotKnowledge],
+                           blob_store: Optional[BlobStore] = None) -> int:
+        """
+        导入其他知识库中的任务经验和截图知识（例如并行执行的工作进程）
         
-        # 准备文本数据
-        texts = []
-        for exp in self.task_experiences:
-            text = f"{exp.task_description} {exp.task_goal} {' '.join(exp.thoughts)}"
-            texts.append(text)
-        
-        # TF-IDF向量化
-        self.vectorizer = TfidfVectorizer(
-            max_features=1000,
-            stop_words=None,
-            ngram_range=(1, 2)
-        )
-        tfidf_matrix = self.vectorizer.fit_transform(texts)
+        Args:
+            task_experiences: 任务经验
+            screenshot_knowledge: 截图知识
+            blob_store: 来源知识库的截图存储，用于复制截图内容
         
-        # 计算相似性矩阵
-        self.similarity_matrix = cosine_similarity(tfidf_matrix)
-
+        Returns:
+            int: 导入的任务经验数量
+        """
+        with self._task_lock:
+            for exp in task_experiences:
+                self.task_experiences.append(exp)
+                self.task_index.append(self._experience_text(exp))
+                self._mark_task(exp)
+            self._index_dirty = self._index_dirty or bool(task_experiences)
+            self._bump_version()
+        for sk in screenshot_knowledge:
+            if blob_store is not None and sk.screenshot_digest and not self.blob_store.exists(sk.screenshot_digest):
+                data = blob_store.get(sk.screenshot_digest)
+                if data is not None:
+                    self.blob_store.put(data)
+            with self._screenshot_lock:
+                self.screenshot_index.add(len(self.screenshot_knowledge), sk)
+                self.screenshot_knowledge.append(sk)
+                self._bump_version()
+                self._mark_screenshot(sk)
         self.save_knowledge()
+        return len(task_experiences)
+    
+    def apply_counter_deltas(self,
+                             task_deltas: Dict[str, Tuple[int, int]],
+                             screenshot_deltas: Dict[str, Tuple[int, int]]) -> int:
+        """
+        累加其他知识库对已有条目的计数变化（例如并行执行的工作进程）
+        
+        Args:
+            task_deltas: 任务ID -> (使用次数增量, 失败次数增量)
+            screenshot_deltas: 截图ID -> (使用次数增量, 失败次数增量)
+        
+        Returns:
+            int: 更新的条目数量
+        """
+        updated_count = 0
+        if task_deltas:
+            with self._task_lock:
+                for exp in self.task_experiences:
+                    delta = task_deltas.get(exp.task_id)
+                    if delta:
+                        exp.usage_count += delta[0]
+                        exp.failure_count += delta[1]
+                        self._mark_task_counter(exp)
+                        updated_count += 1
+        if screenshot_deltas:
+            with self._screenshot_lock:
+                for sk in self.screenshot_knowledge:
+                    delta = screenshot_deltas.get(sk.screenshot_id)
+                    if delta:
+                        sk.usage_count += delta[0]
+                        sk.failure_count += delta[1]
+                        self._mark_screenshot_counter(sk)
+                        updated_count += 1
+        if updated_count > 0:
+            self.save_knowledge()
+        return updated_count
+    
+    def start_retrieval_session(self) -> RetrievalSession:
+        """开始一次任务执行的检索会话，多个智能体共享知识库时各自持有"""
+        return RetrievalSession()
     
     def search_similar_tasks(self, 
                             current_task: str, 
                             top_k: int = 5,
-                            only_successful: bool = False) -> List[TaskExperience]:
-        """搜索相似任务"""
-        if self.vectorizer is None or self.similarity_matrix is None:
-            return []
-        
-        # 向量化当前任务
-        current_vector = self.vectorizer.transform([current_task])
-        
-        # 计算与所有历史任务的相似性
-        similarities = cosine_similarity(current_vector, self.vectorizer.transform([
-            f"{exp.task_description} {exp.task_goal}" for exp in self.task_experiences
-        ]))[0]
+                            only_successful: bool = False,
+                            session: Optional[RetrievalSession] = None) -> List[TaskExperience]:
+        """
+        搜索相似任务
         
-        # 获取最相似的任务索引
-        similar_indices = np.argsort(similarities)[::-1]
+        Args:
+            current_task: 当前任务描述
+            top_k: 返回的任务数量
+            only_successful: 是否只返回成功的任务
+            session: 检索会话，记录被检索的经验；不传时使用知识库的默认会话
         
-        # 记录被检索的经验索引，以便后续更新失败计数
-        self._current_retrieved_task_indices = []
+        Returns:
+            List[TaskExperience]: 相似任务的副本，similarity_score 为本次查询的相似度
+        """
+        if session is None:
+            session = self._default_session
+            session.task_ids = []
         
-        results = []
-        for idx in similar_indices[:top_k * 2]:  # 取更多候选
-            exp = self.task_experiences[idx]
-            exp.similarity_score = float(similarities[idx])
+        with self._task_lock:
+            if not self.task_experiences:
+                return []
             
-            # 增加使用计数
-            self.task_experiences[idx].usage_count += 1
-            # 记录被检索的索引
-            self._current_retrieved_task_indices.append(idx)
+            # 取相似度最高的候选（取更多候选用于过滤）
+            similar_indices, similarities = self._task_candidates(QueryCache.normalize(current_task), top_k * 2)
             
-            if only_successful and not exp.success:
-                continue
+            results = []
+            for idx, similarity in zip(similar_indices, similarities):
+                exp = self.task_experiences[int(idx)]
                 
-            results.append(exp)
-            
-            if len(results) >= top_k:
-                break
+                # 增加使用计数
+                exp.usage_count += 1
+                self._mark_task_counter(exp)
+                # 记录被检索的经验，以便后续更新失败计数
+                session.task_ids.append(exp.task_id)
+                
+                if only_successful and not exp.success:
+                    continue
+                
+                # 返回副本，避免并发查询互相覆盖相似度
+                results.append(exp.copy(similarity_score=float(similarity)))
+                
+                if len(results) >= top_k:
+                    break
         
-        # 保存更新后的使用计数
-        self.save_knowledge()
+        # 标记使用计数已变化，延迟写盘
+        self.schedule_save()
         
         return results
     
     def search_similar_screenshots(self, 
                                   current_context: str,
-                                  top_k: int = 3) -> List[ScreenshotKnowledge]:
-        """搜索相似截图"""
-        if not self.screenshot_knowledge:
-            return []
-        
-        # 简单的文本匹配搜索
-        results = []
-        current_lower = current_context.lower()
-        matched_indices = []  # 记录匹配的索引，用于更新使用计数
-        
-        # 记录被检索的截图索引，以便后续更新失败计数
-        self._current_retrieved_screenshot_indices = []
-        
-        for idx, sk in enumerate(self.screenshot_knowledge):
-            # 计算匹配分数
-            score = 0
-            
-            # 任务上下文匹配
-            if any(word in sk.task_context.lower() for word in current_lower.split()):
-                score += 3
-            
-            # 标签匹配
-            for tag in sk.similarity_tags:
-                if tag.lower() in current_lower:
-                    score += 2
+                                  top_k: int = 3,
+                                  session: Optional[RetrievalSession] = None) -> List[ScreenshotKnowledge]:
+        """
+        搜索相似截图
+        
+        Args:
+            current_context: 当前上下文
+            top_k: 返回的截图知识数量
+            session: 检索会话，记录被检索的截图知识；不传时使用知识库的默认会话
+        """
+        if session is None:
+            session = self._default_session
+            session.screenshot_ids = []
+        
+        with self._screenshot_lock:
+            if not self.screenshot_knowledge:
+                return []
             
-            # UI元素匹配
-            for element_type, element_info in sk.ui_elements.items():
-                if isinstance(element_info, str) and element_info.lower() in current_lower:
-                    score += 1
+            # 通过倒排索引计算匹配分数（上下文匹配+3，标签匹配+2，UI元素匹配+1）
+            scores = self._screenshot_scores(QueryCache.normalize(current_context))
+            results = [(self.screenshot_knowledge[idx], score) for idx, score in scores]
             
-            if score > 0:
-                results.append((sk, score))
-                matched_indices.append(idx)
-                # 记录被检索的索引
-                self._current_retrieved_screenshot_indices.append(idx)
+            # 更新匹配项的使用计数，并记录到检索会话以便后续更新失败计数
+            for sk, _ in results:
+                sk.usage_count += 1
+                self._mark_screenshot_counter(sk)
+                session.screenshot_ids.append(sk.screenshot_id)
         
-        # 更新匹配项的使用计数
-        for idx in matched_indices:
-            self.screenshot_knowledge[idx].usage_count += 1
-        
-        # 按分数排序
+        # 按分数排序，同分时保持插入顺序
         results.sort(key=lambda x: x[1], reverse=True)
         final_results = [sk for sk, _ in results[:top_k]]
         
-        # 保存更新后的使用计数
-        if matched_indices:
-            self.save_knowledge()
+        # 标记使用计数已变化，延迟写盘
+        if results:
+            self.schedule_save()
         
         return final_results
     
-    def get_successful_actions_for_context(self, context: str) -> List[Dict]:
+    def get_successful_actions_for_context(self, context: str,
+                                           session: Optional[RetrievalSession] = None) -> List[Dict]:
         """根据上下文获取成功操作"""
-        similar_screenshots = self.search_similar_screenshots(context)
+        similar_screenshots = self.search_similar_screenshots(context, session=session)
         successful_actions = []
         
         for sk in similar_screenshots:
@@ -340,9 +616,10 @@ class RAGKnowledgeBase:
         
         return successful_actions
     
-    def get_failure_patterns(self, context: str) -> List[Dict]:
+    def get_failure_patterns(self, context: str,
+                             session: Optional[RetrievalSession] = None) -> List[Dict]:
         """根据上下文获取失败模式"""
-        similar_screenshots = self.search_similar_screenshots(context)
+        similar_screenshots = self.search_similar_screenshots(context, session=session)
         failure_patterns = []
         
         for sk in similar_screenshots:
@@ -350,11 +627,89 @@ class RAGKnowledgeBase:
         
         return failure_patterns
     
-    def get_learning_insights(self, current_task: str) -> Dict[str, Any]:
+    def get_learning_insights(self, current_task: str,
+                              session: Optional[RetrievalSession] = None) -> Dict[str, Any]:
         """获取学习洞察"""
         # 搜索相似任务
-        similar_tasks = self.search_similar_tasks(current_task, top_k=5)
+        with self._task_lock:
+            similar_tasks = self.search_similar_tasks(current_task, top_k=5, session=session)
+            version = self.version
+        return self._cached_insights(QueryCache.normalize(current_task), 5, version, similar_tasks)
+    
+    def retrieve(self,
+                 query: str,
+                 task_top_k: int = 3,
+                 insight_top_k: int = 5,
+                 screenshot_top_k: int = 2,
+                 session: Optional[RetrievalSession] = None) -> Dict[str, Any]:
+        """
+        一次检索同时得到学习洞察、相似成功任务和相似截图
+        
+        洞察和成功任务来自同一组按相似度排序的候选，每条候选只计一次使用，
+        结果与分别调用 get_learning_insights 和 search_similar_tasks(only_successful=True) 一致
+        
+        Args:
+            query: 查询文本
+            task_top_k: 返回的相似成功任务数量
+            insight_top_k: 用于生成学习洞察的相似任务数量
+            screenshot_top_k: 返回的相似截图数量
+            session: 检索会话，记录被检索的知识；不传时使用知识库的默认会话
+        
+        Returns:
+            Dict: 包含 insights、similar_tasks、similar_screenshots
+        """
+        if session is None:
+            session = self._default_session
+            session.clear()
+        
+        insight_tasks: List[TaskExperience] = []
+        successful_tasks: List[TaskExperience] = []
+        query = QueryCache.normalize(query)
+        with self._task_lock:
+            version = self.version
+            if self.task_experiences:
+                # 成功任务最多在前 task_top_k*2 个候选中查找
+                success_window = task_top_k * 2
+                similar_indices, similarities = self._task_candidates(query, max(insight_top_k, success_window))
+                for position, (idx, similarity) in enumerate(zip(similar_indices, similarities)):
+                    exp = self.task_experiences[int(idx)]
+                    result = exp.copy(similarity_score=float(similarity))
+                    used = False
+                    if len(insight_tasks) < insight_top_k:
+                        insight_tasks.append(result)
+                        used = True
+                    if position < success_window and len(successful_tasks) < task_top_k:
+                        used = True
+                        if exp.success:
+                            successful_tasks.append(result)
+                    if not used:
+                        break
+                    
+                    # 增加使用计数，并记录到检索会话
+                    exp.usage_count += 1
+                    self._mark_task_counter(exp)
+                    session.task_ids.append(exp.task_id)
+        
+        if insight_tasks:
+            self.schedule_save()
         
+        return {
+            "insights": self._cached_insights(query, insight_top_k, version, insight_tasks),
+            "similar_tasks": successful_tasks,
+            "similar_screenshots": self.search_similar_screenshots(query, screenshot_top_k, session=session)
+        }
+    
+    def _cached_insights(self, query: str, top_k: int, version: int,
+                         similar_tasks: List[TaskExperience]) -> Dict[str, Any]:
+        """读取或生成学习洞察，返回副本避免调用方修改缓存内容"""
+        insights = self.query_cache.get_or_compute(
+            ("insights", query, top_k), version, lambda: self._summarize_insights(similar_tasks)
+        )
+        return copy.deepcopy(insights)
+    
+    @staticmethod
+    def _summarize_insights(similar_tasks: List[TaskExperience]) -> Dict[str, Any]:
+        """根据相似任务分析成功和失败模式，生成学习洞察"""
         # 分析成功和失败模式
         successful_tasks = [t for t in similar_tasks if t.success]
         failed_tasks = [t for t in similar_tasks if not t.success]
@@ -408,21 +763,23 @@ class RAGKnowledgeBase:
         return insights
     
     def get_statistics(self) -> Dict[str, Any]:
-        """获取知识库统计信息"""
-        total_tasks = len(self.task_experiences)
-        successful_tasks = len([t for t in self.task_experiences if t.success])
-        
-        # 统计任务和截图的使用次数和失败次数
-        task_usage_count = sum([t.usage_count for t in self.task_experiences])
-        task_failure_count = sum([t.failure_count for t in self.task_experiences])
-        screenshot_usage_count = sum([s.usage_count for s in self.screenshot_knowledge])
-        screenshot_failure_count = sum([s.failure_count for s in self.screenshot_knowledge])
-        
-        # 获取最常使用的任务和截图
-        most_used_tasks = sorted(self.task_experiences, key=lambda x: x.usage_count, reverse=True)[:3]
-        most_failed_tasks = sorted(self.task_experiences, key=lambda x: x.failure_count, reverse=True)[:3]
-        most_used_screenshots = sorted(self.screenshot_knowledge, key=lambda x: x.usage_count, reverse=True)[:3]
-        most_failed_screenshots = sorted(self.screenshot_knowledge, key=lambda x: x.failure_count, reverse=True)[:3]
+        """获取知识库统计信息（在列式存储上向量化计算）"""
+        tasks, screenshots = self.task_experiences, self.screenshot_knowledge
+        with self._task_lock, self._screenshot_lock:
+            total_tasks = len(tasks)
+            successful_tasks = int(np.count_nonzero(tasks.column("success")))
+            
+            # 统计任务和截图的使用次数和失败次数
+            task_usage_count = int(tasks.column("usage_count").sum())
+            task_failure_count = int(tasks.column("failure_count").sum())
+            screenshot_usage_count = int(screenshots.column("usage_count").sum())
+            screenshot_failure_count = int(screenshots.column("failure_count").sum())
+            
+            # 获取最常使用的任务和截图
+            most_used_tasks = [tasks[i] for i in tasks.store.top_n("usage_count", 3)]
+            most_failed_tasks = [tasks[i] for i in tasks.store.top_n("failure_count", 3)]
+            most_used_screenshots = [screenshots[i] for i in screenshots.store.top_n("usage_count", 3)]
+            most_failed_screenshots = [screenshots[i] for i in screenshots.store.top_n("failure_count", 3)]
         
         # 计算失败率
         task_failure_rate = task_failure_count / task_usage_count if task_usage_count > 0 else 0
@@ -444,15 +801,13 @@ class RAGKnowledgeBase:
             "most_failed_tasks": [{"task_id": t.task_id, "description": t.task_description[:50] + "...", "failure_count": t.failure_count} for t in most_failed_tasks if t.failure_count > 0],
             "most_used_screenshots": [{"screenshot_id": s.screenshot_id, "context": s.task_context[:30] + "...", "usage_count": s.usage_count} for s in most_used_screenshots],
             "most_failed_screenshots": [{"screenshot_id": s.screenshot_id, "context": s.task_context[:30] + "...", "failure_count": s.failure_count} for s in most_failed_screenshots if s.failure_count > 0],
-            "knowledge_base_size_mb": self._get_knowledge_base_size()
+            "knowledge_base_size_mb": self._get_knowledge_base_size(),
+            "query_cache": self.query_cache.stats()  # 查询缓存命中统计
         }
     
     def _get_knowledge_base_size(self) -> float:
         """获取知识库大小（MB）"""
-        total_size = 0
-        for file_path in [self.experience_file, self.screenshot_file]:
-            if os.path.exists(file_path):
-                total_size += os.path.getsize(file_path)
+        total_size = self.storage.size_bytes() + self.blob_store.size_bytes()
         return total_size / (1024 * 1024)  # 转换为MB
     
     def clean_low_usage_data(self, 
@@ -472,56 +827,65 @@ class RAGKnowledgeBase:
         Returns:
             删除统计信息
         """
-        # 计算最大使用次数用于阈值计算
-        max_task_usage = max([t.usage_count for t in self.task_experiences], default=0)
-        max_screenshot_usage = max([s.usage_count for s in self.screenshot_knowledge], default=0)
-        
-        # 计算实际阈值（次数或百分比）
-        task_threshold = max(int(max_task_usage * usage_threshold), min_usage_count)
-        screenshot_threshold = max(int(max_screenshot_usage * usage_threshold), min_usage_count)
-        
-        stats = {
-            "removed_tasks": 0,
-            "remaining_tasks": 0,
-            "removed_screenshots": 0,
-            "remaining_screenshots": 0,
-            "removed_for_high_failure_rate": 0  # 新增：因高失败率删除的计数
-        }
-        
-        # 清理任务经验
-        if experience_type in ["tasks", "all"]:
-            original_count = len(self.task_experiences)
-            self.task_experiences = [
-                t for t in self.task_experiences 
-                if (t.usage_count >= task_threshold and 
-                    (t.usage_count == 0 or t.failure_count / t.usage_count <= max_failure_rate))
-            ]
-            removed_for_failure = sum(1 for t in self.task_experiences if 
-                                   t.usage_count > 0 and t.failure_count / t.usage_count > max_failure_rate)
-            stats["removed_tasks"] = original_count - len(self.task_experiences)
-            stats["remaining_tasks"] = len(self.task_experiences)
-            stats["removed_for_high_failure_rate"] += removed_for_failure
-        
-        # 清理截图知识
-        if experience_type in ["screenshots", "all"]:
-            original_count = len(self.screenshot_knowledge)
-            self.screenshot_knowledge = [
-                s for s in self.screenshot_knowledge 
-                if (s.usage_count >= screenshot_threshold and 
-                    (s.usage_count == 0 or s.failure_count / s.usage_count <= max_failure_rate))
-            ]
-            removed_for_failure = sum(1 for s in self.screenshot_knowledge if 
-                                   s.usage_count > 0 and s.failure_count / s.usage_count > max_failure_rate)
-            stats["removed_screenshots"] = original_count - len(self.screenshot_knowledge)
-            stats["remaining_screenshots"] = len(self.screenshot_knowledge)
-            stats["removed_for_high_failure_rate"] += removed_for_failure
-        
-        # 更新向量化数据
-        if stats["removed_tasks"] > 0:
-            self.update_vectorization()
-        
-        # 保存更新后的知识库
-        self.save_knowledge()
+        # 清理期间阻止检索和写入，保证索引位置与列表一致
+        with self._task_lock, self._screenshot_lock:
+            # 计算最大使用次数用于阈值计算
+            task_usage = self.task_experiences.column("usage_count")
+            screenshot_usage = self.screenshot_knowledge.column("usage_count")
+            max_task_usage = int(task_usage.max()) if len(task_usage) else 0
+            max_screenshot_usage = int(screenshot_usage.max()) if len(screenshot_usage) else 0
+        
+            # 计算实际阈值（次数或百分比）
+            task_threshold = max(int(max_task_usage * usage_threshold), min_usage_count)
+            screenshot_threshold = max(int(max_screenshot_usage * usage_threshold), min_usage_count)
+        
+            stats = {
+                "removed_tasks": 0,
+                "remaining_tasks": 0,
+                "removed_screenshots": 0,
+                "remaining_screenshots": 0,
+                "removed_for_high_failure_rate": 0  # 新增：因高失败率删除的计数
+            }
+        
+            # 清理任务经验
+            if experience_type in ["tasks", "all"]:
+                keep, high_failure = self._retention_mask(self.task_experiences, task_threshold, max_failure_rate)
+                removed = self.task_experiences.filter(keep)
+                stats["removed_tasks"] = len(removed)
+                with self._lock:
+                    self._changes.delete_tasks({t.task_id for t in removed})
+                stats["remaining_tasks"] = len(self.task_experiences)
+                stats["removed_for_high_failure_rate"] += int(np.count_nonzero(high_failure))
+        
+            # 清理截图知识
+            if experience_type in ["screenshots", "all"]:
+                keep, high_failure = self._retention_mask(
+                    self.screenshot_knowledge, screenshot_threshold, max_failure_rate
+                )
+                removed = self.screenshot_knowledge.filter(keep)
+                stats["removed_screenshots"] = len(removed)
+                with self._lock:
+                    self._changes.delete_screenshots({s.screenshot_id for s in removed})
+                if removed:
+                    self.screenshot_index.rebuild(self.screenshot_knowledge)
+                    self._bump_version()
+                with self._lock:
+                    self._unreferenced_digests.update(s.screenshot_digest for s in removed)
+                stats["remaining_screenshots"] = len(self.screenshot_knowledge)
+                stats["removed_for_high_failure_rate"] += int(np.count_nonzero(high_failure))
+        
+            # 更新向量化数据
+            if stats["removed_tasks"] > 0:
+                self.update_vectorization()
+        
+        # 保存更新后的知识库；记录删除写盘之后才删除截图内容，中途崩溃时不会留下引用已删除截图的记录
+        if self.save_knowledge():
+            with self._screenshot_lock:
+                with self._lock:
+                    candidates, self._unreferenced_digests = self._unreferenced_digests, set()
+                self.blob_store.delete_unreferenced(
+                    candidates, (s.screenshot_digest for s in self.screenshot_knowledge)
+                )
         
         print(f"✅ 清理完成: "
               f"删除 {stats['removed_tasks']} 个任务经验, "
@@ -530,31 +894,57 @@ class RAGKnowledgeBase:
         
         return stats
     
-    def record_task_failure(self):
-        """记录当前检索到的知识在任务执行中失败"""
+    @staticmethod
+    def _retention_mask(table: RecordTable, usage_threshold: int, max_failure_rate: float):
+        """
+        计算清理时保留的记录
+        
+        Returns:
+            (保留掩码, 因失败率过高而删除的掩码)
+        """
+        usage = table.column("usage_count")
+        failure = table.column("failure_count")
+        failure_rate = np.divide(failure, usage, out=np.zeros(len(usage)), where=usage > 0)
+        high_failure = (usage > 0) & (failure_rate > max_failure_rate)
+        return (usage >= usage_threshold) & ~high_failure, high_failure
+    
+    def record_task_failure(self, session: Optional[RetrievalSession] = None):
+        """
+        记录检索会话中检索到的知识在任务执行中失败
+        
+        Args:
+            session: 检索会话；不传时使用知识库的默认会话
+        """
+        if session is None:
+            session = self._default_session
         updated_count = 0
         
-        # 更新任务经验的失败计数
-        if hasattr(self, '_current_retrieved_task_indices'):
-            for idx in self._current_retrieved_task_indices:
-                if 0 <= idx < len(self.task_experiences):
-                    self.task_experiences[idx].failure_count += 1
-                    updated_count += 1
+        # 更新任务经验的失败计数（按ID查找，清理后被删除的经验自动跳过）
+        task_ids = set(session.task_ids)
+        if task_ids:
+            with self._task_lock:
+                for exp in self.task_experiences:
+                    if exp.task_id in task_ids:
+                        exp.failure_count += 1
+                        self._mark_task_counter(exp)
+                        updated_count += 1
         
         # 更新截图知识的失败计数
-        if hasattr(self, '_current_retrieved_screenshot_indices'):
-            for idx in self._current_retrieved_screenshot_indices:
-                if 0 <= idx < len(self.screenshot_knowledge):
-                    self.screenshot_knowledge[idx].failure_count += 1
-                    updated_count += 1
-        
-        # 保存更新后的失败计数
+        screenshot_ids = set(session.screenshot_ids)
+        if screenshot_ids:
+            with self._screenshot_lock:
+                for sk in self.screenshot_knowledge:
+                    if sk.screenshot_id in screenshot_ids:
+                        sk.failure_count += 1
+                        self._mark_screenshot_counter(sk)
+                        updated_count += 1
+        
+        # 标记失败计数已变化，延迟写盘
         if updated_count > 0:
-            self.save_knowledge()
+            self.schedule_save()
             print(f"已更新 {updated_count} 条知识记录的失败计数")
         
-        # 清空当前检索记录
-        self._current_retrieved_task_indices = []
-        self._current_retrieved_screenshot_indices = []
+        # 清空检索记录，避免重复计数
+        session.clear()
         
         return updated_count
\ No newline at end of file
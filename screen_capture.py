@@ -0,0 +1,170 @@
+"""
+截图采集流水线
+截图只编码一次，同一份字节同时用于模型请求、磁盘保存和知识库
+"""
+
+import os
+import time
+import base64
+import queue
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+from PIL import Image
+import pyautogui
+from image_encoding import ImageEncoder, PNGEncoder
+
+
+# 可选的缩放滤波器
+RESAMPLING_FILTERS = {
+    "nearest": Image.Resampling.NEAREST,
+    "box": Image.Resampling.BOX,
+    "bilinear": Image.Resampling.BILINEAR,
+    "hamming": Image.Resampling.HAMMING,
+    "bicubic": Image.Resampling.BICUBIC,
+    "lanczos": Image.Resampling.LANCZOS,
+}
+
+
+@dataclass
+class CapturedFrame:
+    """一次截图的采集结果"""
+    image: Image.Image  # 缩放后的图像
+    data: bytes  # 编码后的图像字节
+    base64: str  # data 的base64编码
+    mime_type: str
+    size: Tuple[int, int]
+    path: Optional[str] = None
+    timings: Dict[str, float] = field(default_factory=dict)  # 各阶段耗时（毫秒）
+
+    def format_timings(self) -> str:
+        """格式化各阶段耗时"""
+        parts = [f"{stage} {ms:.1f}ms" for stage, ms in self.timings.items()]
+        return ", ".join(parts)
+
+
+class ScreenshotWriter:
+    """后台写盘线程，避免截图保存阻塞主流程"""
+
+    def __init__(self, max_pending: int = 64):
+        self._queue: "queue.Queue[Optional[Tuple[str, bytes]]]" = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name="ScreenshotWriter", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                path, data = item
+                directory = os.path.dirname(path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(path, 'wb') as f:
+                    f.write(data)
+            except Exception as e:
+                print(f"❌ 截图保存失败: {e}")
+            finally:
+                self._queue.task_done()
+
+    def write(self, path: str, data: bytes):
+        """提交写盘任务"""
+        self._queue.put((path, data))
+
+    def flush(self):
+        """等待所有已提交的写盘任务完成"""
+        self._queue.join()
+
+    def close(self):
+        """写完剩余任务后停止线程"""
+        self._queue.put(None)
+        self._thread.join()
+
+
+class ScreenCapturePipeline:
+    """截图采集流水线：截屏 -> 缩放 -> 单次编码 -> base64，写盘交给后台线程"""
+
+    def __init__(self,
+                 target_size: Tuple[int, int] = (960, 540),
+                 resample: str = "lanczos",
+                 encoder: Optional[ImageEncoder] = None,
+                 writer: Optional[ScreenshotWriter] = None):
+        """
+        初始化截图采集流水线
+
+        Args:
+            target_size: 缩放后的截图尺寸，为None时不缩放
+            resample: 缩放滤波器名称，见 RESAMPLING_FILTERS
+            encoder: 图像编码器，为None时使用全彩PNG
+            writer: 后台写盘线程，为None时自动创建
+        """
+        self.target_size = target_size
+        self.resample = resample
+        self.encoder = encoder or PNGEncoder()
+        self.writer = writer or ScreenshotWriter()
+        self.last_frame: Optional[CapturedFrame] = None
+
+    @property
+    def resample(self) -> str:
+        return self._resample
+
+    @resample.setter
+    def resample(self, name: str):
+        if name not in RESAMPLING_FILTERS:
+            raise ValueError(f"不支持的缩放滤波器: {name}，可选: {', '.join(RESAMPLING_FILTERS)}")
+        self._resample = name
+
+    def encode(self, image: Image.Image) -> bytes:
+        """使用当前编码器编码图像"""
+        return self.encoder.encode(image)
+
+    def capture(self, save_path: Optional[str] = None, image: Optional[Image.Image] = None) -> CapturedFrame:
+        """
+        截取屏幕并完成一次编码
+
+        Args:
+            save_path: 截图保存路径，为None时不写盘；扩展名会替换为编码器对应的扩展名
+            image: 已经截取好的屏幕图像（例如等待界面稳定时的最后一帧），为None时重新截屏
+
+        Returns:
+            CapturedFrame: 采集结果
+        """
+        timings = {}
+
+        start = time.perf_counter()
+        screenshot = image if image is not None else pyautogui.screenshot()
+        timings["grab"] = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        if self.target_size and screenshot.size != tuple(self.target_size):
+            screenshot = screenshot.resize(self.target_size, RESAMPLING_FILTERS[self.resample])
+        timings["resize"] = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        data = self.encode(screenshot)
+        timings["encode"] = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        img_base64 = base64.b64encode(data).decode()
+        timings["base64"] = (time.perf_counter() - start) * 1000
+
+        if save_path:
+            save_path = os.path.splitext(save_path)[0] + self.encoder.extension
+            self.writer.write(save_path, data)
+
+        frame = CapturedFrame(
+            image=screenshot,
+            data=data,
+            base64=img_base64,
+            mime_type=self.encoder.mime_type,
+            size=screenshot.size,
+            path=save_path,
+            timings=timings
+        )
+        self.last_frame = frame
+        return frame
+
+    def flush(self):
+        """等待后台写盘完成"""
+        self.writer.flush()
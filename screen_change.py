@@ -0,0 +1,214 @@
+"""
+屏幕变化检测
+通过低分辨率灰度帧差分和感知哈希判断屏幕自上一步以来是否发生变化，以及操作后界面何时稳定
+"""
+
+import time
+from typing import Callable, Optional, Tuple, Iterable
+import numpy as np
+from PIL import Image
+
+
+def downsample_gray(image: Image.Image, size: Tuple[int, int] = (320, 180)) -> np.ndarray:
+    """将图像缩小为低分辨率灰度数组（按区域平均，保留小字符和光标的变化）"""
+    small = image.convert("L").resize(size, Image.Resampling.BOX)
+    return np.asarray(small, dtype=np.int16)
+
+
+def changed_ratio(previous: np.ndarray, current: np.ndarray, pixel_tolerance: int = 8) -> float:
+    """计算两帧之间灰度差超过容差的像素比例"""
+    if previous.shape != current.shape:
+        return 1.0
+    return float(np.count_nonzero(np.abs(current - previous) > pixel_tolerance)) / current.size
+
+
+def compute_dhash(image: Image.Image, hash_size: int = 16) -> str:
+    """计算图像的差值感知哈希（dHash），返回十六进制字符串"""
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return np.packbits(bits).tobytes().hex()
+
+
+def hamming_distance(hash_a: str, hash_b: str) -> int:
+    """计算两个十六进制哈希之间的汉明距离"""
+    return bin(int(hash_a, 16) ^ int(hash_b, 16)).count("1")
+
+
+class FrameChangeDetector:
+    """屏幕变化检测器，判断屏幕是否自上一步以来保持不变并给出处理策略"""
+
+    POLICIES = ("repoll", "backoff", "reuse")
+
+    def __init__(self,
+                 policy: str = "reuse",
+                 grid_size: Tuple[int, int] = (320, 180),
+                 pixel_tolerance: int = 8,
+                 change_threshold: float = 0.0,
+                 max_repolls: int = 3,
+                 poll_interval: float = 0.5,
+                 max_backoff: float = 4.0,
+                 max_reuses: int = 2,
+                 reusable_actions: Iterable[str] = ("wait",)):
+        """
+        初始化屏幕变化检测器
+
+        Args:
+            policy: 屏幕未变化时的策略
+                repoll: 按固定间隔重新截图
+                backoff: 按指数退避间隔重新截图
+                reuse（默认）: 上一步为可复用操作时直接复用上一步决策、跳过模型调用，
+                    否则立即调用模型（重新截图之后仍要调用模型，等待只会增加延迟）
+            grid_size: 帧差分使用的低分辨率网格尺寸
+            pixel_tolerance: 单个像素的灰度容差
+            change_threshold: 变化像素比例不超过该值时视为屏幕未变化
+            max_repolls: 最多重新截图次数，超过后照常调用模型
+            poll_interval: 重新截图的基础间隔（秒）
+            max_backoff: 指数退避的最大间隔（秒）
+            max_reuses: 连续复用上一步决策的最大次数
+            reusable_actions: 允许复用的操作类型
+        """
+        if policy not in self.POLICIES:
+            raise ValueError(f"不支持的策略: {policy}，可选: {', '.join(self.POLICIES)}")
+        self.policy = policy
+        self.grid_size = grid_size
+        self.pixel_tolerance = pixel_tolerance
+        self.change_threshold = change_threshold
+        self.max_repolls = max_repolls
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+        self.max_reuses = max_reuses
+        self.reusable_actions = set(reusable_actions)
+        self.reset()
+
+    def reset(self):
+        """开始新任务时清空上一帧记录"""
+        self._last_signature: Optional[np.ndarray] = None
+        self.consecutive_reuses = 0
+        self.skipped_inferences = 0
+
+    def signature(self, image: Image.Image) -> np.ndarray:
+        """计算用于帧差分的低分辨率签名"""
+        return downsample_gray(image, self.grid_size)
+
+    def is_unchanged(self, image: Image.Image) -> bool:
+        """判断当前帧与上一次记录的帧相比是否没有变化"""
+        if self._last_signature is None:
+            return False
+        ratio = changed_ratio(self._last_signature, self.signature(image), self.pixel_tolerance)
+        return ratio <= self.change_threshold
+
+    def record(self, image: Image.Image):
+        """记录当前帧作为下一步的比较基准"""
+        self._last_signature = self.signature(image)
+        self.consecutive_reuses = 0
+
+    def should_reuse(self, last_action_type: Optional[str]) -> bool:
+        """屏幕未变化时是否可以直接复用上一步决策"""
+        if self.policy != "reuse" or last_action_type not in self.reusable_actions:
+            return False
+        if self.consecutive_reuses >= self.max_reuses:
+            return False
+        self.consecutive_reuses += 1
+        self.skipped_inferences += 1
+        return True
+
+    @property
+    def repolls(self) -> bool:
+        """屏幕未变化且不复用决策时是否重新截图"""
+        return self.policy in ("repoll", "backoff")
+
+    def poll_delay(self, attempt: int) -> float:
+        """第attempt次重新截图前的等待时间"""
+        if self.policy == "backoff":
+            return min(self.poll_interval * (2 ** attempt), self.max_backoff)
+        return self.poll_interval
+
+
+class SettleDetector:
+    """
+    界面稳定检测器，轮询低分辨率帧直到界面不再变化，替代固定时长的等待
+
+    轮询整屏并缩小到 grid_size 后比较，界面任何位置的变化（弹窗、页面加载、重绘）都会被检测到
+    """
+
+    def __init__(self,
+                 grab: Optional[Callable[[], Image.Image]] = None,
+                 poll_grab: Optional[Callable[[], Image.Image]] = None,
+                 grid_size: Tuple[int, int] = (320, 180),
+                 pixel_tolerance: int = 8,
+                 change_threshold: float = 0.0,
+                 poll_interval: float = 0.15,
+                 stable_polls: int = 2,
+                 floor: float = 0.2,
+                 ceiling: float = 2.0):
+        """
+        初始化界面稳定检测器
+
+        Args:
+            grab: 全屏截屏函数，为None时使用 pyautogui.screenshot
+            poll_grab: 轮询时使用的截屏函数，为None时使用 grab
+            grid_size: 帧差分使用的低分辨率网格尺寸
+            pixel_tolerance: 单个像素的灰度容差
+            change_threshold: 变化像素比例不超过该值时视为两帧相同
+            poll_interval: 轮询间隔（秒）
+            stable_polls: 连续多少次轮询无变化视为界面已稳定
+            floor: 最短等待时间（秒）
+            ceiling: 最长等待时间（秒）
+        """
+        if grab is None:
+            import pyautogui
+            grab = pyautogui.screenshot
+        self.grab = grab
+        self.poll_grab = poll_grab or grab
+        self.grid_size = grid_size
+        self.pixel_tolerance = pixel_tolerance
+        self.change_threshold = change_threshold
+        self.poll_interval = poll_interval
+        self.stable_polls = stable_polls
+        self.floor = floor
+        self.ceiling = ceiling
+        self.last_image: Optional[Image.Image] = None
+        self.last_wait = 0.0
+
+    def wait(self,
+             floor: Optional[float] = None,
+             ceiling: Optional[float] = None,
+             capture_final: bool = True) -> float:
+        """
+        等待界面稳定
+
+        Args:
+            floor: 本次最短等待时间，为None时使用默认值
+            ceiling: 本次最长等待时间，为None时使用默认值
+            capture_final: 稳定后是否截取一次全屏保存到 last_image
+
+        Returns:
+            float: 实际等待时间（秒）
+        """
+        floor = self.floor if floor is None else floor
+        ceiling = self.ceiling if ceiling is None else max(ceiling, floor)
+        start = time.perf_counter()
+        previous = None
+        stable = 0
+        self.last_image = None
+
+        while True:
+            image = self.poll_grab()
+            current = downsample_gray(image, self.grid_size)
+            if previous is not None and changed_ratio(previous, current, self.pixel_tolerance) <= self.change_threshold:
+                stable += 1
+            else:
+                stable = 0
+            previous = current
+
+            elapsed = time.perf_counter() - start
+            if (elapsed >= floor and stable >= self.stable_polls) or elapsed >= ceiling:
+                break
+            time.sleep(min(self.poll_interval, ceiling - elapsed))
+
+        if capture_final:
+            # 轮询本身就是全屏截图时直接使用最后一帧
+            self.last_image = image if self.poll_grab is self.grab else self.grab()
+        self.last_wait = time.perf_counter() - start
+        return self.last_wait
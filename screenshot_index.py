@@ -0,0 +1,94 @@
+"""
+截图知识倒排索引
+按任务上下文的字符n-gram、相似性标签和UI元素描述索引截图知识，
+查询开销取决于命中的条目数而不是知识库大小
+"""
+
+from collections import Counter, defaultdict
+from typing import Dict, List, Set
+
+
+class ScreenshotInvertedIndex:
+    """
+    截图知识倒排索引，评分规则与线性扫描一致：
+        - 查询中任一词是任务上下文的子串：+3
+        - 每个是查询子串的相似性标签：+2
+        - 每个是查询子串的UI元素描述（字符串）：+1
+    """
+
+    def __init__(self, ngram: int = 3):
+        """
+        Args:
+            ngram: 上下文子串检索使用的最大n-gram长度
+        """
+        self.ngram = ngram
+        self.clear()
+
+    def clear(self):
+        """清空索引"""
+        self._contexts: Dict[str, List[int]] = {}  # 小写上下文 -> 截图位置
+        self._grams: Dict[str, Set[str]] = defaultdict(set)  # n-gram -> 包含它的上下文
+        self._tags: Dict[str, Counter] = defaultdict(Counter)  # 小写标签 -> {截图位置: 次数}
+        self._elements: Dict[str, Counter] = defaultdict(Counter)  # 小写UI元素描述 -> {截图位置: 次数}
+
+    def add(self, position: int, sk):
+        """索引位于 position 的截图知识"""
+        context = sk.task_context.lower()
+        if context not in self._contexts:
+            self._contexts[context] = []
+            for n in range(1, self.ngram + 1):
+                for i in range(len(context) - n + 1):
+                    self._grams[context[i:i + n]].add(context)
+        self._contexts[context].append(position)
+        for tag in sk.similarity_tags:
+            self._tags[tag.lower()][position] += 1
+        for element_info in sk.ui_elements.values():
+            if isinstance(element_info, str):
+                self._elements[element_info.lower()][position] += 1
+
+    def rebuild(self, screenshot_knowledge: List):
+        """按列表顺序重建索引（删除截图知识后使用）"""
+        self.clear()
+        for position, sk in enumerate(screenshot_knowledge):
+            self.add(position, sk)
+
+    def _contexts_containing(self, word: str) -> Set[str]:
+        """查找包含 word 子串的上下文：取最少的n-gram倒排表再逐个验证"""
+        gram_len = min(len(word), self.ngram)
+        postings = []
+        for i in range(len(word) - gram_len + 1):
+            posting = self._grams.get(word[i:i + gram_len])
+            if not posting:
+                return set()
+            postings.append(posting)
+        smallest = min(postings, key=len)
+        return {context for context in smallest if word in context}
+
+    def scores(self, query: str) -> Dict[int, int]:
+        """
+        计算查询命中的截图知识分数
+
+        Returns:
+            Dict[截图位置, 分数]，只包含分数大于0的条目
+        """
+        query = query.lower()
+        scores: Dict[int, int] = defaultdict(int)
+
+        matched_contexts: Set[str] = set()
+        for word in set(query.split()):
+            matched_contexts |= self._contexts_containing(word)
+        for context in matched_contexts:
+            for position in self._contexts[context]:
+                scores[position] += 3
+
+        for tag, counts in self._tags.items():
+            if tag in query:
+                for position, count in counts.items():
+                    scores[position] += 2 * count
+
+        for element_info, counts in self._elements.items():
+            if element_info in query:
+                for position, count in counts.items():
+                    scores[position] += count
+
+        return scores
@@ -1,21 +1,135 @@
 from PIL import Image, ImageDraw
 import matplotlib.pyplot as plt
 import re
+import threading
+import time
+from typing import Dict, List, Any, Optional, Tuple
 import pyautogui
 
-def find_position(params):
+try:
+    from screeninfo import get_monitors
+except ImportError:
+    get_monitors = None
+
+
+class ScreenGeometry:
+    """屏幕几何信息服务，缓存分辨率、缩放比例和显示器布局，仅在显示设置变化时刷新"""
+
+    def __init__(self, check_interval: float = 1.0):
+        """
+        初始化屏幕几何信息服务
+
+        Args:
+            check_interval: 检查显示设置是否变化的最小间隔（秒）
+        """
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._logical_size: Optional[Tuple[int, int]] = None
+        self._screen_size: Optional[Tuple[int, int]] = None
+        self._scale_factor = 1.0
+        self._monitors: List[Dict[str, Any]] = []
+        self._last_check = 0.0
+        self.refresh_count = 0
+
+    def _refresh(self, logical_size: Tuple[int, int]):
+        """显示设置变化时重新读取截图尺寸、缩放比例和显示器布局"""
+        # 只有在显示设置变化时才截一次全屏，用于获取实际像素尺寸
         screenshot = pyautogui.screenshot()
-        original_width,original_height = screenshot.size
-        x ,y = params
+        self._screen_size = screenshot.size
+        self._logical_size = logical_size
+        self._scale_factor = self._screen_size[0] / logical_size[0] if logical_size[0] else 1.0
+        self._monitors = self._read_monitors()
+        self.refresh_count += 1
+
+    def _read_monitors(self) -> List[Dict[str, Any]]:
+        """读取显示器布局，未安装screeninfo时视为单显示器"""
+        if get_monitors is not None:
+            try:
+                return [
+                    {
+                        "x": m.x,
+                        "y": m.y,
+                        "width": m.width,
+                        "height": m.height,
+                        "is_primary": bool(getattr(m, "is_primary", False))
+                    }
+                    for m in get_monitors()
+                ]
+            except Exception:
+                pass
+        width, height = self._screen_size
+        return [{"x": 0, "y": 0, "width": width, "height": height, "is_primary": True}]
+
+    def _ensure_current(self, force: bool = False) -> Tuple[Tuple[int, int], float]:
+        """
+        按检查间隔确认显示设置是否变化，pyautogui.size() 不需要截图
+
+        Args:
+            force: 忽略检查间隔，立即比较逻辑分辨率
+
+        Returns:
+            Tuple: 当前的截图像素尺寸和缩放比例
+        """
+        now = time.time()
+        with self._lock:
+            if self._screen_size is None or force or now - self._last_check >= self.check_interval:
+                self._last_check = now
+                logical_size = tuple(pyautogui.size())
+                if logical_size != self._logical_size:
+                    self._refresh(logical_size)
+            return self._screen_size, self._scale_factor
+
+    def invalidate(self):
+        """强制下一次访问时重新读取屏幕信息"""
+        with self._lock:
+            self._logical_size = None
+            self._screen_size = None
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """截图像素尺寸 (宽, 高)"""
+        self._ensure_current()
+        return self._screen_size
+
+    @property
+    def scale_factor(self) -> float:
+        """截图像素与逻辑坐标之间的缩放比例（高DPI屏幕上大于1）"""
+        self._ensure_current()
+        return self._scale_factor
+
+    @property
+    def monitors(self) -> List[Dict[str, Any]]:
+        """显示器布局列表"""
+        self._ensure_current()
+        return list(self._monitors)
+
+    def to_absolute(self, params) -> Tuple[int, int]:
+        """
+        将模型输出的千分比坐标换算为 pyautogui 使用的逻辑坐标
+
+        千分比相对于截图像素尺寸，换算后除以缩放比例；高DPI屏幕上截图像素多于逻辑坐标
+        """
+        # 每次换算都比较逻辑分辨率（开销很小），缩放设置变化后立即生效
+        (original_width, original_height), scale = self._ensure_current(force=True)
+        x, y = params
         if x and y:
-            x = int(x/1000*original_width)  # 提取第一个数字并转为绝对坐标
-            y = int(y/1000*original_height)  # 提取第二个数字并转为绝对坐标  # 生成整数元组
+            x = int(x/1000*original_width/scale)  # 提取第一个数字并转为绝对坐标
+            y = int(y/1000*original_height/scale)  # 提取第二个数字并转为绝对坐标  # 生成整数元组
         else:
             raise ValueError(f"坐标参数错误，换算失败")
+        return x, y
+
+
+# 全局共享的屏幕几何信息服务
+screen_geometry = ScreenGeometry()
+
+
+def find_position(params):
+        x, y = screen_geometry.to_absolute(params)
         # print(action_point)
         # 在原图上标记动作位置
         # image = Image.open(image_path)
         # draw = ImageDraw.Draw(image)
         # draw.ellipse((action_point[0]-5, action_point[1]-5, action_point[0]+5, action_point[1]+5), fill="red")
 
-        return x,y
\ No newline at end of file
+        return x,y
@@ -0,0 +1,160 @@
+"""
+流式响应解析
+增量扫描模型输出的JSON，action字段一结束就交给执行器，其余内容在后台继续接收
+"""
+
+import json
+import threading
+from typing import Any, Callable, Iterable, Optional, Tuple
+
+
+class StreamingActionScanner:
+    """增量JSON字段扫描器，从流式文本中提取顶层字段的字符串值"""
+
+    def __init__(self, field: str = "action"):
+        """
+        Args:
+            field: 需要提前提取的顶层字段名
+        """
+        self.field = field
+        self.value: Optional[str] = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._in_comment = False
+        self._prev_char = ""
+        self._buffer = []
+        self._last_string: Optional[str] = None
+        self._current_key: Optional[str] = None
+        self._expect_key = False
+
+    def feed(self, text: str) -> Optional[str]:
+        """
+        输入新到达的文本片段
+
+        Args:
+            text: 流式返回的增量文本
+
+        Returns:
+            字段值在本次输入中完整结束时返回解码后的值，否则返回None
+        """
+        if self.value is not None or not text:
+            return None
+        for ch in text:
+            if self._in_comment:
+                if ch == "\n":
+                    self._in_comment = False
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    self._buffer.append(ch)
+                elif ch == "\\":
+                    self._escape = True
+                    self._buffer.append(ch)
+                elif ch == '"':
+                    self._in_string = False
+                    if self._close_string():
+                        return self.value
+                else:
+                    self._buffer.append(ch)
+                continue
+
+            if ch == '"':
+                if self._depth > 0:
+                    self._in_string = True
+                    self._buffer = []
+            elif (ch == "/" and self._prev_char == "/") or ch == "#":
+                # 字符串外的 // 和 # 注释（提示词的输出格式示例中使用 #）
+                self._in_comment = True
+            elif ch in "{[":
+                self._depth += 1
+                self._expect_key = ch == "{"
+                self._current_key = None
+            elif ch in "}]":
+                self._depth = max(0, self._depth - 1)
+                self._current_key = None
+            elif ch == ":":
+                if self._expect_key and self._last_string is not None:
+                    self._current_key = self._last_string
+                self._expect_key = False
+            elif ch == ",":
+                self._current_key = None
+                self._expect_key = True
+            self._prev_char = ch
+        return None
+
+    def _close_string(self) -> bool:
+        """字符串结束时判断是否为目标字段的值"""
+        raw = "".join(self._buffer)
+        self._prev_char = '"'
+        if self._expect_key:
+            self._last_string = raw
+            return False
+        if self._depth == 1 and self._current_key == self.field:
+            try:
+                self.value = json.loads(f'"{raw}"')
+            except ValueError:
+                self.value = raw
+            return True
+        return False
+
+
+class StreamingInference:
+    """在后台线程中接收流式响应，提前暴露action字段"""
+
+    def __init__(self,
+                 chunks: Iterable[Any],
+                 finalize: Callable[[str], Any],
+                 field: str = "action"):
+        """
+        Args:
+            chunks: chat.completions.create(stream=True) 返回的分块迭代器
+            finalize: 将完整响应文本解析为最终结果的函数
+            field: 需要提前提取的顶层字段名
+        """
+        self._chunks = chunks
+        self._finalize = finalize
+        self.scanner = StreamingActionScanner(field)
+        self.text = ""
+        self.total_tokens = 0
+        self.response = None
+        self.error: Optional[BaseException] = None
+        self._action_ready = threading.Event()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._consume, name="StreamingInference", daemon=True)
+        self._thread.start()
+
+    def _consume(self):
+        parts = []
+        try:
+            for chunk in self._chunks:
+                usage = getattr(chunk, "usage", None)
+                if usage is not None:
+                    self.total_tokens = usage.total_tokens
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content or ""
+                parts.append(delta)
+                if self.scanner.feed(delta) is not None:
+                    self._action_ready.set()
+            self.text = "".join(parts)
+            self.response = self._finalize(self.text)
+        except BaseException as e:
+            self.text = "".join(parts)
+            self.error = e
+        finally:
+            self._done.set()
+            self._action_ready.set()
+
+    def wait_action(self, timeout: Optional[float] = None) -> Optional[str]:
+        """等待action字段结束，流结束仍未找到时返回None"""
+        self._action_ready.wait(timeout)
+        return self.scanner.value
+
+    def result(self, timeout: Optional[float] = None) -> Tuple[Any, int]:
+        """等待完整响应，返回 (解析后的响应, token数)"""
+        self._done.wait(timeout)
+        if self.error is not None:
+            raise self.error
+        return self.response, self.total_tokens
@@ -0,0 +1,130 @@
+"""
+任务经验增量索引
+使用固定的哈希向量化（无需重新拟合）并保存文档频率统计，新增经验只追加一行；
+归一化后的文档矩阵缓存到经验变化为止，查询只需一次稀疏矩阵向量乘法
+
+排序与旧的TF-IDF实现不完全相同：旧实现在 描述+目标+思考过程 上拟合、只保留1000个最高频特征，
+本索引不限制特征数，文档频率只统计 描述+目标（与查询时比较的文本一致）；
+两者的top-k重合率可用 python benchmark_task_search.py --legacy 测量
+"""
+
+from typing import Iterable, List, Optional, Tuple
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+
+
+class IncrementalTaskIndex:
+    """基于哈希向量化和增量IDF统计的任务检索索引"""
+
+    def __init__(self, n_features: int = 2 ** 18, ngram_range=(1, 2)):
+        """
+        初始化增量索引
+
+        Args:
+            n_features: 哈希空间维度
+            ngram_range: 词组范围，与原TF-IDF配置相同
+        """
+        self.n_features = n_features
+        self.ngram_range = ngram_range
+        self.vectorizer = HashingVectorizer(
+            n_features=n_features,
+            ngram_range=ngram_range,
+            alternate_sign=False,
+            norm=None
+        )
+        self.rows: List[sparse.csr_matrix] = []
+        self.doc_freq = np.zeros(n_features, dtype=np.int64)
+        self._idf: Optional[np.ndarray] = None
+        self._matrix: Optional[sparse.csr_matrix] = None
+
+    def __getstate__(self):
+        # 缓存的文档矩阵和文档频率（n_features 维的稠密数组）都可以由词频行重建，不写入磁盘
+        state = self.__dict__.copy()
+        state["_idf"] = None
+        state["_matrix"] = None
+        state["doc_freq"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__dict__.setdefault("_idf", None)
+        self.__dict__.setdefault("_matrix", None)
+        if self.doc_freq is None:
+            indices = [row.indices for row in self.rows]
+            self.doc_freq = np.bincount(
+                np.concatenate(indices) if indices else np.zeros(0, dtype=np.int64), minlength=self.n_features
+            ).astype(np.int64)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def _count(self, text: str) -> sparse.csr_matrix:
+        """计算单个文本的词频向量"""
+        row = self.vectorizer.transform([text]).tocsr()
+        row.sum_duplicates()
+        return row
+
+    def append(self, text: str):
+        """追加一条经验文本，只更新该行涉及的文档频率"""
+        row = self._count(text)
+        self.rows.append(row)
+        self.doc_freq[row.indices] += 1
+        self.invalidate()
+
+    def rebuild(self, texts: Iterable[str]):
+        """按给定文本重建索引（删除经验后使用）"""
+        self.rows = []
+        self.doc_freq = np.zeros(self.n_features, dtype=np.int64)
+        for text in texts:
+            self.append(text)
+        self.invalidate()
+
+    def invalidate(self):
+        """经验变化后清除缓存的IDF和文档矩阵，下次查询时重建"""
+        self._idf = None
+        self._matrix = None
+
+    def idf(self) -> np.ndarray:
+        """平滑IDF，与TfidfVectorizer(smooth_idf=True)一致"""
+        if self._idf is None:
+            n_docs = len(self.rows)
+            self._idf = np.log((1 + n_docs) / (1 + self.doc_freq)) + 1.0
+        return self._idf
+
+    def _weight(self, counts: sparse.csr_matrix, idf: np.ndarray) -> sparse.csr_matrix:
+        """词频乘以IDF后做L2归一化"""
+        return normalize(sparse.csr_matrix(counts.multiply(idf)), norm="l2", copy=False)
+
+    def document_matrix(self) -> sparse.csr_matrix:
+        """归一化的文档-词矩阵，经验变化前一直复用"""
+        if self._matrix is None:
+            self._matrix = self._weight(sparse.vstack(self.rows, format="csr"), self.idf())
+        return self._matrix
+
+    def similarities(self, query: str) -> np.ndarray:
+        """计算查询与所有经验的余弦相似度"""
+        if not self.rows:
+            return np.zeros(0)
+        # 与拟合过的TF-IDF一样忽略索引中从未出现过的词
+        query_counts = self._count(query).multiply(self.doc_freq > 0)
+        query_vector = self._weight(query_counts, self.idf())
+        return np.asarray((self.document_matrix() @ query_vector.T).todense()).ravel()
+
+    def top_k(self, query: str, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        返回与查询最相似的k条经验
+
+        Returns:
+            Tuple[按相似度降序排列的索引, 对应的相似度]
+        """
+        similarities = self.similarities(query)
+        if k <= 0 or similarities.size == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        if k < similarities.size:
+            candidates = np.argpartition(-similarities, k - 1)[:k]
+        else:
+            candidates = np.arange(similarities.size)
+        order = candidates[np.argsort(-similarities[candidates], kind="stable")]
+        return order, similarities[order]